@@ -0,0 +1,193 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from estoqueplus import sincronizacao
+from estoqueplus.database import DatabaseManager
+
+# Teste de convergência da sincronização entre filiais: a matriz abre duas filiais a partir de cópias
+# do próprio banco (com nova_origem), as três vendem e repõem ao mesmo tempo, duas editam o mesmo
+# cadastro e os deltas circulam: matriz <-> filial A, filial B -> filial A -> matriz -> filial B, e
+# todo delta é importado duas vezes. No fim, os três bancos têm de ter os mesmos cadastros (com a
+# edição mais recente) e o mesmo livro-razão, com cada venda e entrada contada uma única vez; o
+# importador de cada filial tem de pular os eventos que ela mesma fez. Sai com código 1 se algo não bater.
+# python benchmarks/convergencia_sincronizacao.py --vendedores 4 --operacoes 200
+
+ESTOQUE_INICIAL = 100_000  # Nenhuma venda é recusada: cada ponta conta tudo o que gravou
+
+
+def _preparar(pasta, produtos):
+    matriz = DatabaseManager(os.path.join(pasta, "matriz.db"))
+    ids = [f"SYNC{i:03d}" for i in range(produtos)]
+    for id_p in ids:
+        matriz.cadastrar_mercadoria(id_p, f"Mercadoria {id_p}", 5.0, 8.0, ESTOQUE_INICIAL, "Sincronização")
+    matriz.registrar_venda(ids[0], 3)  # Histórico que as cópias já trazem
+    return matriz, ids
+
+
+def _abrir_filial(matriz, caminho):
+    # Filial nova aberta com uma cópia do banco da matriz
+    destino = sqlite3.connect(caminho)
+    matriz.conexao().backup(destino)
+    destino.close()
+    filial = DatabaseManager(caminho)
+    sincronizacao.nova_origem(filial)
+    return filial
+
+
+def _vender(bancos, ids, vendedores, operacoes, semente):
+    # Vários terminais por filial, todas as filiais ao mesmo tempo; devolve {banco: {id: (vendido, reposto)}}
+    contagem = {db.db_name: {id_p: [0, 0] for id_p in ids} for db in bancos}
+    trava = threading.Lock()
+
+    def terminal(db_manager, numero):
+        sorteio = random.Random(f"{semente}-{db_manager.db_name}-{numero}")
+        for _ in range(operacoes):
+            id_p = sorteio.choice(ids)
+            quantidade = sorteio.randint(1, 3)
+            if sorteio.random() < 0.2:
+                db_manager.adicionar_estoque(id_p, quantidade)
+                indice = 1
+            else:
+                db_manager.registrar_venda(id_p, quantidade)
+                indice = 0
+            with trava:
+                contagem[db_manager.db_name][id_p][indice] += quantidade
+        db_manager.fechar_conexao_da_thread()
+
+    threads = [threading.Thread(target=terminal, args=(db, n)) for db in bancos for n in range(vendedores)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return contagem
+
+
+def _trocar(origem, destino, pasta, falhas, proprios=0):
+    # Exporta o que o destino ainda não recebeu e importa duas vezes: a segunda não pode aplicar nada.
+    # proprios: quantos eventos do delta o próprio destino fez (o importador tem de pulá-los).
+    nome = os.path.join(pasta, f"{_nome(origem)}_para_{_nome(destino)}.jsonl.gz")
+    exportado = sincronizacao.exportar_delta(origem, nome, destino=sincronizacao.origem_local(destino))
+    primeira = sincronizacao.importar_delta(destino, nome)
+    segunda = sincronizacao.importar_delta(destino, nome)
+    rotulo = f"{_nome(origem)} -> {_nome(destino)}"
+    print(f"{rotulo}: {exportado.alteracoes} alterações, {primeira.aplicadas} aplicadas, "
+          f"{primeira.repetidas} repetidas, {primeira.superadas} superadas")
+    if primeira.repetidas < proprios:
+        falhas.append(f"{rotulo}: {primeira.repetidas} eventos pulados, mas {proprios} são do próprio destino")
+    if segunda.aplicadas or segunda.superadas or segunda.repetidas != exportado.alteracoes:
+        falhas.append(f"{rotulo}: reimportar o mesmo delta aplicou {segunda.aplicadas} e superou "
+                      f"{segunda.superadas} (esperado: todas as {exportado.alteracoes} repetidas)")
+    if primeira.estoque_negativo:
+        falhas.append(f"{rotulo}: estoque negativo em {', '.join(primeira.estoque_negativo)}")
+    return primeira
+
+
+def _nome(db_manager):
+    return os.path.splitext(os.path.basename(db_manager.db_name))[0]
+
+
+def _eventos_de(db_manager, origem):
+    # Quantas alterações registradas neste banco foram feitas pela origem dada
+    if origem == sincronizacao.origem_local(db_manager):
+        return db_manager.consultar_um("SELECT COUNT(*) FROM alteracoes WHERE origem IS NULL")[0]
+    return db_manager.consultar_um("SELECT COUNT(*) FROM alteracoes WHERE origem = ?", (origem,))[0]
+
+
+def _retrato(db_manager):
+    # Cadastro e totais de cada mercadoria, somas do livro-razão e número de eventos
+    mercadorias = db_manager.consultar('''
+        SELECT m.id, m.nome, m.preco_compra_centavos, m.preco_venda_centavos, m.descricao, m.qtd_comprada,
+               m.qtd_saida, m.valor_total_venda_centavos,
+               (SELECT COALESCE(SUM(quantidade), 0) FROM vendas WHERE produto_id = m.id),
+               (SELECT COALESCE(SUM(quantidade), 0) FROM entradas WHERE produto_id = m.id)
+        FROM mercadorias m ORDER BY m.id
+    ''')
+    eventos = db_manager.consultar_um("SELECT (SELECT COUNT(*) FROM vendas), (SELECT COUNT(*) FROM entradas)")
+    return mercadorias, eventos
+
+
+def executar(pasta, vendedores, operacoes, produtos, semente):
+    falhas = []
+    matriz, ids = _preparar(pasta, produtos)
+    filial_a = _abrir_filial(matriz, os.path.join(pasta, "filial_a.db"))
+    filial_b = _abrir_filial(matriz, os.path.join(pasta, "filial_b.db"))
+    bancos = (matriz, filial_a, filial_b)
+    origens = {db.db_name: sincronizacao.origem_local(db) for db in bancos}
+    if len(set(origens.values())) != len(bancos):
+        falhas.append("nova_origem não deu uma origem própria a cada cópia")
+
+    inicio = time.perf_counter()
+    contagem = _vender(bancos, ids, vendedores, operacoes, semente)
+    # Edição simultânea do mesmo cadastro: a da filial A é a mais recente e tem de valer em todos
+    disputada = ids[0]
+    matriz.cadastrar_mercadoria(disputada, "Editada na matriz", 6.0, 9.0, 0, "matriz")
+    time.sleep(0.01)  # O relógio das alterações tem milissegundos
+    filial_a.cadastrar_mercadoria(disputada, "Editada na filial A", 7.0, 11.0, 0, "filial A")
+
+    # B -> A -> matriz -> B: a matriz recebe os eventos de B repassados por A, e B recebe os
+    # próprios eventos de volta da matriz (tem de pular todos)
+    proprios_b = _eventos_de(filial_b, origens[filial_b.db_name])
+    _trocar(filial_b, filial_a, pasta, falhas)
+    _trocar(filial_a, matriz, pasta, falhas)
+    _trocar(matriz, filial_a, pasta, falhas, proprios=_eventos_de(matriz, origens[filial_a.db_name]))
+    _trocar(matriz, filial_b, pasta, falhas, proprios=proprios_b)
+    segundos = time.perf_counter() - inicio
+
+    # Esperado: estoque inicial + o que cada ponta repôs; 3 vendidas antes das cópias + o que cada ponta vendeu
+    esperado = {}
+    for id_p in ids:
+        vendido = sum(contagem[db.db_name][id_p][0] for db in bancos) + (3 if id_p == ids[0] else 0)
+        reposto = sum(contagem[db.db_name][id_p][1] for db in bancos)
+        esperado[id_p] = (ESTOQUE_INICIAL + reposto, vendido)
+    retratos = {db.db_name: _retrato(db) for db in bancos}
+    for db in bancos:
+        mercadorias, _eventos = retratos[db.db_name]
+        for id_p, nome, pc, pv, desc, qc, qs, _receita, soma_vendas, soma_entradas in mercadorias:
+            if (qc, qs) != esperado[id_p] or (soma_entradas, soma_vendas) != esperado[id_p]:
+                falhas.append(f"{_nome(db)} {id_p}: comprada {qc} (livro-razão {soma_entradas}), vendida {qs} "
+                              f"(livro-razão {soma_vendas}); esperado {esperado[id_p]}")
+            if id_p == disputada and (nome, pc, pv, desc) != ("Editada na filial A", 700, 1100, "filial A"):
+                falhas.append(f"{_nome(db)} {id_p}: ficou com o cadastro {(nome, pc, pv, desc)}, "
+                              f"não com a edição mais recente (filial A)")
+        if retratos[db.db_name] != retratos[matriz.db_name]:
+            falhas.append(f"{_nome(db)} não convergiu com a matriz")
+
+    for id_p in ids:
+        print(f"{id_p}: comprada {esperado[id_p][0]}, vendida {esperado[id_p][1]}")
+    total = len(bancos) * vendedores * operacoes
+    print(f"{len(bancos)} bancos, {vendedores} terminais cada, {total} vendas/entradas e 4 trocas de delta "
+          f"em {segundos:.1f} s")
+    for falha in falhas:
+        print("FALHA:", falha)
+    print("OK: os três bancos convergiram, sem eventos perdidos nem duplicados" if not falhas else
+          f"{len(falhas)} inconsistência(s)")
+    for db in bancos:
+        db.fechar()
+    return 1 if falhas else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convergência da sincronização por deltas entre três filiais.")
+    parser.add_argument("--vendedores", type=int, default=4, help="terminais vendendo em cada banco")
+    parser.add_argument("--operacoes", type=int, default=200, help="vendas/entradas por terminal")
+    parser.add_argument("--produtos", type=int, default=5)
+    parser.add_argument("--semente", type=int, default=1)
+    parser.add_argument("--pasta", help="onde criar os bancos e deltas (padrão: uma pasta temporária nova)")
+    args = parser.parse_args(argv)
+    if args.pasta:
+        os.makedirs(args.pasta, exist_ok=True)
+        return executar(args.pasta, args.vendedores, args.operacoes, args.produtos, args.semente)
+    with tempfile.TemporaryDirectory() as pasta:
+        return executar(pasta, args.vendedores, args.operacoes, args.produtos, args.semente)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
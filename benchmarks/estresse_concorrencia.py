@@ -0,0 +1,164 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from estoqueplus.cliente import ClienteEstoque
+from estoqueplus.database import DatabaseManager, EstoqueInsuficienteError
+
+# Teste de estresse: centenas de processos (terminais de venda) vendendo e repondo as mesmas poucas
+# mercadorias de um único stock_control.db ao mesmo tempo. No fim, o estoque de cada mercadoria tem
+# de bater com o que os vendedores contaram como gravado (nenhuma atualização perdida) e nenhuma
+# pode ter vendido mais do que tinha. Sai com código 1 se algo não bater.
+# python benchmarks/estresse_concorrencia.py --processos 300 --operacoes 40
+# Com --servidor, os processos são terminais finos de um "python -m estoqueplus servir" em localhost.
+
+
+def _vendedor(db_name, url, numero, ids, operacoes, semente, largada, resultados):
+    # Cada processo é um terminal: gerenciador e conexão próprios
+    db_manager = ClienteEstoque(url) if url else DatabaseManager(db_name)
+    sorteio = random.Random(semente)
+    vendido = dict.fromkeys(ids, 0)
+    reposto = dict.fromkeys(ids, 0)
+    recusadas = bloqueios = 0
+    try:
+        largada.wait(timeout=120)  # Todos começam juntos
+    except threading.BrokenBarrierError:
+        pass  # Algum processo morreu antes da largada: os demais seguem, e a conferência acusa a falta
+    for _ in range(operacoes):
+        id_p = sorteio.choice(ids)
+        quantidade = sorteio.randint(1, 3)
+        try:
+            # Um em cada dez terminais também repõe estoque
+            if numero % 10 == 0 and sorteio.random() < 0.3:
+                db_manager.adicionar_estoque(id_p, quantidade)
+                reposto[id_p] += quantidade
+            else:
+                db_manager.registrar_venda(id_p, quantidade)
+                vendido[id_p] += quantidade
+        except EstoqueInsuficienteError:
+            recusadas += 1
+        except (sqlite3.OperationalError, OSError):
+            bloqueios += 1  # Trava não obtida nem com as novas tentativas: nada foi gravado
+    db_manager.fechar()
+    resultados.put((vendido, reposto, recusadas, bloqueios))
+
+
+def _preparar(db_name, produtos, estoque):
+    db_manager = DatabaseManager(db_name)
+    ids = [f"ESTRESSE{i:03d}" for i in range(produtos)]
+    for id_p in ids:
+        db_manager.cadastrar_mercadoria(id_p, f"Mercadoria disputada {id_p}", 5.0, 8.0, estoque,
+                                        "Teste de concorrência")
+    db_manager.fechar()
+    return ids
+
+
+def _iniciar_servidor(db_name):
+    # Porta 0: o sistema escolhe uma livre, e o servidor a anuncia na primeira linha
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ambiente = dict(os.environ, PYTHONPATH=raiz)
+    ambiente.pop("ESTOQUEPLUS_TOKEN", None)
+    processo = subprocess.Popen([sys.executable, "-m", "estoqueplus", "--db", db_name, "servir", "--porta", "0"],
+                                stdout=subprocess.PIPE, text=True, env=ambiente)
+    linha = processo.stdout.readline()
+    if " em " not in linha:
+        processo.kill()
+        raise RuntimeError("o servidor não iniciou")
+    return processo, linha.rsplit(" em ", 1)[1].strip()
+
+
+def executar(db_name, processos, operacoes, produtos, estoque, servidor=False):
+    ids = _preparar(db_name, produtos, estoque)
+    processo_servidor, url = _iniciar_servidor(db_name) if servidor else (None, None)
+    contexto = multiprocessing.get_context("spawn")
+    largada = contexto.Barrier(processos)
+    resultados = contexto.Queue()
+    vendedores = [contexto.Process(target=_vendedor, args=(db_name, url, i, ids, operacoes, i, largada, resultados))
+                  for i in range(processos)]
+    for vendedor in vendedores:
+        vendedor.start()
+    inicio = time.perf_counter()
+    vendido = dict.fromkeys(ids, 0)
+    reposto = dict.fromkeys(ids, 0)
+    recusadas = bloqueios = 0
+    recebidos = 0
+    while recebidos < processos:
+        try:
+            v, r, rec, bloq = resultados.get(timeout=1)
+        except queue.Empty:
+            if any(vendedor.is_alive() for vendedor in vendedores):
+                continue
+            break  # Processos que morreram com exceção não mandam resultado
+        recebidos += 1
+        for id_p in ids:
+            vendido[id_p] += v[id_p]
+            reposto[id_p] += r[id_p]
+        recusadas += rec
+        bloqueios += bloq
+    segundos = time.perf_counter() - inicio
+    for vendedor in vendedores:
+        vendedor.join()
+    if processo_servidor is not None:
+        processo_servidor.terminate()
+        processo_servidor.wait()
+
+    db_manager = DatabaseManager(db_name)
+    falhas = []
+    if recebidos < processos:
+        # Sem a contagem deles não dá para conferir o estoque
+        falhas.append(f"{processos - recebidos} processo(s) terminaram com erro")
+    for id_p in ids:
+        qc, qs, qtd_vendas, soma_vendas, soma_entradas = db_manager.consultar_um('''
+            SELECT qtd_comprada, qtd_saida,
+                   (SELECT COUNT(*) FROM vendas WHERE produto_id = m.id),
+                   (SELECT COALESCE(SUM(quantidade), 0) FROM vendas WHERE produto_id = m.id),
+                   (SELECT COALESCE(SUM(quantidade), 0) FROM entradas WHERE produto_id = m.id)
+            FROM mercadorias m WHERE id = ?
+        ''', (id_p,))
+        if qs != vendido[id_p] or qs != soma_vendas:
+            falhas.append(f"{id_p}: qtd_saida {qs}, livro-razão {soma_vendas}, vendedores {vendido[id_p]}")
+        if qc != estoque + reposto[id_p] or qc != soma_entradas:
+            falhas.append(f"{id_p}: qtd_comprada {qc}, livro-razão {soma_entradas}, "
+                          f"esperado {estoque + reposto[id_p]}")
+        if qs > qc:
+            falhas.append(f"{id_p}: vendeu {qs} de {qc} (estoque negativo)")
+        print(f"{id_p}: comprada {qc}, vendida {qs} em {qtd_vendas} vendas, restante {qc - qs}")
+    total = processos * operacoes
+    print(f"{processos} processos{' via ' + url if url else ''}, {total} operações em {segundos:.1f} s ({total / segundos:.0f} op/s); "
+          f"{recusadas} vendas recusadas por falta de estoque, {bloqueios} desistências por trava")
+    for falha in falhas:
+        print("FALHA:", falha)
+    print("OK: nenhuma atualização perdida e nenhuma venda além do estoque" if not falhas else
+          f"{len(falhas)} inconsistência(s)")
+    return 1 if falhas else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estresse de vendas concorrentes em vários processos.")
+    parser.add_argument("--processos", type=int, default=200)
+    parser.add_argument("--operacoes", type=int, default=50, help="vendas/entradas por processo")
+    parser.add_argument("--produtos", type=int, default=5, help="mercadorias disputadas")
+    parser.add_argument("--estoque", type=int, default=2000, help="estoque inicial de cada mercadoria")
+    parser.add_argument("--db", help="banco a usar (padrão: um arquivo temporário novo)")
+    parser.add_argument("--servidor", action="store_true",
+                        help="vender por um servidor local (python -m estoqueplus servir) em vez do arquivo")
+    args = parser.parse_args(argv)
+    if args.db:
+        return executar(args.db, args.processos, args.operacoes, args.produtos, args.estoque, args.servidor)
+    with tempfile.TemporaryDirectory() as pasta:
+        return executar(os.path.join(pasta, "estresse.db"), args.processos, args.operacoes, args.produtos,
+                        args.estoque, args.servidor)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+try:
+    import resource  # Não existe no Windows: lá o pico de memória fica sem medir
+except ImportError:
+    resource = None
+
+# Suíte de benchmarks: cada caso roda num processo próprio (o pico de RSS é por processo)
+# sobre uma cópia do catálogo sintético, e o resultado sai em JSON para comparar versões.
+# python benchmarks/executar.py --tamanhos 1000 10000 --saida resultados.json
+
+CASOS = ("listar", "rolagem", "busca", "miniaturas", "venda", "caixa", "cadastro", "pdf", "grafico", "analise")
+TAMANHOS_PADRAO = (1000, 10000, 100000)
+PASTA_DADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados")
+TERMOS_BUSCA = ("cafe", "arroz camil", "pacote 1kg", "789000000012", "produto exemplo 99", "sabao ype lata")
+
+
+# === CONTAGEM DE CONSULTAS ===
+def _gerenciador_contado(db_name):
+    from estoqueplus.database import DatabaseManager
+
+    class DatabaseManagerContado(DatabaseManager):
+        # Conta cada instrução SQL executada nas conexões do gerenciador (gatilhos não contam)
+        consultas = 0
+
+        def conexao(self):
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = super().conexao()
+                conn.set_trace_callback(self._contar)
+            return conn
+
+        def _contar(self, sql):
+            if not sql.startswith("--"):
+                DatabaseManagerContado.consultas += 1
+
+    return DatabaseManagerContado(db_name)
+
+
+def _pico_rss_kb():
+    # No Linux, ru_maxrss herda o pico do processo pai através do fork/exec; VmHWM não
+    try:
+        with open("/proc/self/status") as status:
+            for linha in status:
+                if linha.startswith("VmHWM:"):
+                    return int(linha.split()[1])
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico // 1024 if sys.platform == "darwin" else pico  # macOS informa em bytes
+
+
+# === CASOS (rodam dentro do processo filho, com a pasta do catálogo como diretório atual) ===
+def _janela(db_manager):
+    import main
+    from PySide6.QtWidgets import QApplication, QMessageBox
+
+    class MensagensSilenciosas(QMessageBox):
+        # Sem diálogos modais: a suíte roda sem ninguém para clicar em "OK"
+        information = warning = staticmethod(lambda *args, **kwargs: QMessageBox.Ok)
+
+    app = QApplication.instance() or QApplication([])
+    main.QMessageBox = MensagensSilenciosas
+    janela = main.CadastroMercadoriasApp(db_manager)
+    janela.backup_timer.stop()
+    janela.show()
+    return app, janela, main
+
+
+def _pintar(janela):
+    # Fora do laço de eventos o layout e a pintura ficam adiados: força os dois, síncronos
+    janela.lista_view.doItemsLayout()
+    janela.lista_view.viewport().grab()
+
+
+def caso_listar(db_manager, repeticoes):
+    _app, janela, _main = _janela(db_manager)
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        janela.listar_mercadorias()
+        _pintar(janela)
+    return repeticoes, time.perf_counter() - inicio, {}
+
+
+def caso_rolagem(db_manager, repeticoes):
+    _app, janela, _main = _janela(db_manager)
+    model = janela.lista_view.model()
+    inicio = time.perf_counter()
+    lotes = 0
+    while lotes < repeticoes and model.canFetchMore():
+        model.fetchMore()
+        janela.lista_view.scrollToBottom()
+        _pintar(janela)
+        lotes += 1
+    return lotes, time.perf_counter() - inicio, {"linhas_carregadas": model.rowCount()}
+
+
+def caso_busca(db_manager, repeticoes):
+    _app, janela, _main = _janela(db_manager)
+    model = janela.lista_view.model()
+    resultados = {}
+    inicio = time.perf_counter()
+    for i in range(repeticoes):
+        termo = TERMOS_BUSCA[i % len(TERMOS_BUSCA)]
+        janela.busca_input.setText(termo)
+        janela.listar_mercadorias()
+        _pintar(janela)
+        resultados[termo] = model.rowCount()
+    return repeticoes, time.perf_counter() - inicio, {"resultados_por_termo": resultados}
+
+
+def caso_miniaturas(db_manager, repeticoes):
+    # Miniaturas das linhas visíveis a partir do cache em disco vazio (decodificação real)
+    shutil.rmtree(os.path.join("cache", "miniaturas"), ignore_errors=True)
+    _app, janela, main = _janela(db_manager)
+    cache = main.CacheMiniaturas.instancia()
+    janela.lista_view.resize(janela.lista_view.width(), 112 * repeticoes)
+    inicio = time.perf_counter()
+    _pintar(janela)
+    pedidas = len(cache.pendentes)
+    cache.pool.waitForDone()
+    return pedidas, time.perf_counter() - inicio, {}
+
+
+def caso_venda(db_manager, repeticoes):
+    from PySide6.QtWidgets import QLineEdit
+
+    _app, janela, _main = _janela(db_manager)
+    ids = [linha[0] for linha in db_manager.consultar(
+        "SELECT id FROM mercadorias WHERE qtd_comprada - qtd_saida > ? ORDER BY random() LIMIT ?",
+        (repeticoes, repeticoes))]
+    campo = QLineEdit()
+    inicio = time.perf_counter()
+    for id_p in ids:
+        campo.setText("1")
+        janela.registrar_venda(id_p, campo)
+    janela.escritor.aguardar()  # As vendas são gravadas pela fila de escrita
+    return len(ids), time.perf_counter() - inicio, {}
+
+
+def caso_caixa(db_manager, repeticoes):
+    # Leituras no modo caixa, em vendas de 20 itens, a partir do índice já carregado
+    app, janela, _main = _janela(db_manager)
+    ids = [linha[0] for linha in db_manager.consultar(
+        "SELECT id FROM mercadorias WHERE qtd_comprada - qtd_saida > ? ORDER BY random() LIMIT ?",
+        (repeticoes, repeticoes))]
+    caixa = janela.caixa
+    janela.abas.setCurrentWidget(caixa)
+    caixa.tarefa_pre_carga.wait()
+    app.processEvents()  # Entrega o índice pré-carregado
+    inicio = time.perf_counter()
+    for i, id_p in enumerate(ids, 1):
+        caixa.codigo_input.setText(id_p)
+        caixa.ler_codigo()
+        if i % 20 == 0 or i == len(ids):
+            caixa.finalizar()
+    janela.escritor.aguardar()
+    return len(ids), time.perf_counter() - inicio, {"itens_no_indice": len(janela.indice_caixa.mercadorias)}
+
+
+def caso_cadastro(db_manager, repeticoes):
+    _app, janela, _main = _janela(db_manager)
+    imagens = sorted(os.listdir("originais"))
+    sorteio = random.Random(7)
+    inicio = time.perf_counter()
+    for i in range(repeticoes):
+        janela.id_input.setText(f"BENCH{i:06d}")
+        janela.nome_input.setText(f"Mercadoria de benchmark {i}")
+        janela.descricao_input.setText("Cadastrada pela suíte de benchmarks")
+        janela.preco_compra_input.setText("10.5")
+        janela.preco_venda_input.setText("15.9")
+        janela.qtd_comprada_input.setText("24")
+        janela.imagem_path = os.path.join("originais", sorteio.choice(imagens))
+        janela.cadastrar_mercadoria()
+    janela.escritor.aguardar()
+    return repeticoes, time.perf_counter() - inicio, {}
+
+
+def caso_pdf(db_manager, repeticoes):
+    from estoqueplus.relatorios import gerar_relatorio_pdf
+
+    inicio = time.perf_counter()
+    caminho = gerar_relatorio_pdf(db_manager)
+    return 1, time.perf_counter() - inicio, {"tamanho_bytes": os.path.getsize(caminho)}
+
+
+def caso_grafico(db_manager, repeticoes):
+    from estoqueplus.graficos import PASTA_GRAFICOS, gerar_grafico_lucro
+
+    shutil.rmtree(PASTA_GRAFICOS, ignore_errors=True)
+    inicio = time.perf_counter()
+    gerar_grafico_lucro(db_manager)
+    segundos = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    gerar_grafico_lucro(db_manager)
+    return 1, segundos, {"em_cache_ms": (time.perf_counter() - inicio) * 1000}
+
+
+def caso_analise(db_manager, repeticoes):
+    from estoqueplus.analise import analisar_estoque
+
+    inicio = time.perf_counter()
+    analisar_estoque(db_manager)
+    segundos = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    analisar_estoque(db_manager)
+    return 1, segundos, {"em_cache_ms": (time.perf_counter() - inicio) * 1000}
+
+
+REPETICOES = {"listar": 20, "rolagem": 50, "busca": 30, "miniaturas": 20, "venda": 200, "caixa": 500,
+              "cadastro": 100, "pdf": 1, "grafico": 1, "analise": 1}
+
+
+def executar_caso(caso, pasta, db_name):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    os.chdir(pasta)
+    db_manager = _gerenciador_contado(db_name)
+    type(db_manager).consultas = 0
+    operacoes, segundos, extras = globals()[f"caso_{caso}"](db_manager, REPETICOES[caso])
+    return {
+        "caso": caso,
+        "operacoes": operacoes,
+        "segundos": round(segundos, 6),
+        "ms_por_operacao": round(segundos * 1000 / operacoes, 3) if operacoes else None,
+        "consultas": type(db_manager).consultas,
+        "pico_rss_kb": _pico_rss_kb(),
+        "extras": extras,
+    }
+
+
+# === ORQUESTRAÇÃO ===
+def _preparar(tamanho, regenerar):
+    from benchmarks.gerar_catalogo import gerar_catalogo
+
+    pasta = os.path.join(PASTA_DADOS, str(tamanho))
+    original = os.path.join(pasta, "stock_control.db")
+    if regenerar or not os.path.exists(original):
+        inicio = time.perf_counter()
+        gerar_catalogo(pasta, tamanho)
+        print(f"catálogo de {tamanho} gerado em {time.perf_counter() - inicio:.1f} s", file=sys.stderr)
+    return pasta, original
+
+
+def _versao():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do EstoquePlus (saída em JSON).")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO,
+                        help="tamanhos do catálogo (ex.: 1000 10000 100000 1000000)")
+    parser.add_argument("--casos", nargs="+", choices=CASOS, default=CASOS)
+    parser.add_argument("--saida", help="arquivo JSON de resultados (padrão: saída padrão)")
+    parser.add_argument("--regenerar", action="store_true", help="gera os catálogos de novo")
+    # Uso interno: roda um único caso no processo atual e imprime o resultado
+    parser.add_argument("--caso", choices=CASOS, help=argparse.SUPPRESS)
+    parser.add_argument("--pasta", help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.caso:
+        print(json.dumps(executar_caso(args.caso, args.pasta, args.db)), flush=True)
+        # Sai sem a finalização do interpretador: o PySide6 às vezes falha ao coletar
+        # objetos Qt no encerramento, e o resultado já foi entregue
+        os._exit(0)
+
+    resultados = []
+    for tamanho in args.tamanhos:
+        pasta, original = _preparar(tamanho, args.regenerar)
+        for caso in args.casos:
+            # Cada caso parte do mesmo catálogo: vendas e cadastros de um não afetam o outro
+            copia = os.path.join(pasta, "execucao.db")
+            for sufixo in ("", "-wal", "-shm"):
+                if os.path.exists(copia + sufixo):
+                    os.remove(copia + sufixo)
+            shutil.copyfile(original, copia)
+            processo = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--caso", caso, "--pasta", pasta, "--db", copia],
+                capture_output=True, text=True, cwd=RAIZ)
+            if processo.returncode != 0:
+                print(processo.stderr, file=sys.stderr)
+                resultado = {"caso": caso, "erro": processo.stderr.strip().splitlines()[-1:]}
+            else:
+                resultado = json.loads(processo.stdout.strip().splitlines()[-1])
+            resultado["tamanho"] = tamanho
+            resultados.append(resultado)
+            print(f"{tamanho:>8} {caso:<11} {resultado.get('ms_por_operacao')} ms/op, "
+                  f"{resultado.get('consultas')} consultas, pico {resultado.get('pico_rss_kb')} KB",
+                  file=sys.stderr)
+
+    relatorio = {
+        "versao": _versao(),
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "plataforma": platform.platform(),
+        "resultados": resultados,
+    }
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+    else:
+        json.dump(relatorio, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
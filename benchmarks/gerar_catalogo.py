@@ -0,0 +1,130 @@
+import argparse
+import os
+import random
+import struct
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from estoqueplus.database import DatabaseManager
+from estoqueplus.imagens import PASTA_PRODUTOS, guardar_imagem
+
+# Gera um stock_control.db descartável com N mercadorias, histórico de vendas e imagens de exemplo.
+# python benchmarks/gerar_catalogo.py 100000 --pasta benchmarks/dados/100000
+
+PALAVRAS = ("Arroz", "Feijão", "Café", "Açúcar", "Macarrão", "Biscoito", "Óleo", "Leite", "Sabão",
+            "Detergente", "Farinha", "Molho", "Sardinha", "Achocolatado", "Margarina", "Queijo")
+MARCAS = ("Giassi", "Sadia", "Maratá", "Isabela", "Fontini", "Camil", "Tio João", "Nestlé", "Ypê")
+EMBALAGENS = ("Pacote 1kg", "Pacote 500g", "Caixa 12un", "Lata 350ml", "Garrafa 900ml", "Sachê 250g")
+LOTE_INSERCAO = 20000
+
+
+def _png(caminho, largura, altura, cor):
+    # PNG RGB mínimo sem dependências: degradê horizontal na cor dada, linhas iguais
+    linha = b"\x00" + bytes(
+        int(c * (0.35 + 0.65 * x / largura)) for x in range(largura) for c in cor
+    )
+    dados = zlib.compress(linha * altura, 6)
+
+    def bloco(tipo, conteudo):
+        return (struct.pack(">I", len(conteudo)) + tipo + conteudo
+                + struct.pack(">I", zlib.crc32(tipo + conteudo) & 0xFFFFFFFF))
+
+    with open(caminho, "wb") as arquivo:
+        arquivo.write(b"\x89PNG\r\n\x1a\n")
+        arquivo.write(bloco(b"IHDR", struct.pack(">IIBBBBB", largura, altura, 8, 2, 0, 0, 0)))
+        arquivo.write(bloco(b"IDAT", dados))
+        arquivo.write(bloco(b"IEND", b""))
+
+
+def gerar_imagens(pasta, quantidade, sorteio, largura=1200, altura=900):
+    # Fotos de produto costumam ser grandes; decodificá-las é o custo que interessa medir
+    os.makedirs(pasta, exist_ok=True)
+    caminhos = []
+    for i in range(quantidade):
+        caminho = os.path.join(pasta, f"exemplo_{i:05d}.png")
+        if not os.path.exists(caminho):
+            _png(caminho, largura, altura, [sorteio.randrange(64, 256) for _ in range(3)])
+        caminhos.append(caminho)
+    return caminhos
+
+
+def gerar_catalogo(pasta, produtos, vendas_por_produto=3, dias=365, imagens=200, semente=42):
+    os.makedirs(pasta, exist_ok=True)
+    caminho_db = os.path.join(pasta, DatabaseManager.DB_NAME)
+    for sufixo in ("", "-wal", "-shm"):
+        if os.path.exists(caminho_db + sufixo):
+            os.remove(caminho_db + sufixo)
+
+    sorteio = random.Random(semente)
+    # As originais ficam em originais/ (o caso "cadastro" as escolhe) e vão para o armazém por hash.
+    # Caminhos relativos, como o sistema grava: os benchmarks rodam com a pasta como diretório atual.
+    armazem = os.path.join(pasta, PASTA_PRODUTOS)
+    imagens_guardadas = []
+    for original in gerar_imagens(os.path.join(pasta, "originais"), imagens, sorteio):
+        digest, caminho = guardar_imagem(original, armazem)
+        imagens_guardadas.append((os.path.relpath(caminho, pasta), digest))
+
+    db_manager = DatabaseManager(caminho_db)
+    with db_manager.transacao() as conn:
+        for inicio in range(0, produtos, LOTE_INSERCAO):
+            lote = []
+            for i in range(inicio, min(produtos, inicio + LOTE_INSERCAO)):
+                nome = f"{sorteio.choice(PALAVRAS)} {sorteio.choice(MARCAS)} {sorteio.choice(EMBALAGENS)} {i}"
+                pc = sorteio.randint(100, 8000)  # Centavos, como o banco guarda
+                pv = round(pc * sorteio.uniform(1.05, 1.8))
+                imagem = imagens_guardadas[i % len(imagens_guardadas)] if imagens_guardadas else ("", None)
+                lote.append((f"{7890000000000 + i}", nome, pc, pv, f"Produto de exemplo número {i}") + imagem)
+            conn.executemany('''
+                INSERT INTO mercadorias (id, nome, preco_compra_centavos, preco_venda_centavos, qtd_comprada,
+                                         qtd_saida, descricao, valor_total_compra_centavos,
+                                         valor_total_venda_centavos, imagem_path, imagem_hash)
+                VALUES (?, ?, ?, ?, 0, 0, ?, 0, 0, ?, ?)
+            ''', lote)
+
+        # Estoque inicial: uma entrada por mercadoria (os gatilhos atualizam os totais)
+        conn.execute('''
+            INSERT INTO entradas (produto_id, quantidade, custo_unitario_centavos, valor_total_centavos, data_hora)
+            SELECT id, 1000, preco_compra_centavos, preco_compra_centavos * 1000, datetime('now', 'localtime', ?)
+            FROM mercadorias
+        ''', (f"-{dias + 1} days",))
+
+        total_vendas = produtos * vendas_por_produto
+        for inicio in range(0, total_vendas, LOTE_INSERCAO):
+            lote = []
+            for _ in range(inicio, min(total_vendas, inicio + LOTE_INSERCAO)):
+                lote.append((f"{7890000000000 + sorteio.randrange(produtos)}", sorteio.randint(1, 5),
+                             f"-{sorteio.randrange(dias * 86400)} seconds"))
+            conn.executemany('''
+                INSERT INTO vendas (produto_id, quantidade, preco_unitario_centavos, custo_unitario_centavos,
+                                    valor_total_centavos, data_hora)
+                SELECT id, ?1, preco_venda_centavos, preco_compra_centavos, preco_venda_centavos * ?1,
+                       datetime('now', 'localtime', ?2)
+                FROM mercadorias WHERE id = ?3
+            ''', [(q, deslocamento, id_p) for id_p, q, deslocamento in lote])
+    db_manager.executar("PRAGMA wal_checkpoint(TRUNCATE)")
+    db_manager.executar("ANALYZE")
+    db_manager.fechar()
+    return caminho_db
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera um catálogo sintético para os benchmarks.")
+    parser.add_argument("produtos", type=int)
+    parser.add_argument("--pasta", help="pasta de destino (padrão: benchmarks/dados/<produtos>)")
+    parser.add_argument("--vendas-por-produto", type=int, default=3)
+    parser.add_argument("--dias", type=int, default=365, help="dias de histórico de vendas")
+    parser.add_argument("--imagens", type=int, default=200, help="imagens distintas, repetidas entre os produtos")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    pasta = args.pasta or os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados", str(args.produtos))
+    inicio = time.perf_counter()
+    caminho = gerar_catalogo(pasta, args.produtos, args.vendas_por_produto, args.dias, args.imagens, args.semente)
+    print(f"{caminho}: {args.produtos} mercadorias em {time.perf_counter() - inicio:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
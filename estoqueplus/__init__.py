@@ -0,0 +1,5 @@
+# Núcleo do EstoquePlus sem dependência de interface gráfica
+from estoqueplus.database import (
+    DatabaseManager, EstoqueInsuficienteError, ProdutoNaoEncontradoError
+)
+from estoqueplus.mercadorias import IndiceCaixa, Mercadoria, RepositorioMercadorias
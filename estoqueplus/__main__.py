@@ -0,0 +1,5 @@
+import sys
+
+from estoqueplus.cli import main
+
+sys.exit(main())
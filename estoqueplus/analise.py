@@ -0,0 +1,185 @@
+from collections import namedtuple
+
+# === ANÁLISE DO ESTOQUE: VALOR, MARGENS, CURVA ABC, ESCOAMENTO E GIRO ===
+# Tudo sai das colunas de mercadorias que os gatilhos do livro-razão mantêm (qtd_comprada, qtd_saida,
+# valor_total_venda_centavos): uma leitura do catálogo, sem percorrer as vendas, então o custo cresce
+# com o número de produtos e não com o tamanho do histórico. Com NumPy as colunas viram vetores; sem
+# ele (é opcional), as mesmas contas rodam como agregações no SQLite. O resultado fica em memória até
+# versao_dados() mudar.
+
+FAIXAS_MARGEM = (0, 10, 20, 30, 50)  # Limites (%) das faixas de margem sobre o preço de venda
+LIMITES_ABC = (80, 95)               # % acumulado da receita que fecha as classes A e B; o resto é C
+CLASSES_ABC = "ABC"
+LINHAS_POR_LEITURA = 50_000
+
+Analise = namedtuple("Analise", "versao produtos unidades valor_custo valor_venda receita custo_vendido "
+                                "margem_media faixas_margem curva_abc escoamento giro cobertura_dias "
+                                "encalhados valor_encalhado dias")
+
+_ultimas = {}  # Arquivo do banco -> Analise da versão mais recente calculada
+
+
+class AnaliseCancelada(Exception):
+    pass
+
+
+def rotulos_faixas():
+    rotulos = [f"abaixo de {FAIXAS_MARGEM[0]}%"]
+    rotulos += [f"{de}% a {ate}%" for de, ate in zip(FAIXAS_MARGEM, FAIXAS_MARGEM[1:])]
+    return rotulos + [f"{FAIXAS_MARGEM[-1]}% ou mais"]
+
+
+# === CÁLCULO VETORIZADO (NUMPY) ===
+def _colunas_numpy(db_manager, np, cancelar):
+    # (preço de compra, preço de venda, comprada, vendida, receita), todas em centavos/unidades inteiras.
+    # Lidas em blocos: o catálogo inteiro nunca vira uma lista de tuplas Python de uma vez.
+    cursor = db_manager.conexao().execute('''
+        SELECT COALESCE(preco_compra_centavos, 0), COALESCE(preco_venda_centavos, 0), COALESCE(qtd_comprada, 0),
+               COALESCE(qtd_saida, 0), COALESCE(valor_total_venda_centavos, 0)
+        FROM mercadorias
+    ''')
+    blocos = []
+    while True:
+        if cancelar and cancelar():
+            cursor.close()
+            raise AnaliseCancelada()
+        lote = cursor.fetchmany(LINHAS_POR_LEITURA)
+        if not lote:
+            break
+        blocos.append(np.array(lote, dtype=np.int64))
+    tabela = np.concatenate(blocos) if blocos else np.zeros((0, 5), dtype=np.int64)
+    return tabela.T
+
+
+def _calcular_numpy(db_manager, np, cancelar):
+    pc, pv, comprada, vendida, receita = _colunas_numpy(db_manager, np, cancelar)
+    estoque = np.maximum(comprada - vendida, 0)
+    custo_estoque = estoque * pc
+
+    com_preco = pv > 0
+    margens = (pv[com_preco] - pc[com_preco]) * 100 / pv[com_preco]
+    faixas = np.bincount(np.searchsorted(FAIXAS_MARGEM, margens, side="right"), minlength=len(FAIXAS_MARGEM) + 1)
+
+    # Curva ABC: da maior receita para a menor, cada produto entra na classe em que a receita acumulada
+    # antes dele ainda estava (o primeiro é sempre A; sem receita nenhuma, todos são C). A ordenação
+    # estável mantém a ordem do rowid nos empates, a mesma da versão em SQL.
+    ordem = np.argsort(-receita, kind="stable")
+    receita_ordenada = receita[ordem]
+    total = int(receita.sum())
+    anterior = np.cumsum(receita_ordenada) - receita_ordenada
+    classes = np.searchsorted(np.array(LIMITES_ABC) * total, anterior * 100, side="right")
+    produtos_abc = np.bincount(classes, minlength=len(CLASSES_ABC))
+    receita_abc = np.bincount(classes, weights=receita_ordenada, minlength=len(CLASSES_ABC))
+
+    encalhados = (estoque > 0) & (vendida == 0)
+    return {
+        "produtos": len(pc), "unidades": int(estoque.sum()),
+        "valor_custo": int(custo_estoque.sum()), "valor_venda": int((estoque * pv).sum()),
+        "receita": total, "custo_vendido": int((vendida * pc).sum()),
+        "comprada": int(comprada.sum()), "vendida": int(vendida.sum()),
+        "faixas": [int(n) for n in faixas],
+        "abc": [(int(n), int(r)) for n, r in zip(produtos_abc, receita_abc)],
+        "encalhados": int(encalhados.sum()), "valor_encalhado": int(custo_estoque[encalhados].sum()),
+    }
+
+
+# === CÁLCULO POR AGREGAÇÕES NO SQLITE (SEM NUMPY) ===
+def _calcular_sql(db_manager, cancelar):
+    margem = "(preco_venda_centavos - preco_compra_centavos) * 100.0 / preco_venda_centavos"
+    faixa = "CASE " + " ".join(f"WHEN {margem} < {limite} THEN {i}" for i, limite in enumerate(FAIXAS_MARGEM))
+    faixa += f" ELSE {len(FAIXAS_MARGEM)} END"
+    (produtos, unidades, valor_custo, valor_venda, receita, custo_vendido, comprada, vendida, encalhados,
+     valor_encalhado) = db_manager.consultar_um('''
+        SELECT COUNT(*), TOTAL(estoque), TOTAL(estoque * pc), TOTAL(estoque * pv), TOTAL(receita),
+               TOTAL(vendida * pc), TOTAL(comprada), TOTAL(vendida),
+               TOTAL(estoque > 0 AND vendida = 0), TOTAL(CASE WHEN vendida = 0 THEN estoque * pc END)
+        FROM (
+            SELECT COALESCE(preco_compra_centavos, 0) AS pc, COALESCE(preco_venda_centavos, 0) AS pv,
+                   COALESCE(qtd_comprada, 0) AS comprada, COALESCE(qtd_saida, 0) AS vendida,
+                   COALESCE(valor_total_venda_centavos, 0) AS receita, MAX(restante, 0) AS estoque
+            FROM mercadorias
+        )
+    ''')
+    if cancelar and cancelar():
+        raise AnaliseCancelada()
+    faixas = [0] * (len(FAIXAS_MARGEM) + 1)
+    for indice, quantidade in db_manager.consultar(
+            f"SELECT {faixa}, COUNT(*) FROM mercadorias WHERE preco_venda_centavos > 0 GROUP BY 1"):
+        faixas[indice] = quantidade
+    if cancelar and cancelar():
+        raise AnaliseCancelada()
+    classe = "CASE " + " ".join(f"WHEN (acumulada - receita) * 100 < {limite} * total THEN {i}"
+                                for i, limite in enumerate(LIMITES_ABC)) + f" ELSE {len(LIMITES_ABC)} END"
+    abc = [(0, 0)] * len(CLASSES_ABC)
+    for indice, quantidade, soma in db_manager.consultar(f'''
+        SELECT {classe}, COUNT(*), TOTAL(receita) FROM (
+            SELECT receita, SUM(receita) OVER (ORDER BY receita DESC, rowid ROWS UNBOUNDED PRECEDING) AS acumulada,
+                   SUM(receita) OVER () AS total
+            FROM (SELECT rowid, COALESCE(valor_total_venda_centavos, 0) AS receita FROM mercadorias)
+        ) GROUP BY 1
+    '''):
+        abc[indice] = (quantidade, int(soma))
+    return {
+        "produtos": produtos, "unidades": int(unidades), "valor_custo": int(valor_custo),
+        "valor_venda": int(valor_venda), "receita": int(receita), "custo_vendido": int(custo_vendido),
+        "comprada": int(comprada), "vendida": int(vendida), "faixas": faixas, "abc": abc,
+        "encalhados": int(encalhados), "valor_encalhado": int(valor_encalhado),
+    }
+
+
+# === RESULTADO (EM CACHE POR VERSÃO DOS DADOS) ===
+def analise_em_cache(db_manager):
+    # A análise calculada se o banco não mudou desde então; senão None
+    analise = _ultimas.get(db_manager.db_name)
+    return analise if analise is not None and analise.versao == db_manager.versao_dados() else None
+
+
+def analisar_estoque(db_manager, progresso=None, cancelar=None):
+    # Lida antes dos dados: uma gravação no meio do cálculo só faz a próxima chamada recalcular
+    versao = db_manager.versao_dados()
+    analise = _ultimas.get(db_manager.db_name)
+    if analise is not None and analise.versao == versao:
+        return analise
+
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    if numpy is not None:
+        t = _calcular_numpy(db_manager, numpy, cancelar)
+    else:
+        t = _calcular_sql(db_manager, cancelar)
+    if progresso:
+        progresso(80)
+
+    # Dias desde a primeira venda registrada: o giro e a cobertura usam o custo vendido por dia
+    # (ao preço de compra atual, como o lucro da lista) e o estoque atual no lugar do estoque médio
+    dias = db_manager.consultar_um(
+        "SELECT julianday('now', 'localtime') - julianday(MIN(dia)) FROM resumo_vendas_diario")[0]
+    dias = max(1, round(dias)) if dias is not None else None
+    custo_por_dia = t["custo_vendido"] / dias if dias else 0
+    receita = t["receita"]
+
+    analise = Analise(
+        versao=versao,
+        produtos=t["produtos"],
+        unidades=t["unidades"],
+        valor_custo=t["valor_custo"] / 100,
+        valor_venda=t["valor_venda"] / 100,
+        receita=receita / 100,
+        custo_vendido=t["custo_vendido"] / 100,
+        margem_media=(receita - t["custo_vendido"]) * 100 / receita if receita else None,
+        faixas_margem=list(zip(rotulos_faixas(), t["faixas"])),
+        curva_abc=[(classe, produtos, soma / 100, soma * 100 / receita if receita else 0.0)
+                   for classe, (produtos, soma) in zip(CLASSES_ABC, t["abc"])],
+        escoamento=t["vendida"] * 100 / t["comprada"] if t["comprada"] else None,
+        giro=custo_por_dia * 365 / t["valor_custo"] if custo_por_dia and t["valor_custo"] else None,
+        cobertura_dias=t["valor_custo"] / custo_por_dia if custo_por_dia else None,
+        encalhados=t["encalhados"],
+        valor_encalhado=t["valor_encalhado"] / 100,
+        dias=dias,
+    )
+    _ultimas[db_manager.db_name] = analise
+    if progresso:
+        progresso(100)
+    return analise
@@ -0,0 +1,133 @@
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+from collections import namedtuple
+from datetime import datetime
+
+PASTA_BACKUPS = "backups"
+PAGINAS_POR_PASSO = 256   # Páginas copiadas por passo; entre passos o banco fica livre
+PAUSA_ENTRE_PASSOS = 0.005
+MANTER_DIARIOS = 7
+MANTER_SEMANAIS = 4
+
+ResultadoBackup = namedtuple("ResultadoBackup", "caminho tamanho removidos")
+
+_PADRAO_NOME = re.compile(r"^backup_(\d{8}_\d{4}(?:\d{2})?)\.db(\.gz)?$")
+
+
+class BackupCorrompidoError(Exception):
+    pass
+
+
+class BackupCancelado(Exception):
+    pass
+
+
+# === BACKUP ONLINE PELA API DE BACKUP DO SQLITE ===
+def realizar_backup(db_name, pasta=PASTA_BACKUPS, comprimir=True, manter_diarios=MANTER_DIARIOS,
+                    manter_semanais=MANTER_SEMANAIS, progresso=None, cancelar=None):
+    # Cópia consistente mesmo com o banco em uso (inclui o que ainda está no -wal),
+    # feita em passos para não travar quem estiver gravando.
+    os.makedirs(pasta, exist_ok=True)
+    carimbo = datetime.now().strftime("%Y%m%d_%H%M%S")
+    temporario = os.path.join(pasta, f".backup_{carimbo}.tmp")
+
+    def andamento(status, restantes, total):
+        if cancelar and cancelar():
+            raise BackupCancelado()
+        if progresso and total:
+            progresso(int((total - restantes) * 90 / total))
+
+    origem = sqlite3.connect(db_name)
+    destino = sqlite3.connect(temporario)
+    try:
+        origem.backup(destino, pages=PAGINAS_POR_PASSO, progress=andamento, sleep=PAUSA_ENTRE_PASSOS)
+        # A cópia não depende de arquivo -wal para ser restaurada
+        destino.execute("PRAGMA journal_mode = DELETE")
+        verificacao = destino.execute("PRAGMA integrity_check").fetchone()[0]
+        if verificacao != "ok":
+            raise BackupCorrompidoError(verificacao)
+    except BaseException:
+        destino.close()
+        os.remove(temporario)
+        raise
+    finally:
+        origem.close()
+    destino.close()
+
+    final = os.path.join(pasta, f"backup_{carimbo}.db")
+    if comprimir:
+        final += ".gz"
+        with open(temporario, "rb") as entrada, gzip.open(final + ".tmp", "wb", compresslevel=6) as saida:
+            shutil.copyfileobj(entrada, saida, 1024 * 1024)
+        os.replace(final + ".tmp", final)
+        os.remove(temporario)
+    else:
+        os.replace(temporario, final)
+    if progresso:
+        progresso(95)
+
+    removidos = aplicar_retencao(pasta, manter_diarios, manter_semanais)
+    if progresso:
+        progresso(100)
+    return ResultadoBackup(final, os.path.getsize(final), removidos)
+
+
+def listar_backups(pasta=PASTA_BACKUPS):
+    # [(datetime, caminho)] do mais recente para o mais antigo
+    backups = []
+    if not os.path.isdir(pasta):
+        return backups
+    for nome in os.listdir(pasta):
+        encontrado = _PADRAO_NOME.match(nome)
+        if not encontrado:
+            continue
+        carimbo = encontrado.group(1)
+        formato = "%Y%m%d_%H%M%S" if len(carimbo) == 15 else "%Y%m%d_%H%M"
+        backups.append((datetime.strptime(carimbo, formato), os.path.join(pasta, nome)))
+    backups.sort(reverse=True)
+    return backups
+
+
+def aplicar_retencao(pasta=PASTA_BACKUPS, manter_diarios=MANTER_DIARIOS, manter_semanais=MANTER_SEMANAIS):
+    # Mantém o backup mais recente de cada um dos últimos N dias e de cada uma das
+    # últimas M semanas; o restante é apagado. Devolve os caminhos removidos.
+    dias, semanas, manter = set(), set(), set()
+    for quando, caminho in listar_backups(pasta):
+        dia = quando.date()
+        semana = quando.isocalendar()[:2]
+        if dia not in dias and len(dias) < manter_diarios:
+            dias.add(dia)
+            manter.add(caminho)
+        if semana not in semanas and len(semanas) < manter_semanais:
+            semanas.add(semana)
+            manter.add(caminho)
+
+    removidos = []
+    for _, caminho in listar_backups(pasta):
+        if caminho not in manter:
+            os.remove(caminho)
+            removidos.append(caminho)
+    return removidos
+
+
+def ultimo_backup(pasta=PASTA_BACKUPS):
+    backups = listar_backups(pasta)
+    return backups[0][0] if backups else None
+
+
+def backup_vencido(intervalo_horas, pasta=PASTA_BACKUPS):
+    ultimo = ultimo_backup(pasta)
+    return ultimo is None or (datetime.now() - ultimo).total_seconds() >= intervalo_horas * 3600
+
+
+def restaurar_backup(caminho_backup, destino):
+    # Descompacta (se preciso) para um arquivo novo; nunca sobrescreve o banco em uso
+    if os.path.exists(destino):
+        raise FileExistsError(destino)
+    abrir = gzip.open if caminho_backup.endswith(".gz") else open
+    with abrir(caminho_backup, "rb") as entrada, open(destino, "wb") as saida:
+        shutil.copyfileobj(entrada, saida, 1024 * 1024)
+    return destino
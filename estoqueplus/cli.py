@@ -0,0 +1,354 @@
+import argparse
+import csv
+import json
+import os
+import shutil
+import sqlite3
+import sys
+
+from estoqueplus import desempenho
+from estoqueplus.database import DatabaseManager, EstoqueInsuficienteError, ProdutoNaoEncontradoError
+from estoqueplus.mercadorias import RepositorioMercadorias
+
+# Interface de linha de comando: nada aqui importa PySide6, então roda em servidores e no cron.
+# python -m estoqueplus [--db ARQUIVO] <comando> ...
+
+
+class LinhaInvalida(Exception):
+    pass
+
+
+# === LEITURA DOS ARQUIVOS DE LOTE ===
+def ler_itens(arquivo):
+    # Linhas "id,quantidade" (ou ";" / tab). Cabeçalho opcional, linhas vazias e "#" ignoradas.
+    # Gerador de (numero_da_linha, id, quantidade); a quantidade precisa ser inteira e positiva.
+    amostra = arquivo.readline()
+    delimitador = next((d for d in ("\t", ";", ",") if d in amostra), ",")
+    linhas = (linha for parte in ([amostra], arquivo) for linha in parte)
+    for numero, campos in enumerate(csv.reader(linhas, delimiter=delimitador), start=1):
+        campos = [c.strip() for c in campos]
+        if not campos or not campos[0] or campos[0].startswith("#"):
+            continue
+        if numero == 1 and campos[0].lower() == "id":
+            continue
+        if len(campos) < 2:
+            raise LinhaInvalida(f"linha {numero}: esperado 'id,quantidade'")
+        try:
+            quantidade = int(campos[1])
+        except ValueError:
+            raise LinhaInvalida(f"linha {numero}: quantidade inválida: {campos[1]!r}") from None
+        if quantidade <= 0:
+            raise LinhaInvalida(f"linha {numero}: a quantidade deve ser maior que zero")
+        yield numero, campos[0], quantidade
+
+
+def _abrir(caminho):
+    if caminho == "-":
+        return sys.stdin
+    return open(caminho, newline="", encoding="utf-8-sig")
+
+
+def _lancar_lote(caminho, lancar):
+    # Aplica lancar(itens) numa única transação; se uma linha falhar, nada é gravado
+    atual = [0]
+
+    def itens(arquivo):
+        for numero, id_p, quantidade in ler_itens(arquivo):
+            atual[0] = numero
+            yield id_p, quantidade
+
+    arquivo = _abrir(caminho)
+    try:
+        return lancar(itens(arquivo))
+    except ProdutoNaoEncontradoError as e:
+        raise LinhaInvalida(f"linha {atual[0]}: produto não encontrado: {e}") from None
+    except EstoqueInsuficienteError as e:
+        raise LinhaInvalida(f"linha {atual[0]}: estoque insuficiente: {e}") from None
+    finally:
+        if arquivo is not sys.stdin:
+            arquivo.close()
+
+
+# === COMANDOS ===
+def cmd_vendas(db_manager, args):
+    total = _lancar_lote(args.arquivo, db_manager.registrar_vendas)
+    print(f"{total} vendas registradas.")
+
+
+def cmd_entradas(db_manager, args):
+    total = _lancar_lote(args.arquivo, db_manager.adicionar_estoques)
+    print(f"{total} entradas de estoque registradas.")
+
+
+def cmd_entrada(db_manager, args):
+    if args.quantidade <= 0:
+        raise LinhaInvalida("a quantidade deve ser maior que zero")
+    try:
+        db_manager.adicionar_estoque(args.id, args.quantidade)
+    except ProdutoNaoEncontradoError:
+        raise LinhaInvalida(f"produto não encontrado: {args.id}") from None
+    print(f"{args.quantidade} unidades adicionadas ao estoque de {args.id}.")
+
+
+def cmd_importar(db_manager, args):
+    from estoqueplus.importacao import importar_csv
+
+    resultado = importar_csv(db_manager, args.arquivo)
+    print(f"{resultado.mercadorias} mercadorias cadastradas/atualizadas, "
+          f"{resultado.entradas} entradas de estoque, {resultado.rejeitadas} linhas rejeitadas.")
+    for erro in resultado.erros:
+        print(erro, file=sys.stderr)
+
+
+CAMPOS_PRODUTO = ("id", "nome", "preco_compra", "preco_venda", "qtd_comprada", "qtd_saida", "restante",
+                  "descricao")
+CAMPOS_CONSULTADOS = tuple(campo for campo in CAMPOS_PRODUTO if campo != "restante")  # restante é calculado
+
+
+def cmd_produtos(db_manager, args):
+    repositorio = RepositorioMercadorias(db_manager)
+    if args.id:
+        mercadoria = repositorio.obter(args.id, CAMPOS_CONSULTADOS)
+        mercadorias = [mercadoria] if mercadoria else []
+    elif args.termo:
+        mercadorias = repositorio.buscar(args.termo, args.limite, campos=CAMPOS_CONSULTADOS)
+    else:
+        mercadorias, _chaves = repositorio.listar(args.ordem, args.limite, campos=CAMPOS_CONSULTADOS)
+    registros = [{campo: getattr(m, campo) for campo in CAMPOS_PRODUTO} for m in mercadorias]
+    if args.formato == "json":
+        json.dump(registros, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    elif args.formato == "csv":
+        escritor = csv.DictWriter(sys.stdout, CAMPOS_PRODUTO, lineterminator="\n")
+        escritor.writeheader()
+        escritor.writerows(registros)
+    else:
+        for r in registros:
+            print(f"{r['id']:<14} {(r['nome'] or '')[:40]:<40} {r['restante']:>8} "
+                  f"R${r['preco_venda']:>10.2f}")
+    if args.id and not registros:
+        raise LinhaInvalida(f"produto não encontrado: {args.id}")
+
+
+def cmd_repor(db_manager, args):
+    from estoqueplus import reposicao
+
+    itens = reposicao.itens_reposicao(db_manager)
+    if args.saida:
+        reposicao.exportar_lista_compras(itens, args.saida)
+        print(f"Lista de compras com {len(itens)} mercadorias salva em {args.saida}.")
+    elif args.formato == "csv":
+        escritor = csv.writer(sys.stdout, lineterminator="\n")
+        escritor.writerow(reposicao.COLUNAS_LISTA)
+        escritor.writerows((i.id, i.comprar, i.nome, i.restante, i.estoque_minimo, f"{i.preco_compra or 0:.2f}",
+                            f"{i.custo:.2f}") for i in itens)
+    else:
+        for i in itens:
+            print(f"{i.id:<14} {(i.nome or '')[:40]:<40} {i.restante:>6} / {i.estoque_minimo:<6} "
+                  f"comprar {i.comprar:>6}  R${i.custo:>10.2f}")
+        print(f"{len(itens)} mercadorias abaixo do estoque mínimo.")
+
+
+def cmd_estoque_minimo(db_manager, args):
+    try:
+        db_manager.definir_estoque_minimo(args.id, args.minimo)
+    except ProdutoNaoEncontradoError:
+        raise LinhaInvalida(f"produto não encontrado: {args.id}") from None
+    print(f"Estoque mínimo de {args.id}: {args.minimo}" + (" (alerta desligado)." if args.minimo == 0 else "."))
+
+
+def cmd_analise(db_manager, args):
+    from estoqueplus.analise import analisar_estoque
+
+    a = analisar_estoque(db_manager)
+    if args.formato == "json":
+        json.dump(a._asdict(), sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+
+    def talvez(valor, formato):
+        return "—" if valor is None else format(valor, formato)
+
+    print(f"Produtos: {a.produtos}   unidades em estoque: {a.unidades}")
+    print(f"Valor do estoque: R${a.valor_custo:.2f} a preço de custo, R${a.valor_venda:.2f} a preço de venda")
+    print(f"Receita: R${a.receita:.2f}   custo vendido: R${a.custo_vendido:.2f}   "
+          f"margem média: {talvez(a.margem_media, '.1f')}%")
+    print(f"Escoamento: {talvez(a.escoamento, '.1f')}% das unidades compradas   giro: {talvez(a.giro, '.2f')} "
+          f"vezes/ano   cobertura: {talvez(a.cobertura_dias, '.0f')} dias   histórico: {a.dias or 0} dias")
+    print(f"Sem nenhuma venda e com estoque: {a.encalhados} (R${a.valor_encalhado:.2f} a preço de custo)")
+    print("Margem sobre o preço de venda:")
+    for rotulo, produtos in a.faixas_margem:
+        print(f"  {rotulo:<16} {produtos:>8}")
+    print("Curva ABC (receita):")
+    for classe, produtos, receita, participacao in a.curva_abc:
+        print(f"  {classe}  {produtos:>8} produtos  R${receita:>14.2f}  {participacao:5.1f}%")
+
+
+def cmd_backup(db_manager, args):
+    from estoqueplus import backup
+
+    resultado = backup.realizar_backup(db_manager.db_name, pasta=args.pasta, comprimir=not args.sem_compressao)
+    print(f"Backup salvo em {resultado.caminho} ({resultado.tamanho} bytes).")
+    for removido in resultado.removidos:
+        print(f"Removido pela retenção: {removido}")
+
+
+def cmd_relatorio(db_manager, args):
+    if args.tipo == "pdf":
+        from estoqueplus.relatorios import gerar_relatorio_pdf
+        caminho = gerar_relatorio_pdf(db_manager, args.saida)
+    else:
+        from estoqueplus.graficos import gerar_grafico_lucro
+        caminho = gerar_grafico_lucro(db_manager)
+        if args.saida:
+            shutil.copyfile(caminho, args.saida)
+            caminho = args.saida
+    print(f"Relatório salvo em {caminho}")
+
+
+def cmd_servir(db_manager, args):
+    from estoqueplus.servidor import servir
+
+    servir(db_manager, args.host, args.porta, args.token)
+
+
+def cmd_sincronizar_exportar(db_manager, args):
+    from estoqueplus.sincronizacao import exportar_delta
+
+    r = exportar_delta(db_manager, args.arquivo, args.desde, args.destino)
+    if r.alteracoes:
+        print(f"{r.alteracoes} alterações (seq {r.desde + 1} a {r.ate}) exportadas para {r.caminho} "
+              f"({r.tamanho} bytes).")
+    else:
+        print(f"Nenhuma alteração depois da seq {r.desde}; {r.caminho} foi gravado vazio.")
+
+
+def cmd_sincronizar_importar(db_manager, args):
+    from estoqueplus.sincronizacao import importar_delta
+
+    for arquivo in args.arquivos:
+        r = importar_delta(db_manager, arquivo)
+        print(f"{arquivo}: {r.aplicadas} alterações aplicadas, {r.repetidas} já recebidas antes, "
+              f"{r.superadas} cadastros mais antigos que os daqui descartados.")
+        if r.estoque_negativo:
+            print(f"Atenção: estoque negativo depois da sincronização: {', '.join(r.estoque_negativo)}",
+                  file=sys.stderr)
+
+
+def cmd_sincronizar_estado(db_manager, args):
+    from estoqueplus.sincronizacao import estado
+
+    origem, ultima, recebidas, enviadas = estado(db_manager)
+    print(f"Este banco: origem {origem}, última alteração {ultima}")
+    for de, seq in recebidas.items():
+        print(f"Recebido de {de}: até a seq {seq}")
+    for destino, seq in enviadas.items():
+        print(f"Exportado para {destino}: até a seq {seq}")
+
+
+def cmd_sincronizar_nova_origem(db_manager, args):
+    from estoqueplus.sincronizacao import nova_origem
+
+    print(f"Nova origem deste banco: {nova_origem(db_manager)}")
+
+
+# === ARGUMENTOS ===
+def criar_parser():
+    from estoqueplus.backup import PASTA_BACKUPS
+
+    parser = argparse.ArgumentParser(prog="python -m estoqueplus",
+                                     description="EstoquePlus sem interface gráfica.")
+    parser.add_argument("--db", default=DatabaseManager.DB_NAME,
+                        help=f"arquivo do banco SQLite (padrão: {DatabaseManager.DB_NAME})")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    p = comandos.add_parser("vendas", help="registra vendas de um arquivo id,quantidade numa única transação")
+    p.add_argument("arquivo", help="arquivo CSV ('-' para a entrada padrão)")
+    p.set_defaults(funcao=cmd_vendas)
+
+    p = comandos.add_parser("entradas", help="registra entradas de estoque de um arquivo id,quantidade")
+    p.add_argument("arquivo", help="arquivo CSV ('-' para a entrada padrão)")
+    p.set_defaults(funcao=cmd_entradas)
+
+    p = comandos.add_parser("entrada", help="adiciona estoque a uma mercadoria")
+    p.add_argument("id")
+    p.add_argument("quantidade", type=int)
+    p.set_defaults(funcao=cmd_entrada)
+
+    p = comandos.add_parser("importar", help="importa um catálogo CSV (mesmo formato do menu Importar CSV)")
+    p.add_argument("arquivo")
+    p.set_defaults(funcao=cmd_importar)
+
+    p = comandos.add_parser("produtos", help="lista ou busca mercadorias")
+    p.add_argument("termo", nargs="?", help="texto buscado em id, nome e descrição")
+    p.add_argument("--id", help="mostra só a mercadoria com este id")
+    p.add_argument("--limite", type=int, default=50)
+    p.add_argument("--ordem", choices=tuple(DatabaseManager.ORDENACOES), default="nome",
+                   help="ordenação da listagem sem termo (a busca ordena por relevância)")
+    p.add_argument("--formato", choices=("tabela", "csv", "json"), default="tabela")
+    p.set_defaults(funcao=cmd_produtos)
+
+    p = comandos.add_parser("repor", help="mercadorias abaixo do estoque mínimo e a lista de compras")
+    p.add_argument("--saida", help="grava a lista de compras em CSV (id,quantidade,... serve para 'entradas')")
+    p.add_argument("--formato", choices=("tabela", "csv"), default="tabela")
+    p.set_defaults(funcao=cmd_repor)
+
+    p = comandos.add_parser("estoque-minimo",
+                            help="define o estoque mínimo (alerta de reposição) de uma mercadoria")
+    p.add_argument("id")
+    p.add_argument("minimo", type=int, help="0 desliga o alerta")
+    p.set_defaults(funcao=cmd_estoque_minimo)
+
+    p = comandos.add_parser("analise", help="valor do estoque, margens, curva ABC, escoamento e giro")
+    p.add_argument("--formato", choices=("texto", "json"), default="texto")
+    p.set_defaults(funcao=cmd_analise)
+
+    p = comandos.add_parser("backup", help="faz um backup verificado do banco")
+    p.add_argument("--pasta", default=PASTA_BACKUPS)
+    p.add_argument("--sem-compressao", action="store_true")
+    p.set_defaults(funcao=cmd_backup)
+
+    p = comandos.add_parser("relatorio", help="gera o relatório PDF ou o gráfico de lucro")
+    p.add_argument("tipo", choices=("pdf", "grafico"))
+    p.add_argument("--saida", help="caminho do arquivo gerado")
+    p.set_defaults(funcao=cmd_relatorio)
+
+    p = comandos.add_parser("servir", help="servidor HTTP/JSON para vários terminais usarem este banco")
+    p.add_argument("--host", default="127.0.0.1",
+                   help="endereço de escuta (0.0.0.0 para aceitar outros computadores da rede)")
+    p.add_argument("--porta", type=int, default=8765, help="porta (0 escolhe uma livre)")
+    p.add_argument("--token", default=os.environ.get("ESTOQUEPLUS_TOKEN"),
+                   help="exige 'Authorization: Bearer TOKEN' (padrão: $ESTOQUEPLUS_TOKEN)")
+    p.set_defaults(funcao=cmd_servir)
+
+    p = comandos.add_parser("sincronizar",
+                            help="troca alterações com o banco de outra filial por arquivos de delta")
+    acoes = p.add_subparsers(dest="acao", required=True)
+    a = acoes.add_parser("exportar", help="grava as alterações a partir de uma seq num arquivo .jsonl.gz")
+    a.add_argument("arquivo")
+    a.add_argument("--desde", type=int,
+                   help="última seq que o outro banco já tem (padrão: a do --destino, ou 0)")
+    a.add_argument("--destino", help="nome do outro banco; a próxima exportação continua de onde esta parou")
+    a.set_defaults(funcao=cmd_sincronizar_exportar)
+    a = acoes.add_parser("importar", help="aplica arquivos de delta de outros bancos")
+    a.add_argument("arquivos", nargs="+")
+    a.set_defaults(funcao=cmd_sincronizar_importar)
+    a = acoes.add_parser("estado", help="mostra a origem deste banco e até onde cada troca chegou")
+    a.set_defaults(funcao=cmd_sincronizar_estado)
+    a = acoes.add_parser("nova-origem", help="dá uma identidade nova a um banco copiado de outro")
+    a.set_defaults(funcao=cmd_sincronizar_nova_origem)
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    desempenho.ativar_pelo_ambiente()
+    db_manager = DatabaseManager(args.db)
+    try:
+        args.funcao(db_manager, args)
+    except (LinhaInvalida, OSError, ValueError, sqlite3.Error) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db_manager.fechar()
+    return 0
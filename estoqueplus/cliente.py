@@ -0,0 +1,327 @@
+import base64
+import http.client
+import json
+import os
+import socket
+import sqlite3
+import threading
+from urllib.parse import quote, urlencode, urlsplit
+
+from estoqueplus import escrita
+from estoqueplus.analise import Analise
+from estoqueplus.database import DatabaseManager, EstoqueInsuficienteError, ProdutoNaoEncontradoError
+from estoqueplus.mercadorias import CAMPOS_COMPLETOS, Mercadoria, RepositorioMercadorias
+
+# === CLIENTE DO SERVIDOR HTTP (estoqueplus.servidor) ===
+# ClienteEstoque oferece o que a interface usa do DatabaseManager (usuários, busca, gravações) e
+# RepositorioRemoto o mesmo que RepositorioMercadorias, só que pela rede. Como no DatabaseManager,
+# cada thread reaproveita a sua conexão (HTTP keep-alive) em vez de abrir uma por requisição.
+
+# Tipo de erro informado pelo servidor -> exceção levantada aqui (as mesmas do acesso local)
+ERROS_REMOTOS = {
+    "EstoqueInsuficienteError": EstoqueInsuficienteError,
+    "ProdutoNaoEncontradoError": ProdutoNaoEncontradoError,
+    "IntegrityError": sqlite3.IntegrityError,
+    "ValueError": ValueError,
+}
+
+
+class ErroServidor(OSError):
+    # Resposta de erro do servidor (status HTTP >= 400) sem exceção local equivalente
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+
+class ServidorIndisponivelError(ErroServidor):
+    def __init__(self, mensagem):
+        super().__init__(None, mensagem)
+
+
+def _erro_remoto(registro, status=None):
+    classe = ERROS_REMOTOS.get(registro.get("tipo"))
+    return classe(registro.get("erro")) if classe else ErroServidor(status, registro.get("erro"))
+
+
+class ClienteEstoque:
+    ORDENACOES = DatabaseManager.ORDENACOES
+    TIMEOUT = 15
+
+    def __init__(self, url, token=None):
+        partes = urlsplit(url)
+        if partes.scheme != "http" or not partes.hostname:
+            raise ValueError(f"endereço do servidor inválido: {url} (esperado http://host:porta)")
+        self.url = url.rstrip("/")
+        self.host = partes.hostname
+        self.porta = partes.port or 80
+        self.token = token
+        # Identifica o servidor onde um nome de arquivo é esperado (diário de operações pendentes)
+        self.db_name = f"servidor-{self.host}-{self.porta}"
+        self._local = threading.local()
+        self._conexoes = []
+        self._lock = threading.Lock()
+
+    def conexao(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.porta, timeout=self.TIMEOUT)
+            self._local.conn = conn
+            with self._lock:
+                self._conexoes.append(conn)
+        return conn
+
+    def fechar_conexao_da_thread(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            with self._lock:
+                self._conexoes.remove(conn)
+            conn.close()
+            self._local.conn = None
+
+    def fechar(self):
+        with self._lock:
+            for conn in self._conexoes:
+                conn.close()
+            self._conexoes.clear()
+        self._local = threading.local()
+
+    def cabecalhos(self):
+        cabecalhos = {"Content-Type": "application/json"}
+        if self.token:
+            cabecalhos["Authorization"] = f"Bearer {self.token}"
+        return cabecalhos
+
+    def requisitar(self, metodo, caminho, corpo=None, parametros=None):
+        if parametros:
+            caminho += "?" + urlencode(parametros)
+        dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8") if corpo is not None else None
+        for tentativa in range(2):
+            conn = self.conexao()
+            try:
+                conn.request(metodo, caminho, body=dados, headers=self.cabecalhos())
+                resposta = conn.getresponse()
+                conteudo = resposta.read()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                # A conexão guardada pode ter sido fechada pelo servidor: reabre uma vez. Só as
+                # gravações por /operacoes passam por aqui, e repeti-las não duplica nada.
+                self.fechar_conexao_da_thread()
+                if tentativa == 1:
+                    raise ServidorIndisponivelError(f"servidor {self.url} indisponível: {e}") from e
+        resultado = json.loads(conteudo) if conteudo else {}
+        if resposta.status >= 400:
+            raise _erro_remoto(resultado, resposta.status)
+        return resultado
+
+    def eventos(self, ultimo_id=None):
+        return AssinaturaEventos(self, ultimo_id)
+
+    # === O QUE A INTERFACE USA DO DatabaseManager ===
+    def has_user(self):
+        return self.requisitar("GET", "/usuarios")["existe"]
+
+    def check_user(self, username, password):
+        return self.requisitar("POST", "/login", {"usuario": username, "senha": password})["ok"]
+
+    def create_user(self, username, password):
+        self.requisitar("POST", "/usuarios", {"usuario": username, "senha": password})
+
+    def alertas_estoque(self):
+        return [tuple(alerta) for alerta in self.requisitar("GET", "/alertas")["alertas"]]
+
+    def contar_alertas_estoque(self):
+        return self.requisitar("GET", "/alertas/contagem")["alertas"]
+
+    def analise_estoque(self):
+        resposta = self.requisitar("GET", "/analise")
+        resposta["faixas_margem"] = [tuple(faixa) for faixa in resposta["faixas_margem"]]
+        resposta["curva_abc"] = [tuple(classe) for classe in resposta["curva_abc"]]
+        return Analise(**resposta)
+
+    def mercadoria_corresponde(self, id_p, termo):
+        return self.requisitar("GET", f"/mercadorias/{quote(id_p, safe='')}/corresponde",
+                               parametros={"busca": termo})["corresponde"]
+
+    def _gravar(self, tipo, **dados):
+        [(_operacao, resultado, erro)] = aplicar_lote(self, [escrita.Operacao(tipo, dados)])
+        if erro is not None:
+            raise erro
+        return resultado
+
+    def registrar_venda(self, id_p, quantidade):
+        self._gravar(escrita.VENDA, id=id_p, quantidade=quantidade)
+
+    def registrar_vendas(self, itens):
+        # Tudo ou nada, como no banco local: vai como uma venda de caixa
+        return self._gravar(escrita.CAIXA, itens=[[id_p, quantidade] for id_p, quantidade in itens])
+
+    def adicionar_estoque(self, id_p, quantidade):
+        self._gravar(escrita.ENTRADA, id=id_p, quantidade=quantidade)
+
+    def cadastrar_mercadoria(self, id_p, nome, pc, pv, qc, desc, imagem=None, estoque_minimo=None):
+        return self._gravar(escrita.CADASTRO, id=id_p, nome=nome, preco_compra=pc, preco_venda=pv,
+                            quantidade=qc, descricao=desc, imagem=imagem, estoque_minimo=estoque_minimo)
+
+    def excluir_mercadoria(self, id_p):
+        self._gravar(escrita.EXCLUSAO, id=id_p)
+
+
+def _para_envio(operacao):
+    # A imagem de um cadastro vai pelo conteúdo: o caminho local não existe no servidor
+    registro = operacao.como_dict()
+    if operacao.tipo == escrita.CADASTRO and operacao.dados.get("imagem"):
+        dados = dict(operacao.dados)
+        caminho = dados.pop("imagem")
+        with open(caminho, "rb") as arquivo:
+            dados["imagem_base64"] = base64.b64encode(arquivo.read()).decode("ascii")
+        dados["imagem_extensao"] = os.path.splitext(caminho)[1].lower()
+        registro["dados"] = dados
+    return registro
+
+
+def aplicar_lote(cliente, operacoes, limpar_aplicadas=None):
+    # Mesmo contrato de escrita.aplicar_lote, gravando pelo servidor num único POST /operacoes.
+    # limpar_aplicadas não se aplica: os ids gravados ficam no servidor, que atende vários terminais.
+    falhas = {}
+    registros = []
+    for operacao in operacoes:
+        try:
+            registros.append(_para_envio(operacao))
+        except OSError as e:
+            falhas[operacao.id] = e  # Imagem ilegível: só este cadastro falha
+    respostas = {}
+    if registros:
+        resposta = cliente.requisitar("POST", "/operacoes", {"operacoes": registros})
+        respostas = {r["id"]: r for r in resposta["resultados"]}
+    resultados = []
+    for operacao in operacoes:
+        if operacao.id in falhas:
+            resultados.append((operacao, None, falhas[operacao.id]))
+            continue
+        r = respostas[operacao.id]
+        resultados.append((operacao, r["resultado"], None if r["erro"] is None else _erro_remoto(r)))
+    return resultados
+
+
+class AssinaturaEventos:
+    # GET /eventos (Server-Sent Events) numa conexão só dela. Iterar devolve cada evento como dict,
+    # com o nome em "evento"; termina quando o servidor fecha. fechar() interrompe de outra thread.
+    def __init__(self, cliente, ultimo_id=None):
+        # O servidor manda um comentário a cada 15 s; sem nada por muito mais que isso, caiu
+        self.conexao = http.client.HTTPConnection(cliente.host, cliente.porta, timeout=60)
+        cabecalhos = cliente.cabecalhos()
+        cabecalhos["Accept"] = "text/event-stream"
+        if ultimo_id:
+            cabecalhos["Last-Event-ID"] = ultimo_id
+        self.ultimo_id = ultimo_id
+        try:
+            self.conexao.request("GET", "/eventos", headers=cabecalhos)
+            # Sem Content-Length, a resposta fica com o socket e a conexão o solta: guarda para fechar()
+            self._socket = self.conexao.sock
+            self.resposta = self.conexao.getresponse()
+        except (http.client.HTTPException, OSError) as e:
+            self.conexao.close()
+            raise ServidorIndisponivelError(f"servidor {cliente.url} indisponível: {e}") from e
+        if self.resposta.status != 200:
+            self.conexao.close()
+            raise _erro_remoto(json.loads(self.resposta.read() or b"{}"), self.resposta.status)
+
+    def __iter__(self):
+        nome, dados = None, []
+        while True:
+            linha = self.resposta.readline()
+            if not linha:
+                return
+            linha = linha.decode("utf-8").rstrip("\r\n")
+            if not linha:
+                # Linha em branco fecha o evento
+                if dados:
+                    evento = json.loads("\n".join(dados))
+                    evento["evento"] = nome or "message"
+                    yield evento
+                nome, dados = None, []
+            elif not linha.startswith(":"):  # ":" é comentário (ping)
+                campo, _sep, valor = linha.partition(":")
+                valor = valor[1:] if valor.startswith(" ") else valor
+                if campo == "id":
+                    self.ultimo_id = valor
+                elif campo == "event":
+                    nome = valor
+                elif campo == "data":
+                    dados.append(valor)
+
+    def fechar(self):
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+        self.conexao.close()
+
+
+class RepositorioRemoto:
+    # Mesmos métodos de RepositorioMercadorias, respondidos pelo servidor
+    LIMITE_PAGINA = 5000
+
+    def __init__(self, cliente):
+        self.db_manager = cliente
+
+    def _lista(self, resposta):
+        return [Mercadoria(**registro) for registro in resposta["mercadorias"]]
+
+    def obter(self, id_p, campos=CAMPOS_COMPLETOS):
+        try:
+            registro = self.db_manager.requisitar("GET", f"/mercadorias/{quote(id_p, safe='')}",
+                                                  parametros={"campos": ",".join(campos)})
+        except ErroServidor as e:
+            if e.status == 404:
+                return None
+            raise
+        return Mercadoria(**registro)
+
+    def existe(self, id_p):
+        return self.obter(id_p, ("id",)) is not None
+
+    def obter_varios(self, ids, campos=CAMPOS_COMPLETOS):
+        ids = list(ids)
+        if not ids:
+            return {}
+        if "id" not in campos:
+            campos = ("id",) + tuple(campos)
+        resposta = self.db_manager.requisitar("POST", "/mercadorias/lote", {"ids": ids, "campos": list(campos)})
+        return {m.id: m for m in self._lista(resposta)}
+
+    def contar(self):
+        return self.db_manager.requisitar("GET", "/contagem")["mercadorias"]
+
+    def todas(self, campos=CAMPOS_COMPLETOS):
+        mercadorias, apos = [], None
+        while True:
+            pagina, chaves = self.listar("nome", self.LIMITE_PAGINA, apos, campos)
+            mercadorias.extend(pagina)
+            if len(pagina) < self.LIMITE_PAGINA:
+                return mercadorias
+            apos = chaves[-1]
+
+    def buscar(self, termo, limite, deslocamento=0, campos=CAMPOS_COMPLETOS):
+        return self._lista(self.db_manager.requisitar("GET", "/mercadorias", parametros={
+            "busca": termo, "limite": limite, "deslocamento": deslocamento, "campos": ",".join(campos)}))
+
+    def listar(self, ordem, limite, apos=None, campos=CAMPOS_COMPLETOS):
+        parametros = {"ordem": ordem, "limite": limite, "campos": ",".join(campos)}
+        if apos is not None:
+            parametros["apos"] = json.dumps(list(apos))
+        resposta = self.db_manager.requisitar("GET", "/mercadorias", parametros=parametros)
+        return self._lista(resposta), [tuple(chave) for chave in resposta["chaves"]]
+
+    def chave_ordenacao(self, ordem, id_p):
+        chave = self.db_manager.requisitar("GET", f"/mercadorias/{quote(id_p, safe='')}/chave",
+                                           parametros={"ordem": ordem})["chave"]
+        return tuple(chave) if chave else None
+
+
+def repositorio_de(db_manager):
+    # O repositório certo para um DatabaseManager (banco local) ou um ClienteEstoque (servidor)
+    if isinstance(db_manager, ClienteEstoque):
+        return RepositorioRemoto(db_manager)
+    return RepositorioMercadorias(db_manager)
@@ -0,0 +1,856 @@
+import random
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from estoqueplus import desempenho
+from estoqueplus.dinheiro import centavos
+
+
+class EstoqueInsuficienteError(Exception):
+    pass
+
+
+class ProdutoNaoEncontradoError(Exception):
+    pass
+
+
+# === CLASSE PARA GERENCIAR USUÁRIOS E MERCADORIAS NO BANCO DE DADOS ===
+# Único ponto de acesso ao SQLite: cada thread reaproveita uma conexão aberta e já configurada,
+# em vez de abrir/fechar o arquivo (e pagar o fsync) a cada operação.
+class DatabaseManager:
+    DB_NAME = "stock_control.db"
+
+    # Ordenações da listagem: chave -> (coluna indexada junto com o id, direção). Nenhuma pode ser NULL:
+    # a paginação por chave compara (coluna, id) > (?, ?), que nunca é verdadeiro com NULL
+    ORDENACOES = {
+        "nome": ("nome_ordem", "ASC"),
+        "restante": ("restante", "ASC"),
+        "lucro": ("lucro_centavos", "DESC"),
+        "ultima_movimentacao": ("ultima_movimentacao", "DESC"),
+    }
+
+    PRAGMAS = (
+        "PRAGMA journal_mode = WAL",       # Leitores não bloqueiam o escritor
+        "PRAGMA synchronous = NORMAL",     # Em WAL, fsync só no checkpoint
+        "PRAGMA cache_size = -16000",      # ~16 MB de cache de páginas
+        "PRAGMA mmap_size = 268435456",    # Até 256 MB lidos via mmap
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA busy_timeout = 5000",
+    )
+    # Vários terminais no mesmo arquivo: BEGIN IMMEDIATE que esgota o busy_timeout é repetido
+    # algumas vezes, com espera crescente e aleatória, antes de desistir com "database is locked"
+    TENTATIVAS_BLOQUEIO = 5
+    # Dias que o id de uma operação gravada fica em operacoes_aplicadas se nenhum diário o retirar antes
+    VALIDADE_OPERACOES_APLICADAS = 30
+
+    def __init__(self, db_name=None):
+        self.db_name = db_name or self.DB_NAME
+        self._local = threading.local()
+        self._conexoes = []
+        self._lock = threading.Lock()
+        self.create_tables()
+
+    def conexao(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: autocommit, transações só pelo contexto transacao()
+            conn = sqlite3.connect(self.db_name, isolation_level=None, cached_statements=256,
+                                   check_same_thread=False, factory=desempenho.fabrica_conexao())
+            for pragma in self.PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._conexoes.append(conn)
+        return conn
+
+    def fechar_conexao_da_thread(self):
+        # Para threads de trabalho que terminam: não deixa a conexão delas aberta
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            with self._lock:
+                self._conexoes.remove(conn)
+            conn.close()
+            self._local.conn = None
+
+    def fechar(self):
+        with self._lock:
+            for conn in self._conexoes:
+                conn.close()
+            self._conexoes.clear()
+        self._local = threading.local()
+
+    @contextmanager
+    def transacao(self):
+        conn = self.conexao()
+        if conn.in_transaction:
+            # Transação aninhada participa da externa
+            yield conn
+            return
+        self._iniciar(conn)
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _iniciar(self, conn):
+        # IMMEDIATE: a trava de escrita é pega no BEGIN, então nenhuma instrução da transação
+        # esbarra noutro escritor no meio do caminho (SQLITE_BUSY sem possibilidade de espera)
+        espera = 0.05
+        for tentativa in range(self.TENTATIVAS_BLOQUEIO):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or tentativa == self.TENTATIVAS_BLOQUEIO - 1:
+                    raise
+            time.sleep(espera * random.uniform(0.5, 1.5))
+            espera *= 2
+
+    @contextmanager
+    def subtransacao(self, nome="subtransacao"):
+        # SAVEPOINT dentro de uma transação: uma falha desfaz só o que foi feito aqui dentro
+        with self.transacao() as conn:
+            conn.execute(f"SAVEPOINT {nome}")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute(f"ROLLBACK TO {nome}")
+                conn.execute(f"RELEASE {nome}")
+                raise
+            conn.execute(f"RELEASE {nome}")
+
+    def executar(self, sql, parametros=()):
+        return self.conexao().execute(sql, parametros)
+
+    def consultar(self, sql, parametros=()):
+        return self.conexao().execute(sql, parametros).fetchall()
+
+    def consultar_um(self, sql, parametros=()):
+        return self.conexao().execute(sql, parametros).fetchone()
+
+    # === ESQUEMA VERSIONADO (PRAGMA user_version) ===
+    # Cada migração leva o banco da versão anterior à sua, numa transação própria que também grava
+    # o novo user_version: ou a migração inteira entra, ou o banco continua na versão anterior.
+    # Banco novo passa pelas mesmas migrações (nas tabelas vazias elas são instantâneas).
+    MIGRACOES = (
+        (1, "esquema inicial", "_migracao_esquema_inicial"),
+        (2, "dinheiro em centavos e colunas geradas armazenadas", "_migracao_centavos"),
+        (3, "índices das listagens, buscas e relatórios", "_migracao_indices"),
+        (4, "estoque mínimo e alertas de reposição", "_migracao_alertas_estoque"),
+        (5, "data de gravação das operações aplicadas", "_migracao_operacoes_aplicadas"),
+        (6, "ordenação por nome sem NULL", "_migracao_ordem_nome"),
+    )
+    VERSAO_ESQUEMA = MIGRACOES[-1][0]
+
+    # Tabelas com dinheiro na forma atual: valores em centavos inteiros (somas exatas, sem o desvio do
+    # REAL); restante e lucro_centavos são geradas e armazenadas (STORED), calculadas na gravação
+    TABELAS = {
+        "mercadorias": '''(
+            id TEXT PRIMARY KEY,
+            nome TEXT,
+            preco_compra_centavos INTEGER,
+            preco_venda_centavos INTEGER,
+            qtd_comprada INTEGER,
+            qtd_saida INTEGER,
+            descricao TEXT,
+            valor_total_compra_centavos INTEGER,
+            valor_total_venda_centavos INTEGER,
+            imagem_path TEXT,
+            imagem_hash TEXT,
+            ultima_movimentacao TEXT NOT NULL DEFAULT '',
+            restante INTEGER GENERATED ALWAYS AS (COALESCE(qtd_comprada, 0) - COALESCE(qtd_saida, 0)) STORED,
+            lucro_centavos INTEGER GENERATED ALWAYS AS
+                (COALESCE((preco_venda_centavos - preco_compra_centavos) * qtd_saida, 0)) STORED
+        )''',
+        "vendas": '''(
+            id INTEGER PRIMARY KEY,
+            produto_id TEXT NOT NULL,
+            quantidade INTEGER NOT NULL,
+            preco_unitario_centavos INTEGER NOT NULL,
+            custo_unitario_centavos INTEGER NOT NULL,
+            valor_total_centavos INTEGER NOT NULL,
+            data_hora TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+        )''',
+        "entradas": '''(
+            id INTEGER PRIMARY KEY,
+            produto_id TEXT NOT NULL,
+            quantidade INTEGER NOT NULL,
+            custo_unitario_centavos INTEGER NOT NULL,
+            valor_total_centavos INTEGER NOT NULL,
+            data_hora TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+        )''',
+        "resumo_vendas_diario": '''(
+            dia TEXT NOT NULL,
+            produto_id TEXT NOT NULL,
+            quantidade INTEGER NOT NULL,
+            receita_centavos INTEGER NOT NULL,
+            custo_centavos INTEGER NOT NULL,
+            PRIMARY KEY (dia, produto_id)
+        ) WITHOUT ROWID''',
+    }
+
+    def create_tables(self):
+        versao = self.consultar_um("PRAGMA user_version")[0]
+        if versao > self.VERSAO_ESQUEMA:
+            raise sqlite3.DatabaseError(f"{self.db_name} está na versão {versao} do esquema; "
+                                        f"esta versão do EstoquePlus conhece até a {self.VERSAO_ESQUEMA}")
+        for numero, descricao, metodo in self.MIGRACOES:
+            if numero <= versao:
+                continue
+            with self.transacao() as conn:
+                # Outro terminal pode ter migrado enquanto este esperava a trava
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= numero:
+                    continue
+                with desempenho.medir(desempenho.SQL, f"migração {numero}: {descricao}"):
+                    getattr(self, metodo)(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {numero}")
+
+    @staticmethod
+    def _existe(cursor, nome):
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (nome,))
+        return cursor.fetchone() is not None
+
+    @staticmethod
+    def _adicionar_coluna(cursor, tabela, coluna, tipo):
+        # Bancos antigos: acrescenta a coluna que o CREATE TABLE já traz nos bancos novos.
+        # table_xinfo também lista as colunas geradas. Devolve True se a coluna foi criada agora.
+        cursor.execute(f"PRAGMA table_xinfo({tabela})")
+        if coluna in {linha[1] for linha in cursor.fetchall()}:
+            return False
+        cursor.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}")
+        return True
+
+    def _criar_tabela(self, cursor, tabela, nome=None):
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {nome or tabela} {self.TABELAS[tabela]}")
+
+    # --- Migração 1 ---
+    def _migracao_esquema_inicial(self, cursor):
+        # O esquema de antes do controle de versão (dinheiro em REAL), criado do zero ou completado
+        # num banco antigo, que pode não ter as colunas e tabelas acrescentadas aos poucos.
+        # Gatilhos e índices ficam para as migrações seguintes, que refazem as tabelas.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                username TEXT PRIMARY KEY,
+                password TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS mercadorias (
+                id TEXT PRIMARY KEY,
+                nome TEXT,
+                preco_compra REAL,
+                preco_venda REAL,
+                qtd_comprada INTEGER,
+                qtd_saida INTEGER,
+                descricao TEXT,
+                valor_total_compra REAL,
+                valor_total_venda REAL,
+                imagem_path TEXT,
+                imagem_hash TEXT,
+                ultima_movimentacao TEXT NOT NULL DEFAULT ''
+            )
+        ''')
+        self._adicionar_coluna(cursor, 'mercadorias', 'imagem_hash', 'TEXT')
+        sem_movimentacao = self._adicionar_coluna(cursor, 'mercadorias', 'ultima_movimentacao',
+                                                  "TEXT NOT NULL DEFAULT ''")
+
+        # Livro-razão somente de inclusão: cada venda e cada entrada de estoque vira um evento
+        livro_existia = self._existe(cursor, 'vendas')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS vendas (
+                id INTEGER PRIMARY KEY,
+                produto_id TEXT NOT NULL,
+                quantidade INTEGER NOT NULL,
+                preco_unitario REAL NOT NULL,
+                custo_unitario REAL NOT NULL,
+                valor_total REAL NOT NULL,
+                data_hora TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS entradas (
+                id INTEGER PRIMARY KEY,
+                produto_id TEXT NOT NULL,
+                quantidade INTEGER NOT NULL,
+                custo_unitario REAL NOT NULL,
+                valor_total REAL NOT NULL,
+                data_hora TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+            )
+        ''')
+        # Totais por dia e produto, mantidos pelos gatilhos de vendas
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS resumo_vendas_diario (
+                dia TEXT NOT NULL,
+                produto_id TEXT NOT NULL,
+                quantidade INTEGER NOT NULL,
+                receita REAL NOT NULL,
+                custo REAL NOT NULL,
+                PRIMARY KEY (dia, produto_id)
+            ) WITHOUT ROWID
+        ''')
+        if not livro_existia:
+            self._migrar_para_livro_razao(cursor)
+        if sem_movimentacao:
+            # A última movimentação sai do livro-razão
+            cursor.execute('''
+                UPDATE mercadorias SET ultima_movimentacao = COALESCE((
+                    SELECT MAX(data_hora) FROM (
+                        SELECT MAX(data_hora) AS data_hora FROM vendas WHERE produto_id = mercadorias.id
+                        UNION ALL
+                        SELECT MAX(data_hora) FROM entradas WHERE produto_id = mercadorias.id
+                    )
+                ), '')
+            ''')
+
+        # Índice de busca textual (FTS5) sobre id, nome e descrição, sem acentos. Aponta para as
+        # linhas pelo rowid, que as migrações preservam ao refazer a tabela mercadorias.
+        fts_existia = self._existe(cursor, 'mercadorias_fts')
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS mercadorias_fts USING fts5(
+                id, nome, descricao,
+                content='mercadorias', content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+        if not fts_existia:
+            # Indexa o catálogo que já existia
+            cursor.execute("INSERT INTO mercadorias_fts(mercadorias_fts) VALUES ('rebuild')")
+
+        # Contador de versão dos dados: qualquer mudança em mercadorias (inclusive as feitas pelos
+        # gatilhos de vendas e entradas) o incrementa. Serve de chave para caches de gráficos etc.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS controle (
+                chave TEXT PRIMARY KEY,
+                valor INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO controle (chave, valor) VALUES ('versao_dados', 1)")
+        # As mercadorias referenciam imagens pelo hash do conteúdo (ver estoqueplus.imagens);
+        # hashes que perderam a última referência esperam aqui para o arquivo ser apagado
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS imagens_orfas (
+                hash TEXT PRIMARY KEY
+            ) WITHOUT ROWID
+        ''')
+        # Registro de alterações (captura de mudanças) para sincronizar filiais por arquivos de delta
+        # (ver estoqueplus.sincronizacao). seq só cresce; origem/seq_origem ficam NULL nas mudanças
+        # feitas aqui e guardam de onde veio uma mudança importada de outro banco.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS alteracoes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                tabela TEXT NOT NULL,
+                chave TEXT NOT NULL,
+                operacao TEXT NOT NULL,
+                origem TEXT,
+                seq_origem INTEGER,
+                data_hora TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+            )
+        ''')
+        # Este banco (local = 1) e as origens já importadas, com a última seq recebida de cada uma
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS replicas (
+                origem TEXT PRIMARY KEY,
+                local INTEGER NOT NULL DEFAULT 0,
+                ultima_seq INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            INSERT INTO replicas (origem, local)
+            SELECT lower(hex(randomblob(8))), 1 WHERE NOT EXISTS (SELECT 1 FROM replicas WHERE local = 1)
+        ''')
+        # Até onde o registro já foi exportado para cada destino
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS destinos_sincronizacao (
+                destino TEXT PRIMARY KEY,
+                ultima_seq INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        # Ids das operações da fila de escrita já gravadas (ver estoqueplus.escrita)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS operacoes_aplicadas (
+                id TEXT PRIMARY KEY
+            ) WITHOUT ROWID
+        ''')
+
+    @staticmethod
+    def _migrar_para_livro_razao(cursor):
+        # Bancos de antes do livro-razão: o saldo atual de cada mercadoria vira uma entrada e uma
+        # venda iniciais. O valor_total_venda antigo guardava só a última venda, então a venda
+        # inicial é avaliada pelo preço de venda atual.
+        cursor.execute('''
+            INSERT INTO entradas (produto_id, quantidade, custo_unitario, valor_total)
+            SELECT id, qtd_comprada, preco_compra, preco_compra * qtd_comprada
+            FROM mercadorias WHERE qtd_comprada > 0
+        ''')
+        cursor.execute('''
+            INSERT INTO vendas (produto_id, quantidade, preco_unitario, custo_unitario, valor_total)
+            SELECT id, qtd_saida, preco_venda, preco_compra, preco_venda * qtd_saida
+            FROM mercadorias WHERE qtd_saida > 0
+        ''')
+        cursor.execute('''
+            INSERT INTO resumo_vendas_diario (dia, produto_id, quantidade, receita, custo)
+            SELECT substr(data_hora, 1, 10), produto_id, SUM(quantidade), SUM(valor_total),
+                   SUM(custo_unitario * quantidade)
+            FROM vendas GROUP BY 1, 2
+        ''')
+        # A partir daqui os totais de mercadorias são derivados do livro-razão
+        cursor.execute('''
+            UPDATE mercadorias SET
+                qtd_comprada = COALESCE((SELECT SUM(quantidade) FROM entradas e WHERE e.produto_id = mercadorias.id), 0),
+                valor_total_compra = COALESCE((SELECT SUM(valor_total) FROM entradas e WHERE e.produto_id = mercadorias.id), 0),
+                qtd_saida = COALESCE((SELECT SUM(quantidade) FROM vendas v WHERE v.produto_id = mercadorias.id), 0),
+                valor_total_venda = COALESCE((SELECT SUM(valor_total) FROM vendas v WHERE v.produto_id = mercadorias.id), 0)
+        ''')
+
+    # --- Migração 2 ---
+    def _migracao_centavos(self, cursor):
+        # Dinheiro em REAL -> centavos inteiros, e restante/lucro armazenados. Colunas geradas STORED
+        # não entram por ALTER TABLE, então as quatro tabelas são refeitas: cópia numa só passada
+        # (mercadorias mantém o rowid, do qual o índice FTS depende), exclusão das antigas, que leva
+        # junto gatilhos e índices, e troca de nome. Os índices voltam na migração 3, depois da carga.
+        def c(coluna):
+            return f"CAST(ROUND({coluna} * 100) AS INTEGER)"
+
+        copias = {
+            "mercadorias": (
+                "rowid, id, nome, preco_compra_centavos, preco_venda_centavos, qtd_comprada, qtd_saida, "
+                "descricao, valor_total_compra_centavos, valor_total_venda_centavos, imagem_path, imagem_hash, "
+                "ultima_movimentacao",
+                f"rowid, id, nome, {c('preco_compra')}, {c('preco_venda')}, qtd_comprada, qtd_saida, descricao, "
+                f"{c('valor_total_compra')}, {c('valor_total_venda')}, imagem_path, imagem_hash, "
+                f"ultima_movimentacao"),
+            "vendas": (
+                "id, produto_id, quantidade, preco_unitario_centavos, custo_unitario_centavos, "
+                "valor_total_centavos, data_hora",
+                f"id, produto_id, quantidade, {c('preco_unitario')}, {c('custo_unitario')}, "
+                f"{c('valor_total')}, data_hora"),
+            "entradas": (
+                "id, produto_id, quantidade, custo_unitario_centavos, valor_total_centavos, data_hora",
+                f"id, produto_id, quantidade, {c('custo_unitario')}, {c('valor_total')}, data_hora"),
+            "resumo_vendas_diario": (
+                "dia, produto_id, quantidade, receita_centavos, custo_centavos",
+                f"dia, produto_id, quantidade, {c('receita')}, {c('custo')}"),
+        }
+        for tabela, (colunas, valores) in copias.items():
+            self._criar_tabela(cursor, tabela, f"{tabela}_nova")
+            cursor.execute(f"INSERT INTO {tabela}_nova ({colunas}) SELECT {valores} FROM {tabela}")
+        # Sem nenhuma tabela antiga (e portanto sem gatilhos que citem colunas antigas) antes das trocas
+        for tabela in copias:
+            cursor.execute(f"DROP TABLE {tabela}")
+        for tabela in copias:
+            cursor.execute(f"ALTER TABLE {tabela}_nova RENAME TO {tabela}")
+        self._criar_gatilhos(cursor)
+
+    # --- Migração 3 ---
+    def _migracao_indices(self, cursor):
+        # Um índice (coluna, id) por ordenação: a paginação por chave vira uma busca no índice (e o
+        # gráfico de lucro lê o topo de idx_mercadorias_lucro_centavos). Relatório e exportações por
+        # período usam os de data; o resumo diário é lido por produto ou por dia.
+        for coluna in ("nome", "restante", "lucro_centavos", "ultima_movimentacao"):
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_mercadorias_{coluna} ON mercadorias({coluna}, id)")
+        for indice in (
+            "CREATE INDEX IF NOT EXISTS idx_vendas_produto_data ON vendas(produto_id, data_hora)",
+            "CREATE INDEX IF NOT EXISTS idx_vendas_data ON vendas(data_hora)",
+            "CREATE INDEX IF NOT EXISTS idx_entradas_produto_data ON entradas(produto_id, data_hora)",
+            "CREATE INDEX IF NOT EXISTS idx_entradas_data ON entradas(data_hora)",
+            "CREATE INDEX IF NOT EXISTS idx_resumo_produto_dia ON resumo_vendas_diario(produto_id, dia)",
+            # Os gatilhos de imagem procuram outra mercadoria com o mesmo hash
+            "CREATE INDEX IF NOT EXISTS idx_mercadorias_imagem_hash ON mercadorias(imagem_hash)",
+            # Última alteração de cada mercadoria, para resolver conflitos (vendas não entram no índice)
+            "CREATE INDEX IF NOT EXISTS idx_alteracoes_mercadoria ON alteracoes(chave, seq) "
+            "WHERE tabela = 'mercadorias'",
+        ):
+            cursor.execute(indice)
+        # Estatísticas para o planejador escolher esses índices
+        cursor.execute("ANALYZE")
+
+    # --- Migração 4 ---
+    def _migracao_alertas_estoque(self, cursor):
+        # estoque_minimo 0 = sem alerta. alertas_estoque é a lista de observação: só as mercadorias
+        # com restante <= estoque_minimo, mantida pelos gatilhos a cada venda, entrada ou mudança do
+        # mínimo. Consultar os alertas custa o número de alertas, não o tamanho do catálogo.
+        self._adicionar_coluna(cursor, "mercadorias", "estoque_minimo", "INTEGER NOT NULL DEFAULT 0")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS alertas_estoque (
+                produto_id TEXT PRIMARY KEY,
+                desde TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+            ) WITHOUT ROWID
+        ''')
+        for gatilho in self._gatilhos_alertas():
+            cursor.execute(gatilho)
+        cursor.execute('''
+            INSERT OR IGNORE INTO alertas_estoque (produto_id)
+            SELECT id FROM mercadorias WHERE estoque_minimo > 0 AND restante <= estoque_minimo
+        ''')
+
+    # --- Migração 5 ---
+    def _migracao_operacoes_aplicadas(self, cursor):
+        # Cada terminal só retira de operacoes_aplicadas os ids do próprio diário; os que ninguém
+        # retira (terminal que caiu e não voltou, servidor) saem pela idade. Os ids já guardados
+        # contam como gravados agora.
+        if self._adicionar_coluna(cursor, "operacoes_aplicadas", "gravada_em", "TEXT NOT NULL DEFAULT ''"):
+            cursor.execute("UPDATE operacoes_aplicadas SET gravada_em = datetime('now')")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_operacoes_aplicadas_data "
+                       "ON operacoes_aplicadas(gravada_em)")
+
+    # --- Migração 6 ---
+    def _migracao_ordem_nome(self, cursor):
+        # nome aceita NULL, e a paginação por chave perderia essas linhas (e as páginas depois delas):
+        # a listagem ordena por nome_ordem, o nome com NULL como ''. Coluna gerada (VIRTUAL, a única que
+        # ALTER TABLE acrescenta) com índice próprio: a comparação (nome_ordem, id) > (?, ?) continua uma
+        # busca no índice, o que não acontece com um índice sobre a expressão COALESCE.
+        self._adicionar_coluna(cursor, "mercadorias", "nome_ordem",
+                               "TEXT GENERATED ALWAYS AS (COALESCE(nome, '')) VIRTUAL")
+        cursor.execute("DROP INDEX IF EXISTS idx_mercadorias_nome")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mercadorias_nome_ordem ON mercadorias(nome_ordem, id)")
+        cursor.execute("ANALYZE idx_mercadorias_nome_ordem")
+
+    # === GATILHOS ===
+    def _criar_gatilhos(self, cursor):
+        for gatilhos in (self._gatilhos_busca(), self._gatilhos_livro_razao(), self._gatilhos_controle(),
+                         self._gatilhos_imagens(), self._gatilhos_alteracoes()):
+            for gatilho in gatilhos:
+                cursor.execute(gatilho)
+
+    @staticmethod
+    def _gatilhos_busca():
+        # Mantêm o índice FTS sincronizado; vendas não tocam nas colunas indexadas
+        return (
+            '''CREATE TRIGGER IF NOT EXISTS mercadorias_fts_ai AFTER INSERT ON mercadorias BEGIN
+                INSERT INTO mercadorias_fts(rowid, id, nome, descricao)
+                VALUES (new.rowid, new.id, new.nome, new.descricao);
+            END''',
+            '''CREATE TRIGGER IF NOT EXISTS mercadorias_fts_ad AFTER DELETE ON mercadorias BEGIN
+                INSERT INTO mercadorias_fts(mercadorias_fts, rowid, id, nome, descricao)
+                VALUES ('delete', old.rowid, old.id, old.nome, old.descricao);
+            END''',
+            '''CREATE TRIGGER IF NOT EXISTS mercadorias_fts_au AFTER UPDATE OF id, nome, descricao ON mercadorias BEGIN
+                INSERT INTO mercadorias_fts(mercadorias_fts, rowid, id, nome, descricao)
+                VALUES ('delete', old.rowid, old.id, old.nome, old.descricao);
+                INSERT INTO mercadorias_fts(rowid, id, nome, descricao)
+                VALUES (new.rowid, new.id, new.nome, new.descricao);
+            END''',
+        )
+
+    @staticmethod
+    def _gatilhos_livro_razao():
+        # O livro-razão só aceita inclusões; cada uma soma nos totais da mercadoria e no resumo diário,
+        # e a última movimentação acompanha a data do evento
+        gatilhos = [
+            '''CREATE TRIGGER IF NOT EXISTS vendas_ai AFTER INSERT ON vendas BEGIN
+                UPDATE mercadorias
+                SET qtd_saida = qtd_saida + new.quantidade,
+                    valor_total_venda_centavos = valor_total_venda_centavos + new.valor_total_centavos
+                WHERE id = new.produto_id;
+                INSERT INTO resumo_vendas_diario (dia, produto_id, quantidade, receita_centavos, custo_centavos)
+                VALUES (substr(new.data_hora, 1, 10), new.produto_id, new.quantidade,
+                        new.valor_total_centavos, new.custo_unitario_centavos * new.quantidade)
+                ON CONFLICT (dia, produto_id) DO UPDATE SET
+                    quantidade = quantidade + excluded.quantidade,
+                    receita_centavos = receita_centavos + excluded.receita_centavos,
+                    custo_centavos = custo_centavos + excluded.custo_centavos;
+            END''',
+            '''CREATE TRIGGER IF NOT EXISTS entradas_ai AFTER INSERT ON entradas BEGIN
+                UPDATE mercadorias
+                SET qtd_comprada = qtd_comprada + new.quantidade,
+                    valor_total_compra_centavos = valor_total_compra_centavos + new.valor_total_centavos
+                WHERE id = new.produto_id;
+            END''',
+        ]
+        for tabela in ("vendas", "entradas"):
+            gatilhos += [
+                f'''CREATE TRIGGER IF NOT EXISTS {tabela}_somente_inclusao_au BEFORE UPDATE ON {tabela} BEGIN
+                    SELECT RAISE(ABORT, '{tabela} aceita apenas inclusões');
+                END''',
+                f'''CREATE TRIGGER IF NOT EXISTS {tabela}_somente_inclusao_ad BEFORE DELETE ON {tabela} BEGIN
+                    SELECT RAISE(ABORT, '{tabela} aceita apenas inclusões');
+                END''',
+                f'''CREATE TRIGGER IF NOT EXISTS {tabela}_movimentacao_ai AFTER INSERT ON {tabela} BEGIN
+                    UPDATE mercadorias SET ultima_movimentacao = new.data_hora
+                    WHERE id = new.produto_id AND ultima_movimentacao < new.data_hora;
+                END''',
+            ]
+        return gatilhos
+
+    @staticmethod
+    def _gatilhos_controle():
+        # Qualquer mudança em mercadorias incrementa a versão dos dados
+        return [f'''CREATE TRIGGER IF NOT EXISTS mercadorias_versao_{evento.lower()}
+                    AFTER {evento} ON mercadorias BEGIN
+                        UPDATE controle SET valor = valor + 1 WHERE chave = 'versao_dados';
+                    END''' for evento in ("INSERT", "UPDATE", "DELETE")]
+
+    @staticmethod
+    def _gatilhos_imagens():
+        # Quando a última referência a um hash some, ele entra na fila de imagens órfãs
+        return (
+            '''CREATE TRIGGER IF NOT EXISTS mercadorias_imagem_ad AFTER DELETE ON mercadorias
+            WHEN old.imagem_hash IS NOT NULL
+                 AND NOT EXISTS (SELECT 1 FROM mercadorias WHERE imagem_hash = old.imagem_hash) BEGIN
+                INSERT OR IGNORE INTO imagens_orfas (hash) VALUES (old.imagem_hash);
+            END''',
+            '''CREATE TRIGGER IF NOT EXISTS mercadorias_imagem_au AFTER UPDATE OF imagem_hash ON mercadorias
+            WHEN old.imagem_hash IS NOT NULL AND old.imagem_hash IS NOT new.imagem_hash
+                 AND NOT EXISTS (SELECT 1 FROM mercadorias WHERE imagem_hash = old.imagem_hash) BEGIN
+                INSERT OR IGNORE INTO imagens_orfas (hash) VALUES (old.imagem_hash);
+            END''',
+        )
+
+    @staticmethod
+    def _gatilhos_alteracoes():
+        # Só o cadastro entra como alteração de mercadoria: as quantidades mudam pelo livro-razão,
+        # que é registrado linha a linha
+        campos = ("nome", "preco_compra_centavos", "preco_venda_centavos", "descricao", "imagem_path",
+                  "imagem_hash")
+        mudou = " OR ".join(f"old.{c} IS NOT new.{c}" for c in campos)
+        return (
+            '''CREATE TRIGGER IF NOT EXISTS mercadorias_alteracoes_ai AFTER INSERT ON mercadorias BEGIN
+                INSERT INTO alteracoes (tabela, chave, operacao) VALUES ('mercadorias', new.id, 'gravada');
+            END''',
+            f'''CREATE TRIGGER IF NOT EXISTS mercadorias_alteracoes_au AFTER UPDATE OF {", ".join(campos)}
+            ON mercadorias WHEN {mudou} BEGIN
+                INSERT INTO alteracoes (tabela, chave, operacao) VALUES ('mercadorias', new.id, 'gravada');
+            END''',
+            '''CREATE TRIGGER IF NOT EXISTS mercadorias_alteracoes_ad AFTER DELETE ON mercadorias BEGIN
+                INSERT INTO alteracoes (tabela, chave, operacao) VALUES ('mercadorias', old.id, 'excluida');
+            END''',
+            '''CREATE TRIGGER IF NOT EXISTS vendas_alteracoes_ai AFTER INSERT ON vendas BEGIN
+                INSERT INTO alteracoes (tabela, chave, operacao) VALUES ('vendas', new.id, 'incluida');
+            END''',
+            '''CREATE TRIGGER IF NOT EXISTS entradas_alteracoes_ai AFTER INSERT ON entradas BEGIN
+                INSERT INTO alteracoes (tabela, chave, operacao) VALUES ('entradas', new.id, 'incluida');
+            END''',
+        )
+
+    @staticmethod
+    def _gatilhos_alertas():
+        # Fora de _criar_gatilhos: estoque_minimo só existe a partir da migração 4. O alerta guarda
+        # desde quando a mercadoria está abaixo do mínimo; sai quando o estoque volta a passar dele.
+        abaixo = "new.estoque_minimo > 0 AND new.restante <= new.estoque_minimo"
+        return (
+            f'''CREATE TRIGGER IF NOT EXISTS mercadorias_alertas_ai AFTER INSERT ON mercadorias
+            WHEN {abaixo} BEGIN
+                INSERT OR IGNORE INTO alertas_estoque (produto_id) VALUES (new.id);
+            END''',
+            f'''CREATE TRIGGER IF NOT EXISTS mercadorias_alertas_au
+            AFTER UPDATE OF id, qtd_comprada, qtd_saida, estoque_minimo ON mercadorias BEGIN
+                DELETE FROM alertas_estoque
+                WHERE produto_id = old.id AND (old.id IS NOT new.id OR NOT ({abaixo}));
+                INSERT OR IGNORE INTO alertas_estoque (produto_id) SELECT new.id WHERE {abaixo};
+            END''',
+            '''CREATE TRIGGER IF NOT EXISTS mercadorias_alertas_ad AFTER DELETE ON mercadorias BEGIN
+                DELETE FROM alertas_estoque WHERE produto_id = old.id;
+            END''',
+        )
+
+    @staticmethod
+    def expressao_busca(termo):
+        # Cada palavra vira um prefixo entre aspas: "caf" encontra "Café", "alm" encontra "Almôndegas"
+        palavras = re.findall(r"\w+", termo)
+        return " ".join(f'"{p}"*' for p in palavras)
+
+    # === USUÁRIOS ===
+    def has_user(self):
+        return self.consultar_um("SELECT 1 FROM users LIMIT 1") is not None
+
+    def check_user(self, username, password):
+        result = self.consultar_um('SELECT 1 FROM users WHERE username = ? AND password = ?',
+                                   (username, password))
+        return result is not None
+
+    def create_user(self, username, password):
+        # sqlite3.IntegrityError se o usuário já existir
+        self.executar('INSERT INTO users (username, password) VALUES (?, ?)', (username, password))
+
+    # === MERCADORIAS ===
+    # Consultas que devolvem mercadorias ficam em estoqueplus.mercadorias.RepositorioMercadorias
+    def mercadoria_corresponde(self, id_p, termo):
+        expressao = self.expressao_busca(termo)
+        if not expressao:
+            return True
+        return self.consultar_um('''
+            SELECT 1 FROM mercadorias_fts
+            WHERE mercadorias_fts MATCH ?
+              AND rowid = (SELECT rowid FROM mercadorias WHERE id = ?)
+        ''', (expressao, id_p)) is not None
+
+    def cadastrar_mercadoria(self, id_p, nome, pc, pv, qc, desc, imagem_path=None, imagem_hash=None,
+                             estoque_minimo=None):
+        # Devolve True se a mercadoria já existia; a quantidade entra como evento em entradas.
+        # Sem imagem nova (imagem_path None), uma mercadoria existente mantém a que já tem; o mesmo
+        # vale para estoque_minimo None (uma nova começa com 0, sem alerta).
+        # Nenhuma coluna de estoque é escrita aqui: quantidades só mudam pelos gatilhos do livro-razão.
+        # Preços chegam em reais e são gravados em centavos.
+        pc, pv = centavos(pc), centavos(pv)
+        with self.transacao() as conn:
+            existia = conn.execute('''
+                UPDATE mercadorias
+                SET nome = ?, preco_compra_centavos = ?, preco_venda_centavos = ?, descricao = ?,
+                    imagem_path = COALESCE(?, imagem_path), imagem_hash = COALESCE(?, imagem_hash),
+                    estoque_minimo = COALESCE(?, estoque_minimo)
+                WHERE id = ?
+            ''', (nome, pc, pv, desc, imagem_path, imagem_hash, estoque_minimo, id_p)).rowcount == 1
+            if not existia:
+                conn.execute('''
+                    INSERT INTO mercadorias (id, nome, preco_compra_centavos, preco_venda_centavos, qtd_comprada,
+                                             qtd_saida, descricao, valor_total_compra_centavos,
+                                             valor_total_venda_centavos, imagem_path, imagem_hash, estoque_minimo)
+                    VALUES (?, ?, ?, ?, 0, 0, ?, 0, 0, ?, ?, COALESCE(?, 0))
+                ''', (id_p, nome, pc, pv, desc, imagem_path, imagem_hash, estoque_minimo))
+            if qc > 0:
+                self._inserir_entrada(conn, id_p, qc)
+            return existia
+
+    @staticmethod
+    def _conferir_quantidade(quantidade):
+        # Zero ou negativa passaria pela conferência de estoque (restante >= -5) e inverteria a
+        # operação: uma "venda" aumentando o estoque. Vale para a interface, o servidor e a linha de comando.
+        if not isinstance(quantidade, int) or isinstance(quantidade, bool) or quantidade <= 0:
+            raise ValueError(f"quantidade inválida: {quantidade!r} (deve ser um inteiro maior que zero)")
+
+    def registrar_venda(self, id_p, quantidade):
+        # Uma única instrução confere o estoque e grava a venda: não há leitura seguida de escrita
+        # em que outro terminal possa vender a mesma unidade. O gatilho vendas_ai soma qtd_saida,
+        # valor_total_venda_centavos e o resumo diário.
+        self._conferir_quantidade(quantidade)
+        with self.transacao() as conn:
+            inseridas = conn.execute('''
+                INSERT INTO vendas (produto_id, quantidade, preco_unitario_centavos, custo_unitario_centavos,
+                                    valor_total_centavos)
+                SELECT id, ?, preco_venda_centavos, preco_compra_centavos, preco_venda_centavos * ?
+                FROM mercadorias WHERE id = ? AND restante >= ?
+            ''', (quantidade, quantidade, id_p, quantidade)).rowcount
+            if inseridas == 0:
+                if conn.execute('SELECT 1 FROM mercadorias WHERE id = ?', (id_p,)).fetchone() is None:
+                    raise ProdutoNaoEncontradoError(id_p)
+                raise EstoqueInsuficienteError(id_p)
+
+    def registrar_vendas(self, itens):
+        # Lote de (id, quantidade) numa única transação: ou todas as vendas entram, ou nenhuma
+        registradas = 0
+        with self.transacao():
+            for id_p, quantidade in itens:
+                self.registrar_venda(id_p, quantidade)
+                registradas += 1
+        return registradas
+
+    def adicionar_estoque(self, id_p, quantidade):
+        self._conferir_quantidade(quantidade)
+        with self.transacao() as conn:
+            if self._inserir_entrada(conn, id_p, quantidade) == 0:
+                raise ProdutoNaoEncontradoError(id_p)
+
+    def adicionar_estoques(self, itens):
+        # Lote de (id, quantidade) numa única transação
+        registradas = 0
+        with self.transacao():
+            for id_p, quantidade in itens:
+                self.adicionar_estoque(id_p, quantidade)
+                registradas += 1
+        return registradas
+
+    @staticmethod
+    def _inserir_entrada(conn, id_p, quantidade):
+        # O gatilho entradas_ai atualiza qtd_comprada e valor_total_compra_centavos
+        return conn.execute('''
+            INSERT INTO entradas (produto_id, quantidade, custo_unitario_centavos, valor_total_centavos)
+            SELECT id, ?, preco_compra_centavos, preco_compra_centavos * ? FROM mercadorias WHERE id = ?
+        ''', (quantidade, quantidade, id_p)).rowcount
+
+    def excluir_mercadoria(self, id_p):
+        # O gatilho mercadorias_imagem_ad põe a imagem na fila de órfãs se ninguém mais a usa
+        self.executar('DELETE FROM mercadorias WHERE id = ?', (id_p,))
+
+    # === ALERTAS DE REPOSIÇÃO ===
+    def definir_estoque_minimo(self, id_p, minimo):
+        # 0 desliga o alerta; os gatilhos incluem ou tiram a mercadoria de alertas_estoque
+        if minimo < 0:
+            raise ValueError("o estoque mínimo não pode ser negativo")
+        if self.executar("UPDATE mercadorias SET estoque_minimo = ? WHERE id = ?", (minimo, id_p)).rowcount == 0:
+            raise ProdutoNaoEncontradoError(id_p)
+
+    def alertas_estoque(self):
+        # [(id, nome, restante, estoque_minimo, preço de compra em reais, desde)], as mais urgentes
+        # (menor fração do mínimo) primeiro. CROSS JOIN fixa a ordem: percorre alertas_estoque e busca
+        # cada mercadoria pela chave, sem que o planejador prefira varrer o catálogo inteiro.
+        return self.consultar('''
+            SELECT m.id, m.nome, m.restante, m.estoque_minimo, m.preco_compra_centavos / 100.0, a.desde
+            FROM alertas_estoque a CROSS JOIN mercadorias m ON m.id = a.produto_id
+            ORDER BY CAST(m.restante AS REAL) / m.estoque_minimo, m.id
+        ''')
+
+    def contar_alertas_estoque(self):
+        return self.consultar_um("SELECT count(*) FROM alertas_estoque")[0]
+
+    # === IMAGENS (ARMAZÉM POR HASH) ===
+    def imagens_orfas(self):
+        return self.consultar("SELECT hash FROM imagens_orfas")
+
+    def descartar_imagem_orfa(self, imagem_hash):
+        # Tira o hash da fila; devolve True se ele continua sem nenhuma mercadoria (pode apagar o arquivo)
+        with self.transacao() as conn:
+            conn.execute("DELETE FROM imagens_orfas WHERE hash = ?", (imagem_hash,))
+            return conn.execute("SELECT 1 FROM mercadorias WHERE imagem_hash = ? LIMIT 1",
+                                (imagem_hash,)).fetchone() is None
+
+    def enfileirar_imagens_orfas(self, hashes):
+        # Põe na fila os hashes que nenhuma mercadoria usa (arquivos guardados por uma operação desfeita)
+        with self.transacao() as conn:
+            conn.executemany('''
+                INSERT OR IGNORE INTO imagens_orfas (hash)
+                SELECT ? WHERE NOT EXISTS (SELECT 1 FROM mercadorias WHERE imagem_hash = ?)
+            ''', ((h, h) for h in hashes))
+
+    def imagens_sem_hash(self):
+        # [(id, imagem_path)] de mercadorias ainda com imagem no formato antigo
+        return self.consultar('''
+            SELECT id, imagem_path FROM mercadorias
+            WHERE imagem_hash IS NULL AND imagem_path IS NOT NULL AND imagem_path != ''
+        ''')
+
+    def definir_imagens(self, atualizacoes):
+        # [(imagem_hash, imagem_path, id)] numa única transação
+        with self.transacao() as conn:
+            conn.executemany("UPDATE mercadorias SET imagem_hash = ?, imagem_path = ? WHERE id = ?", atualizacoes)
+
+    # === CONSULTAS SOBRE O LIVRO-RAZÃO ===
+    def vendas_do_produto(self, id_p, inicio, fim):
+        # (quantidade, receita em reais) de um produto no intervalo [inicio, fim) — usa idx_vendas_produto_data
+        return self.consultar_um('''
+            SELECT COALESCE(SUM(quantidade), 0), COALESCE(SUM(valor_total_centavos), 0) / 100.0
+            FROM vendas WHERE produto_id = ? AND data_hora >= ? AND data_hora < ?
+        ''', (id_p, inicio, fim))
+
+    def receita_por_dia(self, inicio, fim):
+        # [(dia, quantidade, receita, lucro)] a partir do resumo diário, em reais
+        return self.consultar('''
+            SELECT dia, SUM(quantidade), SUM(receita_centavos) / 100.0,
+                   SUM(receita_centavos - custo_centavos) / 100.0
+            FROM resumo_vendas_diario WHERE dia >= ? AND dia < ?
+            GROUP BY dia ORDER BY dia
+        ''', (inicio, fim))
+
+    # === CONTROLE ===
+    def versao_dados(self):
+        return self.consultar_um("SELECT valor FROM controle WHERE chave = 'versao_dados'")[0]
+
+    # === FILA DE ESCRITA ===
+    def marcar_operacao_aplicada(self, id_operacao):
+        # False se a operação já tinha sido gravada (reaplicação do diário depois de uma queda)
+        return self.executar('''
+            INSERT OR IGNORE INTO operacoes_aplicadas (id, gravada_em) VALUES (?, datetime('now'))
+        ''', (id_operacao,)).rowcount == 1
+
+    def limpar_operacoes_aplicadas(self, ids=()):
+        # Retira os ids dados (operações de um diário já esvaziado) e os gravados há mais de
+        # VALIDADE_OPERACOES_APLICADAS dias. Nunca a tabela inteira: no banco compartilhado, ids de outros
+        # terminais ainda podem estar no diário deles, à espera de uma reaplicação depois de uma queda.
+        with self.transacao() as conn:
+            conn.executemany("DELETE FROM operacoes_aplicadas WHERE id = ?", ((i,) for i in ids))
+            conn.execute("DELETE FROM operacoes_aplicadas WHERE gravada_em < datetime('now', ?)",
+                         (f"-{self.VALIDADE_OPERACOES_APLICADAS} days",))
@@ -0,0 +1,213 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+# Instrumentação de desempenho: latência e linhas de cada instrução SQL do DatabaseManager e tempos de
+# telas, diálogos, relatórios e miniaturas, num buffer circular. Desligada, não custa nada: as conexões
+# são sqlite3.Connection comuns e medir() devolve um contexto vazio.
+# Liga com ESTOQUEPLUS_DESEMPENHO=1; ESTOQUEPLUS_DESEMPENHO_LOG=arquivo.jsonl grava cada medição.
+
+CAPACIDADE = 5000  # Medições mantidas em memória (as mais antigas saem primeiro)
+
+SQL = "sql"
+TELA = "tela"
+DIALOGO = "diálogo"
+TAREFA = "tarefa"  # Relatórios, importação e backup em segundo plano
+IMAGEM = "imagem"
+
+ativo = False
+medicoes = deque(maxlen=CAPACIDADE)
+_log = None
+_lock_log = threading.Lock()
+_SEM_MEDICAO = nullcontext()
+_ESPACOS = re.compile(r"\s+")
+
+
+class Medicao:
+    __slots__ = ("instante", "categoria", "nome", "ms", "linhas")
+
+    def __init__(self, categoria, nome, ms=0.0, linhas=None):
+        self.instante = time.time()
+        self.categoria = categoria
+        self.nome = nome
+        self.ms = ms
+        self.linhas = linhas
+
+    def como_dict(self):
+        return {"instante": round(self.instante, 3), "categoria": self.categoria, "nome": self.nome,
+                "ms": round(self.ms, 3), "linhas": self.linhas}
+
+
+# === LIGAR / DESLIGAR ===
+def ativar(caminho_log=None):
+    global ativo, _log
+    ativo = True
+    if caminho_log and _log is None:
+        pasta = os.path.dirname(caminho_log)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        _log = open(caminho_log, "a", encoding="utf-8", buffering=1)
+
+
+def desativar():
+    global ativo, _log
+    ativo = False
+    with _lock_log:
+        if _log is not None:
+            _log.close()
+            _log = None
+
+
+def ativar_pelo_ambiente(forcar=False):
+    if forcar or os.environ.get("ESTOQUEPLUS_DESEMPENHO") == "1" or os.environ.get("ESTOQUEPLUS_DESEMPENHO_LOG"):
+        ativar(os.environ.get("ESTOQUEPLUS_DESEMPENHO_LOG"))
+    return ativo
+
+
+def limpar():
+    medicoes.clear()
+
+
+# === REGISTRO ===
+def _guardar(medicao):
+    medicoes.append(medicao)  # deque.append é atômico: seguro entre threads
+    if _log is not None:
+        with _lock_log:
+            if _log is not None:
+                _log.write(json.dumps(medicao.como_dict(), ensure_ascii=False) + "\n")
+
+
+def registrar(categoria, nome, segundos, linhas=None):
+    if ativo:
+        _guardar(Medicao(categoria, nome, segundos * 1000, linhas))
+
+
+@contextmanager
+def _medindo(categoria, nome):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        _guardar(Medicao(categoria, nome, (time.perf_counter() - inicio) * 1000))
+
+
+def medir(categoria, nome):
+    # with desempenho.medir(TELA, "listar mercadorias"): ...
+    return _medindo(categoria, nome) if ativo else _SEM_MEDICAO
+
+
+def resumo():
+    # [(categoria, nome, chamadas, total_ms, media_ms, max_ms, linhas)] do maior tempo total ao menor
+    grupos = {}
+    for m in list(medicoes):
+        g = grupos.setdefault((m.categoria, m.nome), [0, 0.0, 0.0, 0])
+        g[0] += 1
+        g[1] += m.ms
+        g[2] = max(g[2], m.ms)
+        g[3] += m.linhas or 0
+    linhas = [(categoria, nome, n, total, total / n, maximo, qtd)
+              for (categoria, nome), (n, total, maximo, qtd) in grupos.items()]
+    linhas.sort(key=lambda linha: linha[3], reverse=True)
+    return linhas
+
+
+# === CONEXÃO E CURSOR INSTRUMENTADOS ===
+def _normalizar(sql):
+    return _ESPACOS.sub(" ", sql).strip()[:200]
+
+
+class CursorInstrumentado(sqlite3.Cursor):
+    # Uma medição por instrução: o execute (que já roda o primeiro passo) mais as leituras seguintes.
+    # Ela é gravada quando o cursor executa outra instrução, se esgota, é fechado ou descartado.
+    _medicao = None
+
+    def _concluir(self):
+        medicao, self._medicao = self._medicao, None
+        if medicao is not None:
+            if medicao.linhas is None and self.rowcount >= 0:
+                medicao.linhas = self.rowcount  # INSERT/UPDATE/DELETE
+            _guardar(medicao)
+
+    def _executar(self, metodo, sql, parametros):
+        self._concluir()
+        medicao = Medicao(SQL, _normalizar(sql))
+        inicio = time.perf_counter()
+        try:
+            return metodo(sql, parametros)
+        finally:
+            medicao.ms = (time.perf_counter() - inicio) * 1000
+            self._medicao = medicao
+
+    def execute(self, sql, parametros=()):
+        return self._executar(super().execute, sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self._executar(super().executemany, sql, parametros)
+
+    def _somar(self, inicio, lidas):
+        medicao = self._medicao
+        if medicao is not None:
+            medicao.ms += (time.perf_counter() - inicio) * 1000
+            medicao.linhas = (medicao.linhas or 0) + lidas
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        linha = super().fetchone()
+        self._somar(inicio, linha is not None)
+        if linha is None:
+            self._concluir()
+        return linha
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        linhas = super().fetchmany(size or self.arraysize)
+        self._somar(inicio, len(linhas))
+        if not linhas:
+            self._concluir()
+        return linhas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        linhas = super().fetchall()
+        self._somar(inicio, len(linhas))
+        self._concluir()
+        return linhas
+
+    def __next__(self):
+        inicio = time.perf_counter()
+        try:
+            linha = super().__next__()
+        except StopIteration:
+            self._concluir()
+            raise
+        self._somar(inicio, 1)
+        return linha
+
+    def close(self):
+        self._concluir()
+        super().close()
+
+    def __del__(self):
+        self._concluir()
+
+
+class ConexaoInstrumentada(sqlite3.Connection):
+    # Connection.execute do sqlite3 cria um cursor comum por dentro: aqui ele passa pelo instrumentado
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+
+def fabrica_conexao():
+    # Para sqlite3.connect(factory=...): só conexões abertas com a instrumentação ligada são medidas
+    return ConexaoInstrumentada if ativo else sqlite3.Connection
@@ -0,0 +1,15 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+# O banco guarda dinheiro em centavos inteiros (colunas *_centavos): somas e multiplicações são exatas.
+# Formulários, CSV, relatórios e a API continuam em reais; a conversão fica só nas bordas.
+
+
+def centavos(reais):
+    # Decimal(str(...)) usa o número como foi digitado: 19.99 vira 1999, não 1998
+    if reais is None:
+        return None
+    return int((Decimal(str(reais)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def reais(valor_centavos):
+    return None if valor_centavos is None else valor_centavos / 100
@@ -0,0 +1,152 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+from estoqueplus.database import EstoqueInsuficienteError, ProdutoNaoEncontradoError
+from estoqueplus.imagens import abandonar_imagens, coletar_orfas, guardar_imagem
+
+# === FILA DE ESCRITA: OPERAÇÕES, DIÁRIO E GRAVAÇÃO EM LOTE ===
+# A interface não grava no banco: ela enfileira operações que uma thread de escrita aplica em lotes,
+# um COMMIT por lote. Cada operação é anotada num diário .jsonl antes de entrar na fila e marcada
+# em operacoes_aplicadas na mesma transação que a grava; se o programa fechar no meio, o que ficou
+# no diário é reaplicado na próxima abertura, sem repetir o que já foi gravado.
+# Durabilidade: nem o COMMIT (WAL com synchronous = NORMAL, fsync só no checkpoint) nem o diário
+# (flush, sem fsync) esperam o disco. Uma queda do programa não perde nada, pois o sistema
+# operacional já tem os dados; uma queda de energia pode perder os últimos lotes e operações.
+
+VENDA = "venda"
+ENTRADA = "entrada"
+CADASTRO = "cadastro"
+EXCLUSAO = "exclusao"
+CAIXA = "caixa"  # Venda do caixa: vários itens, gravados todos ou nenhum
+
+# Falhas de uma operação que não derrubam as outras do lote
+ERROS_OPERACAO = (EstoqueInsuficienteError, ProdutoNaoEncontradoError, sqlite3.IntegrityError, OSError,
+                  ValueError, KeyError)
+
+
+class Operacao:
+    __slots__ = ("id", "tipo", "dados")
+
+    def __init__(self, tipo, dados, id_operacao=None):
+        self.id = id_operacao or uuid.uuid4().hex
+        self.tipo = tipo
+        self.dados = dados
+
+    def como_dict(self):
+        return {"id": self.id, "tipo": self.tipo, "dados": self.dados}
+
+    @classmethod
+    def de_dict(cls, registro):
+        return cls(registro["tipo"], registro["dados"], registro["id"])
+
+
+class DiarioOperacoes:
+    # Arquivo .jsonl com as operações enfileiradas e ainda não gravadas. Cada linha vai para o
+    # sistema operacional (flush, sem fsync) antes de a operação entrar na fila: fechar ou derrubar o
+    # programa não a perde, faltar energia pode perder. Quando nada mais está pendente, o arquivo é esvaziado.
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self.recuperadas = self._ler()
+        self.pendentes = len(self.recuperadas)
+        self._arquivo = open(caminho, "a", encoding="utf-8")
+
+    @classmethod
+    def do_banco(cls, db_name):
+        return cls(db_name + "-pendentes.jsonl")
+
+    def _ler(self):
+        if not os.path.exists(self.caminho):
+            return []
+        operacoes = []
+        with open(self.caminho, encoding="utf-8") as arquivo:
+            for linha in arquivo:
+                try:
+                    operacoes.append(Operacao.de_dict(json.loads(linha)))
+                except (ValueError, KeyError):
+                    pass  # Última linha cortada no meio da escrita: a operação não chegou à fila
+        return operacoes
+
+    def registrar(self, operacao):
+        with self._lock:
+            self._arquivo.write(json.dumps(operacao.como_dict(), ensure_ascii=False) + "\n")
+            self._arquivo.flush()
+            self.pendentes += 1
+
+    def concluir(self, quantidade):
+        # Devolve True se o diário foi esvaziado (nenhuma operação pendente)
+        with self._lock:
+            self.pendentes -= quantidade
+            if self.pendentes > 0:
+                return False
+            self._arquivo.seek(0)
+            self._arquivo.truncate()
+            return True
+
+    def fechar(self):
+        with self._lock:
+            self._arquivo.close()
+
+
+def aplicar(db_manager, operacao, guardadas=None):
+    # guardadas: lista que recebe o hash das imagens copiadas para o armazém
+    d = operacao.dados
+    if operacao.tipo == VENDA:
+        db_manager.registrar_venda(d["id"], d["quantidade"])
+    elif operacao.tipo == ENTRADA:
+        db_manager.adicionar_estoque(d["id"], d["quantidade"])
+    elif operacao.tipo == CADASTRO:
+        digest = destino = None
+        if d.get("imagem"):
+            digest, destino = guardar_imagem(d["imagem"])
+            if guardadas is not None:
+                guardadas.append(digest)
+        # Devolve se a mercadoria já existia (atualização)
+        return db_manager.cadastrar_mercadoria(d["id"], d["nome"], d["preco_compra"], d["preco_venda"],
+                                               d["quantidade"], d["descricao"], destino, digest,
+                                               d.get("estoque_minimo"))
+    elif operacao.tipo == EXCLUSAO:
+        db_manager.excluir_mercadoria(d["id"])
+    elif operacao.tipo == CAIXA:
+        # Dentro do SAVEPOINT da operação: um item recusado desfaz a venda inteira
+        return db_manager.registrar_vendas(d["itens"])
+    else:
+        raise ValueError(f"operação desconhecida: {operacao.tipo}")
+    return None
+
+
+def aplicar_lote(db_manager, operacoes, limpar_aplicadas=None):
+    # Uma transação para o lote inteiro, um SAVEPOINT por operação: a que falha é desfeita sozinha.
+    # limpar_aplicadas: ids de um diário já esvaziado a retirar de operacoes_aplicadas (junto com os
+    # vencidos); None não limpa nada. Devolve [(operacao, resultado, erro)] na ordem recebida.
+    resultados = []
+    # O arquivo de um cadastro vai para o armazém antes do SAVEPOINT: se a linha não fica gravada,
+    # o hash entra na fila de órfãs para a coleta apagar o arquivo
+    guardadas = []
+    try:
+        with db_manager.transacao():
+            if limpar_aplicadas is not None:
+                db_manager.limpar_operacoes_aplicadas(limpar_aplicadas)
+            for operacao in operacoes:
+                antes = len(guardadas)
+                try:
+                    with db_manager.subtransacao("operacao"):
+                        if not db_manager.marcar_operacao_aplicada(operacao.id):
+                            resultados.append((operacao, None, None))  # Já gravada antes de uma queda
+                            continue
+                        resultado = aplicar(db_manager, operacao, guardadas)
+                except ERROS_OPERACAO as e:
+                    if len(guardadas) > antes:
+                        db_manager.enfileirar_imagens_orfas(guardadas[antes:])
+                    resultados.append((operacao, None, e))
+                else:
+                    resultados.append((operacao, resultado, None))
+    except BaseException:
+        abandonar_imagens(db_manager, guardadas)  # O lote inteiro foi desfeito
+        raise
+    if any(op.tipo in (CADASTRO, EXCLUSAO) and erro is None for op, _r, erro in resultados):
+        coletar_orfas(db_manager)  # Imagens trocadas ou de mercadorias excluídas
+    return resultados
@@ -0,0 +1,142 @@
+import glob
+import hashlib
+import os
+
+PASTA_GRAFICOS = os.path.join("cache", "graficos")
+TOP_PRODUTOS = 15          # Barras individuais; o restante vira "Outros"
+PERIODOS = (               # (nome, formato strftime, a partir de quantos dias de histórico)
+    ("mês", "%Y-%m", 120),
+    ("semana", "%Y-S%W", 35),
+    ("dia", "%Y-%m-%d", 0),
+)
+
+
+class GraficoCancelado(Exception):
+    pass
+
+
+def _moeda(valor):
+    return f"R${valor or 0:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+# === AGREGAÇÕES NO SQLITE ===
+def lucro_por_produto(db_manager, limite=TOP_PRODUTOS):
+    # [(nome, lucro)] dos `limite` produtos mais lucrativos, mais uma linha "Outros" com a soma do resto
+    return db_manager.consultar('''
+        WITH ranking AS (
+            SELECT nome, lucro_centavos AS lucro,
+                   ROW_NUMBER() OVER (ORDER BY lucro_centavos DESC, id DESC) AS posicao
+            FROM mercadorias
+        )
+        SELECT nome, lucro / 100.0 FROM (
+            SELECT nome, lucro, posicao FROM ranking WHERE posicao <= ?
+            UNION ALL
+            SELECT 'Outros (' || COUNT(*) || ')', SUM(lucro), ? + 1
+            FROM ranking WHERE posicao > ? HAVING COUNT(*) > 0
+        ) ORDER BY posicao
+    ''', (limite, limite, limite))
+
+
+def lucro_por_periodo(db_manager):
+    # (nome do período, [(período, lucro)]) a partir do resumo diário do livro-razão;
+    # o período cresce com o histórico para o gráfico não virar uma barra por dia durante anos
+    dias = db_manager.consultar_um('''
+        SELECT julianday(MAX(dia)) - julianday(MIN(dia)) FROM resumo_vendas_diario
+    ''')[0]
+    if dias is None:
+        return None, []
+    for nome, formato, minimo in PERIODOS:
+        if dias >= minimo:
+            break
+    return nome, db_manager.consultar('''
+        SELECT strftime(?, dia), SUM(receita_centavos - custo_centavos) / 100.0
+        FROM resumo_vendas_diario GROUP BY 1 ORDER BY 1
+    ''', (formato,))
+
+
+# === GRÁFICO DE LUCRO (AGG, SEM PYPLOT, COM CACHE POR VERSÃO DOS DADOS) ===
+def _prefixo(db_manager):
+    # A versão dos dados é só um contador: outro banco (uma filial, um backup, --db) aberto da mesma
+    # pasta pode estar na mesma versão. O hash do caminho do banco separa os gráficos de cada um.
+    banco = hashlib.sha1(os.path.abspath(db_manager.db_name).encode("utf-8")).hexdigest()[:12]
+    return f"lucro_{banco}"
+
+
+def _caminho_em_cache(pasta, db_manager, versao, limite):
+    return os.path.join(pasta, f"{_prefixo(db_manager)}_v{versao}_top{limite}.png")
+
+
+def grafico_em_cache(db_manager, pasta=PASTA_GRAFICOS, limite=TOP_PRODUTOS):
+    # Caminho do PNG se o banco não mudou desde a última renderização; senão None
+    caminho = _caminho_em_cache(pasta, db_manager, db_manager.versao_dados(), limite)
+    return caminho if os.path.exists(caminho) else None
+
+
+def gerar_grafico_lucro(db_manager, pasta=PASTA_GRAFICOS, limite=TOP_PRODUTOS, progresso=None, cancelar=None):
+    versao = db_manager.versao_dados()
+    caminho = _caminho_em_cache(pasta, db_manager, versao, limite)
+    if os.path.exists(caminho):
+        return caminho
+
+    # Só a interface orientada a objetos do matplotlib: seguro fora da thread da interface
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.ticker import FuncFormatter
+
+    produtos = lucro_por_produto(db_manager, limite)
+    nome_periodo, periodos = lucro_por_periodo(db_manager)
+    if progresso:
+        progresso(30)
+    if cancelar and cancelar():
+        raise GraficoCancelado()
+
+    formato_moeda = FuncFormatter(lambda valor, _pos: _moeda(valor))
+    figura = Figure(figsize=(10, 9 if periodos else 5), dpi=100, layout="constrained")
+    FigureCanvasAgg(figura)
+
+    eixos = figura.add_subplot(2 if periodos else 1, 1, 1)
+    nomes = [(nome or "")[:30] for nome, _lucro in produtos]
+    lucros = [lucro or 0 for _nome, lucro in produtos]
+    # Barras horizontais, o mais lucrativo em cima; "Outros" fica por último
+    barras = eixos.barh(range(len(nomes)), lucros,
+                        color=["#bbbbbb" if i == limite else "skyblue" for i in range(len(nomes))])
+    eixos.bar_label(barras, labels=[_moeda(lucro) for lucro in lucros], padding=3, fontsize=8)
+    maior_produto = max(lucros[:limite], default=0)
+    if len(lucros) > limite and maior_produto > 0 and lucros[limite] > 3 * maior_produto:
+        # "Outros" somando milhares de produtos achataria as barras individuais: a escala
+        # segue os produtos e a barra de "Outros" aparece cortada, com o valor no rótulo
+        eixos.set_xlim(0, maior_produto * 1.3)
+        eixos.text(maior_produto * 1.28, limite, _moeda(lucros[limite]), ha="right", va="center", fontsize=8)
+    eixos.set_yticks(range(len(nomes)), nomes)
+    eixos.invert_yaxis()
+    eixos.xaxis.set_major_formatter(formato_moeda)
+    eixos.set_title(f"Lucro por Produto (top {limite})")
+    eixos.set_xlabel("Lucro (R$)")
+
+    if periodos:
+        eixos = figura.add_subplot(2, 1, 2)
+        rotulos = [periodo for periodo, _lucro in periodos]
+        eixos.bar(range(len(rotulos)), [lucro or 0 for _periodo, lucro in periodos], color="seagreen")
+        # No máximo ~24 rótulos no eixo, para não sobrepor
+        passo = max(1, len(rotulos) // 24)
+        eixos.set_xticks(range(0, len(rotulos), passo), rotulos[::passo], rotation=45, ha="right")
+        eixos.yaxis.set_major_formatter(formato_moeda)
+        eixos.set_title(f"Lucro por {nome_periodo}")
+        eixos.set_ylabel("Lucro (R$)")
+
+    if progresso:
+        progresso(60)
+    if cancelar and cancelar():
+        raise GraficoCancelado()
+
+    os.makedirs(pasta, exist_ok=True)
+    temporario = caminho + ".tmp"
+    figura.savefig(temporario, format="png")
+    os.replace(temporario, caminho)
+    # Versões antigas deste gráfico (deste banco) não serão mais usadas
+    for antigo in glob.glob(os.path.join(pasta, f"{_prefixo(db_manager)}_v*_top{limite}.png")):
+        if antigo != caminho:
+            os.remove(antigo)
+    if progresso:
+        progresso(100)
+    return caminho
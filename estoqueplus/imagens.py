@@ -0,0 +1,154 @@
+import glob
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+
+PASTA_IMAGENS = "imagens"
+PASTA_PRODUTOS = os.path.join(PASTA_IMAGENS, "produtos")
+RESOLUCAO_MAXIMA = 1024     # Lado maior das imagens guardadas (com Pillow instalado)
+QUALIDADE_JPEG = 88
+CARENCIA_COLETA = 60        # Segundos: imagem recém-gravada pode estar a caminho de ser referenciada
+
+
+# === ARMAZÉM DE IMAGENS ENDEREÇADO POR CONTEÚDO ===
+# Cada imagem fica uma única vez em imagens/produtos/<2 primeiros dígitos>/<sha256>.<ext>, onde o
+# sha256 é o do arquivo escolhido pelo usuário; as mercadorias guardam o hash (imagem_hash) e o
+# caminho resolvido (imagem_path). A mesma foto escolhida para vários produtos não é duplicada.
+def resumo_arquivo(caminho):
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def _do_armazem(origem, pasta):
+    # Arquivo que já está no armazém: o nome é o próprio hash
+    pasta_abs = os.path.abspath(pasta)
+    origem_abs = os.path.abspath(origem)
+    if os.path.dirname(os.path.dirname(origem_abs)) != pasta_abs:
+        return None
+    digest = os.path.splitext(os.path.basename(origem_abs))[0]
+    return digest if len(digest) == 64 and os.path.basename(os.path.dirname(origem_abs)) == digest[:2] else None
+
+
+def localizar_imagem(digest, pasta=PASTA_PRODUTOS):
+    encontrados = [c for c in glob.glob(os.path.join(pasta, digest[:2], digest + ".*")) if not c.endswith(".tmp")]
+    return encontrados[0] if encontrados else None
+
+
+def _temporario(destino_sem_ext, ext):
+    # Nome único: a importação guarda imagens em várias threads, às vezes a mesma ao mesmo tempo
+    return f"{destino_sem_ext}{ext}.{uuid.uuid4().hex[:12]}.tmp"
+
+
+def _normalizar(origem, destino_sem_ext):
+    # Corrige a orientação EXIF e reduz para RESOLUCAO_MAXIMA. Sem Pillow (opcional), ou se ele não
+    # entender o arquivo, a imagem é guardada como veio. Devolve (arquivo temporário gravado, extensão).
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        Image = None
+    if Image is not None:
+        try:
+            with Image.open(origem) as imagem:
+                orientacao = imagem.getexif().get(0x0112, 1)
+                if max(imagem.size) <= RESOLUCAO_MAXIMA and orientacao == 1 and imagem.format in ("JPEG", "PNG"):
+                    ext = ".jpg" if imagem.format == "JPEG" else ".png"
+                    temporario = _temporario(destino_sem_ext, ext)
+                    shutil.copyfile(origem, temporario)  # Já está no tamanho: sem perda de recompressão
+                    return temporario, ext
+                imagem = ImageOps.exif_transpose(imagem)
+                imagem.thumbnail((RESOLUCAO_MAXIMA, RESOLUCAO_MAXIMA), Image.LANCZOS)
+                transparente = imagem.mode in ("RGBA", "LA", "P")
+                ext = ".png" if transparente else ".jpg"
+                temporario = _temporario(destino_sem_ext, ext)
+                try:
+                    if transparente:
+                        imagem.save(temporario, "PNG", optimize=True)
+                    else:
+                        imagem.convert("RGB").save(temporario, "JPEG", quality=QUALIDADE_JPEG, optimize=True)
+                except BaseException:
+                    if os.path.exists(temporario):
+                        os.remove(temporario)
+                    raise
+                return temporario, ext
+        except (OSError, ValueError, Image.DecompressionBombError):
+            pass
+    ext = os.path.splitext(origem)[1].lower()
+    temporario = _temporario(destino_sem_ext, ext)
+    shutil.copyfile(origem, temporario)
+    return temporario, ext
+
+
+def guardar_imagem(origem, pasta=PASTA_PRODUTOS):
+    # Devolve (hash, caminho no armazém). Se a imagem já estiver guardada, nada é gravado.
+    digest = _do_armazem(origem, pasta) or resumo_arquivo(origem)
+    existente = localizar_imagem(digest, pasta)
+    if existente:
+        # Renova a data: a coleta de órfãs não apaga o que acabou de ser escolhido de novo
+        os.utime(existente)
+        return digest, existente
+    subpasta = os.path.join(pasta, digest[:2])
+    os.makedirs(subpasta, exist_ok=True)
+    temporario, ext = _normalizar(origem, os.path.join(subpasta, digest))
+    destino = os.path.join(subpasta, digest + ext)
+    os.replace(temporario, destino)
+    return digest, destino
+
+
+def abandonar_imagens(db_manager, hashes):
+    # Imagens guardadas por uma gravação que foi desfeita (importação, cadastro recusado): o arquivo
+    # ficou no armazém, e os hashes que nenhuma mercadoria usa entram na fila de órfãs
+    if not hashes:
+        return
+    try:
+        db_manager.enfileirar_imagens_orfas(hashes)
+    except sqlite3.Error:
+        pass  # Não encobre o erro que desfez a gravação; sobram só arquivos sem referência
+
+
+def coletar_orfas(db_manager, pasta=PASTA_PRODUTOS):
+    # Apaga as imagens que os gatilhos puseram na fila imagens_orfas e que continuam sem referência.
+    # Devolve quantas foram removidas.
+    removidas = 0
+    agora = time.time()
+    for (digest,) in db_manager.imagens_orfas():
+        caminho = localizar_imagem(digest, pasta)
+        if caminho and agora - os.path.getmtime(caminho) < CARENCIA_COLETA:
+            continue  # Fica na fila para a próxima coleta
+        if db_manager.descartar_imagem_orfa(digest):
+            if caminho:
+                os.remove(caminho)
+                removidas += 1
+    return removidas
+
+
+# === MIGRAÇÃO DAS IMAGENS ANTIGAS (imagens/{id}_{nome}.ext) ===
+def migrar_imagens(db_manager, pasta=PASTA_PRODUTOS):
+    # Move para o armazém as imagens de mercadorias que ainda não têm hash; as cópias antigas
+    # que deixam de ser usadas são apagadas. Sem nada para migrar, custa uma consulta.
+    pendentes = db_manager.imagens_sem_hash()
+    if not pendentes:
+        return 0
+    antigas = set()
+    atualizacoes = []
+    for id_p, imagem_path in pendentes:
+        # Bancos criados no Windows guardam "imagens\\arquivo.png"
+        caminho = os.path.normpath(imagem_path.replace("\\", "/"))
+        if not os.path.isfile(caminho):
+            continue
+        digest, destino = guardar_imagem(caminho, pasta)
+        atualizacoes.append((digest, destino, id_p))
+        if os.path.abspath(caminho) != os.path.abspath(destino):
+            antigas.add(os.path.abspath(caminho))
+    db_manager.definir_imagens(atualizacoes)
+    # Só as cópias do formato antigo, feitas pelo sistema dentro de imagens/, são apagadas
+    pasta_antiga = os.path.abspath(PASTA_IMAGENS)
+    for caminho in antigas:
+        if os.path.dirname(caminho) == pasta_antiga and os.path.exists(caminho):
+            os.remove(caminho)
+    return len(atualizacoes)
@@ -0,0 +1,182 @@
+import csv
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from estoqueplus.dinheiro import centavos
+from estoqueplus.imagens import abandonar_imagens, guardar_imagem
+
+# Colunas aceitas no CSV (cabeçalho obrigatório). Só "id" é exigida: linhas com apenas
+# id e qtd_comprada são entradas de estoque de mercadorias já cadastradas, e com apenas id e
+# estoque_minimo definem o alerta de reposição (vazio mantém o atual).
+COLUNAS = ("id", "nome", "preco_compra", "preco_venda", "qtd_comprada", "descricao", "imagem", "estoque_minimo")
+
+LinhaImportacao = namedtuple("LinhaImportacao", "numero id nome preco_compra preco_venda qtd_comprada descricao "
+                                                "imagem estoque_minimo")
+ResultadoImportacao = namedtuple("ResultadoImportacao", "mercadorias entradas rejeitadas erros cancelada")
+
+TAMANHO_LOTE = 5000
+MAX_ERROS_GUARDADOS = 100
+
+
+class ImportacaoCancelada(Exception):
+    pass
+
+
+# === LEITURA EM FLUXO DO CSV ===
+def ler_csv(caminho, progresso=None):
+    # Gerador: nunca carrega o arquivo inteiro. Aceita "," ou ";" como separador.
+    tamanho = os.path.getsize(caminho) or 1
+    with open(caminho, newline="", encoding="utf-8-sig") as arquivo:
+        amostra = arquivo.read(8192)
+        arquivo.seek(0)
+        try:
+            dialeto = csv.Sniffer().sniff(amostra, delimiters=",;\t")
+        except csv.Error:
+            dialeto = csv.excel
+
+        lidos = [0]
+
+        def linhas():
+            for linha in arquivo:
+                lidos[0] += len(linha.encode("utf-8"))
+                yield linha
+
+        leitor = csv.DictReader(linhas(), dialect=dialeto)
+        leitor.fieldnames = [(c or "").strip().lower() for c in (leitor.fieldnames or [])]
+        if "id" not in leitor.fieldnames:
+            raise ValueError("O CSV precisa de um cabeçalho com a coluna 'id'.")
+        for numero, registro in enumerate(leitor, start=2):
+            yield numero, registro
+            if progresso and numero % 1000 == 0:
+                progresso(min(99, lidos[0] * 100 // tamanho))
+
+
+def _numero(texto, tipo=float):
+    texto = (texto or "").strip()
+    if not texto:
+        return None
+    if tipo is float and "," in texto:
+        # Formato brasileiro: 1.234,56
+        texto = texto.replace(".", "").replace(",", ".")
+    try:
+        return tipo(texto)
+    except ValueError:
+        raise ValueError(f"número inválido: {texto!r}") from None
+
+
+def validar(numero, registro, pasta_csv):
+    id_p = (registro.get("id") or "").strip()
+    if not id_p:
+        raise ValueError("id vazio")
+    nome = (registro.get("nome") or "").strip()
+    pc = _numero(registro.get("preco_compra"))
+    pv = _numero(registro.get("preco_venda"))
+    qc = _numero(registro.get("qtd_comprada"), int) or 0
+    if qc < 0:
+        raise ValueError("qtd_comprada negativa")
+    minimo = _numero(registro.get("estoque_minimo"), int)
+    if minimo is not None and minimo < 0:
+        raise ValueError("estoque_minimo negativo")
+    if nome or pc is not None or pv is not None:
+        # Linha de cadastro: precisa dos mesmos campos que o formulário exige
+        if not nome or pc is None or pv is None or pc <= 0 or pv <= 0:
+            raise ValueError("cadastro exige nome, preco_compra e preco_venda maiores que zero")
+    elif qc == 0 and minimo is None:
+        raise ValueError("linha sem dados de cadastro, quantidade nem estoque mínimo")
+    imagem = (registro.get("imagem") or "").strip()
+    if imagem and not os.path.isabs(imagem):
+        imagem = os.path.join(pasta_csv, imagem)
+    return LinhaImportacao(numero, id_p, nome, pc, pv, qc, (registro.get("descricao") or "").strip(), imagem,
+                           minimo)
+
+
+def _resolver_imagem(linha):
+    # (hash, caminho no armazém) ou (None, None); a mesma imagem em várias linhas é guardada uma vez
+    if not linha.imagem or not os.path.isfile(linha.imagem):
+        return None, None
+    try:
+        return guardar_imagem(linha.imagem)
+    except OSError:
+        return None, None
+
+
+# === IMPORTAÇÃO EM LOTE ===
+def importar_csv(db_manager, caminho, tamanho_lote=TAMANHO_LOTE, progresso=None, cancelar=None):
+    # Tudo numa única transação: ou o arquivo inteiro entra, ou nada entra (erro/cancelamento).
+    # Linhas inválidas são puladas e relatadas em "erros".
+    pasta_csv = os.path.dirname(os.path.abspath(caminho))
+    erros = []
+    contagem = {"mercadorias": 0, "entradas": 0, "rejeitadas": 0}
+
+    def validas():
+        for numero, registro in ler_csv(caminho, progresso):
+            try:
+                yield validar(numero, registro, pasta_csv)
+            except ValueError as e:
+                contagem["rejeitadas"] += 1
+                if len(erros) < MAX_ERROS_GUARDADOS:
+                    erros.append(f"Linha {numero}: {e}")
+
+    linhas = validas()
+    guardadas = set()  # Hashes que esta importação copiou (ou reaproveitou) no armazém de imagens
+    try:
+        with ThreadPoolExecutor(max_workers=8) as copiadores, db_manager.transacao() as conn:
+            while True:
+                if cancelar and cancelar():
+                    raise ImportacaoCancelada()
+                lote = list(islice(linhas, tamanho_lote))
+                if not lote:
+                    break
+                cadastros = [l for l in lote if l.nome]
+                imagens = list(copiadores.map(_resolver_imagem, cadastros))
+                guardadas.update(digest for digest, _caminho in imagens if digest)
+                conn.executemany('''
+                    INSERT INTO mercadorias (id, nome, preco_compra_centavos, preco_venda_centavos, qtd_comprada,
+                                             qtd_saida, descricao, valor_total_compra_centavos,
+                                             valor_total_venda_centavos, imagem_path, imagem_hash)
+                    VALUES (?, ?, ?, ?, 0, 0, ?, 0, 0, ?, ?)
+                    ON CONFLICT (id) DO UPDATE SET
+                        nome = excluded.nome, preco_compra_centavos = excluded.preco_compra_centavos,
+                        preco_venda_centavos = excluded.preco_venda_centavos, descricao = excluded.descricao,
+                        imagem_path = COALESCE(excluded.imagem_path, imagem_path),
+                        imagem_hash = COALESCE(excluded.imagem_hash, imagem_hash)
+                ''', ((l.id, l.nome, centavos(l.preco_compra), centavos(l.preco_venda), l.descricao,
+                       caminho, digest) for l, (digest, caminho) in zip(cadastros, imagens)))
+                contagem["mercadorias"] += len(cadastros)
+
+                # Entradas viram eventos do livro-razão; o custo é o preço de compra vigente
+                entradas = [(l.qtd_comprada, l.qtd_comprada, l.id) for l in lote if l.qtd_comprada > 0]
+                if entradas:
+                    cursor = conn.executemany('''
+                        INSERT INTO entradas (produto_id, quantidade, custo_unitario_centavos,
+                                              valor_total_centavos)
+                        SELECT id, ?, preco_compra_centavos, preco_compra_centavos * ?
+                        FROM mercadorias WHERE id = ?
+                    ''', entradas)
+                    contagem["entradas"] += cursor.rowcount
+                    # Entrada de id inexistente não insere nada
+                    contagem["rejeitadas"] += len(entradas) - cursor.rowcount
+
+                # Os gatilhos de alertas_estoque acompanham o novo mínimo (e as entradas acima). Linhas
+                # só com id e estoque_minimo contam como mercadorias atualizadas, ou rejeitadas se o id
+                # não existe; as demais já foram contadas pelo cadastro ou pela entrada.
+                com_minimo = [l for l in lote if l.estoque_minimo is not None]
+                if com_minimo:
+                    atualizar = "UPDATE mercadorias SET estoque_minimo = ? WHERE id = ?"
+                    conn.executemany(atualizar, ((l.estoque_minimo, l.id) for l in com_minimo
+                                                 if l.nome or l.qtd_comprada))
+                    so_minimo = [(l.estoque_minimo, l.id) for l in com_minimo if not l.nome and not l.qtd_comprada]
+                    cursor = conn.executemany(atualizar, so_minimo)
+                    contagem["mercadorias"] += cursor.rowcount
+                    contagem["rejeitadas"] += len(so_minimo) - cursor.rowcount
+    except ImportacaoCancelada:
+        abandonar_imagens(db_manager, guardadas)
+        return ResultadoImportacao(0, 0, contagem["rejeitadas"], erros, True)
+    except BaseException:
+        abandonar_imagens(db_manager, guardadas)
+        raise
+    if progresso:
+        progresso(100)
+    return ResultadoImportacao(contagem["mercadorias"], contagem["entradas"], contagem["rejeitadas"], erros, False)
@@ -0,0 +1,187 @@
+import json
+
+from estoqueplus.dinheiro import centavos
+
+# === REGISTRO DE MERCADORIA E REPOSITÓRIO ===
+# As consultas de mercadorias escolhem as colunas pelo nome e devolvem objetos Mercadoria, em vez de
+# tuplas cuja ordem de colunas todo o resto do código precisava conhecer. Cada consulta pode pedir só
+# os campos que vai usar (projeção): a lista, por exemplo, não traz a descrição inteira.
+
+# Campo -> expressão SQL. O banco guarda dinheiro em centavos; os campos chegam em reais.
+CAMPOS = {
+    "id": "id",
+    "nome": "nome",
+    "preco_compra": "preco_compra_centavos / 100.0",
+    "preco_venda": "preco_venda_centavos / 100.0",
+    "qtd_comprada": "qtd_comprada",
+    "qtd_saida": "qtd_saida",
+    "descricao": "descricao",
+    "valor_total_compra": "valor_total_compra_centavos / 100.0",
+    "valor_total_venda": "valor_total_venda_centavos / 100.0",
+    "imagem_path": "imagem_path",
+    "imagem_hash": "imagem_hash",
+    "estoque_minimo": "estoque_minimo",
+    "descricao_curta": "substr(descricao, 1, 30)",  # O que a lista mostra da descrição
+}
+CAMPOS_COMPLETOS = ("id", "nome", "preco_compra", "preco_venda", "qtd_comprada", "qtd_saida", "descricao",
+                    "valor_total_compra", "valor_total_venda", "imagem_path", "imagem_hash", "estoque_minimo")
+# O que a linha da lista pinta
+CAMPOS_LISTA = ("id", "nome", "preco_compra", "preco_venda", "qtd_comprada", "qtd_saida", "descricao_curta",
+                "imagem_path")
+# O que o caixa precisa para lançar um item
+CAMPOS_CAIXA = ("id", "nome", "preco_venda", "qtd_comprada", "qtd_saida")
+
+
+class Mercadoria:
+    # __slots__: sem __dict__ por objeto, o que importa com milhares de linhas carregadas.
+    # Campos fora da projeção consultada ficam None.
+    __slots__ = tuple(CAMPOS)
+
+    def __init__(self, **campos):
+        for campo in self.__slots__:
+            setattr(self, campo, campos.get(campo))
+
+    @classmethod
+    def da_linha(cls, campos, linha):
+        return cls(**dict(zip(campos, linha)))
+
+    @property
+    def restante(self):
+        return self.qtd_comprada - self.qtd_saida
+
+    # Contas de dinheiro em centavos inteiros: (19.99 - 10.5) * 3 em float não dá 28.47 exatos
+    @property
+    def lucro_por_unidade(self):
+        return (centavos(self.preco_venda) - centavos(self.preco_compra)) / 100
+
+    @property
+    def lucro_estimado(self):
+        return (centavos(self.preco_venda) - centavos(self.preco_compra)) * self.qtd_saida / 100
+
+    def __repr__(self):
+        return f"Mercadoria(id={self.id!r}, nome={self.nome!r})"
+
+
+class RepositorioMercadorias:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    @staticmethod
+    def _colunas(campos):
+        return ", ".join(CAMPOS[campo] for campo in campos)
+
+    def _selecionar(self, campos, sql, parametros=()):
+        linhas = self.db_manager.consultar(sql, parametros)
+        return [Mercadoria.da_linha(campos, linha) for linha in linhas]
+
+    def obter(self, id_p, campos=CAMPOS_COMPLETOS):
+        encontradas = self._selecionar(
+            campos, f"SELECT {self._colunas(campos)} FROM mercadorias WHERE id = ?", (id_p,))
+        return encontradas[0] if encontradas else None
+
+    def existe(self, id_p):
+        return self.db_manager.consultar_um("SELECT 1 FROM mercadorias WHERE id = ?", (id_p,)) is not None
+
+    def obter_varios(self, ids, campos=CAMPOS_COMPLETOS):
+        # Uma consulta para qualquer quantidade de ids (sem o limite de parâmetros do SQLite).
+        # Devolve {id: Mercadoria}; ids inexistentes ficam de fora.
+        ids = list(ids)
+        if not ids:
+            return {}
+        if "id" not in campos:
+            campos = ("id",) + tuple(campos)
+        mercadorias = self._selecionar(campos, f'''
+            SELECT {self._colunas(campos)} FROM mercadorias
+            WHERE id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(ids),))
+        return {m.id: m for m in mercadorias}
+
+    def contar(self):
+        return self.db_manager.consultar_um("SELECT count(*) FROM mercadorias")[0]
+
+    def todas(self, campos=CAMPOS_COMPLETOS):
+        return self._selecionar(campos, f"SELECT {self._colunas(campos)} FROM mercadorias")
+
+    def buscar(self, termo, limite, deslocamento=0, campos=CAMPOS_COMPLETOS):
+        # Busca ranqueada no índice FTS5 (peso maior para id e nome); a subconsulta só expõe
+        # rowid e posição, então as colunas da projeção não precisam de prefixo
+        return self._selecionar(campos, f'''
+            SELECT {self._colunas(campos)} FROM (
+                SELECT rowid AS encontrada, bm25(mercadorias_fts, 10.0, 5.0, 1.0) AS posicao
+                FROM mercadorias_fts WHERE mercadorias_fts MATCH ?
+                ORDER BY posicao LIMIT ? OFFSET ?
+            ) JOIN mercadorias ON mercadorias.rowid = encontrada
+            ORDER BY posicao
+        ''', (self.db_manager.expressao_busca(termo), limite, deslocamento))
+
+    def listar(self, ordem, limite, apos=None, campos=CAMPOS_COMPLETOS):
+        # Paginação por chave (keyset): cada página continua da chave (valor, id) da última linha
+        # da anterior, numa busca pelo índice da ordenação; a página 1000 custa o mesmo que a primeira.
+        # Devolve (mercadorias, chaves), com a chave de cada uma para pedir a página seguinte.
+        coluna, direcao = self.db_manager.ORDENACOES[ordem]
+        filtro, parametros = "", (limite,)
+        if apos is not None:
+            filtro = f"WHERE ({coluna}, id) {'>' if direcao == 'ASC' else '<'} (?, ?)"
+            parametros = (*apos, limite)
+        linhas = self.db_manager.consultar(f'''
+            SELECT {self._colunas(campos)}, {coluna}, id FROM mercadorias {filtro}
+            ORDER BY {coluna} {direcao}, id {direcao} LIMIT ?
+        ''', parametros)
+        return ([Mercadoria.da_linha(campos, linha) for linha in linhas],
+                [tuple(linha[-2:]) for linha in linhas])
+
+    def chave_ordenacao(self, ordem, id_p):
+        coluna, _direcao = self.db_manager.ORDENACOES[ordem]
+        linha = self.db_manager.consultar_um(f"SELECT {coluna}, id FROM mercadorias WHERE id = ?", (id_p,))
+        return tuple(linha) if linha else None
+
+
+class IndiceCaixa:
+    # id -> Mercadoria (só CAMPOS_CAIXA) em memória: cada leitura do código de barras é um acesso
+    # ao dict. Um id fora do índice é lido uma vez do banco; carregar_tudo() lê o catálogo inteiro
+    # numa consulta (fora da thread da interface) e completar() junta o resultado ao índice.
+    LIMITE_PRE_CARGA = 200_000  # Acima disso o índice se preenche só com os ids lidos
+
+    def __init__(self, repositorio):
+        self.repositorio = repositorio
+        self.mercadorias = {}
+        self._invalidadas = None  # Ids alterados enquanto uma pré-carga estava em andamento
+
+    def obter(self, id_p):
+        mercadoria = self.mercadorias.get(id_p)
+        if mercadoria is None:
+            mercadoria = self.repositorio.obter(id_p, CAMPOS_CAIXA)
+            if mercadoria is not None:
+                self.mercadorias[id_p] = mercadoria
+        return mercadoria
+
+    def baixar(self, itens):
+        # Venda enviada e ainda não gravada: o estoque em memória já desconta os itens
+        for id_p, quantidade in itens:
+            mercadoria = self.mercadorias.get(id_p)
+            if mercadoria is not None:
+                mercadoria.qtd_saida += quantidade
+
+    def invalidar(self, id_p):
+        self.mercadorias.pop(id_p, None)
+        if self._invalidadas is not None:
+            self._invalidadas.add(id_p)
+
+    def iniciar_pre_carga(self):
+        self._invalidadas = set()
+
+    def carregar_tudo(self):
+        # Roda em segundo plano; devolve None se o catálogo passa de LIMITE_PRE_CARGA
+        if self.repositorio.contar() > self.LIMITE_PRE_CARGA:
+            return None
+        return {m.id: m for m in self.repositorio.todas(CAMPOS_CAIXA)}
+
+    def completar(self, carregadas):
+        # O que mudou durante a pré-carga pode ter vindo antigo; o que já estava no índice é mais novo
+        invalidadas, self._invalidadas = self._invalidadas or set(), None
+        if carregadas is None:
+            return
+        for id_p in invalidadas:
+            carregadas.pop(id_p, None)
+        carregadas.update(self.mercadorias)
+        self.mercadorias = carregadas
@@ -0,0 +1,135 @@
+import os
+from datetime import datetime
+
+PASTA_RELATORIOS = "reports"
+LINHAS_POR_TABELA = 200   # Linhas por tabela; o reportlab quebra cada uma nas páginas
+LINHAS_POR_LEITURA = 500
+TABELAS_EM_MEMORIA = 3    # Quantas tabelas ficam prontas à frente do que está sendo desenhado
+
+CABECALHO = ("ID", "Nome", "Comprada", "Vendida", "Restante", "Preço Venda", "Lucro")
+
+
+class RelatorioCancelado(Exception):
+    pass
+
+
+def _moeda(valor):
+    return f"R${valor or 0:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+class _FluxoSobDemanda(list):
+    # O reportlab consome a lista de flowables pela frente (del flowables[0]).
+    # Cada remoção puxa o próximo item do gerador: só algumas tabelas existem ao mesmo tempo.
+    def __init__(self, gerador, reserva=TABELAS_EM_MEMORIA):
+        super().__init__()
+        self._gerador = gerador
+        self._reserva = reserva
+        self._abastecer()
+
+    def _abastecer(self):
+        while len(self) < self._reserva:
+            try:
+                self.append(next(self._gerador))
+            except StopIteration:
+                break
+
+    def __delitem__(self, indice):
+        super().__delitem__(indice)
+        self._abastecer()
+
+
+# === RELATÓRIO DE ESTOQUE EM PDF (PAGINADO, EM FLUXO) ===
+def gerar_relatorio_pdf(db_manager, caminho=None, progresso=None, cancelar=None):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+    caminho = caminho or os.path.join(PASTA_RELATORIOS, "relatorio_estoque.pdf")
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    estilos = getSampleStyleSheet()
+    estilo_tabela = TableStyle([
+        ("FONT", (0, 0), (-1, -1), "Helvetica", 8),
+        ("FONT", (0, 0), (-1, 0), "Helvetica-Bold", 8),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#dddddd")),
+        ("ALIGN", (2, 0), (-1, -1), "RIGHT"),
+        ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f4f4f4")]),
+        ("LINEBELOW", (0, 0), (-1, 0), 0.5, colors.black),
+        ("TOPPADDING", (0, 0), (-1, -1), 1),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 1),
+    ])
+    larguras = [2.2 * cm, 6.8 * cm, 1.7 * cm, 1.7 * cm, 1.7 * cm, 2.2 * cm, 2.4 * cm]
+
+    # Totais calculados pelo SQLite, sem trazer as linhas para o Python; somas exatas em centavos
+    (qtd_produtos, total_comprado, total_vendido, total_restante,
+     valor_compra, valor_venda, lucro_total) = db_manager.consultar_um('''
+        SELECT COUNT(*), SUM(qtd_comprada), SUM(qtd_saida), SUM(restante),
+               SUM(valor_total_compra_centavos) / 100.0, SUM(valor_total_venda_centavos) / 100.0,
+               SUM(lucro_centavos) / 100.0
+        FROM mercadorias
+    ''')
+
+    def conteudo():
+        yield Paragraph("Relatório de Estoque - EstoquePlus", estilos["Title"])
+        yield Paragraph("Data: " + datetime.now().strftime("%d/%m/%Y %H:%M"), estilos["Normal"])
+        yield Spacer(1, 0.4 * cm)
+        resumo = Table([
+            ("Produtos", "Comprados", "Vendidos", "Restantes", "Total Compra", "Total Venda", "Lucro"),
+            (qtd_produtos, total_comprado or 0, total_vendido or 0, total_restante or 0,
+             _moeda(valor_compra), _moeda(valor_venda), _moeda(lucro_total)),
+        ])
+        resumo.setStyle(estilo_tabela)
+        yield resumo
+        yield Spacer(1, 0.4 * cm)
+
+        cursor = db_manager.conexao().execute('''
+            SELECT id, nome, qtd_comprada, qtd_saida, restante, preco_venda_centavos / 100.0,
+                   lucro_centavos / 100.0
+            FROM mercadorias ORDER BY nome_ordem, id
+        ''')
+        linhas = [CABECALHO]
+        emitidas = 0
+        while True:
+            if cancelar and cancelar():
+                cursor.close()
+                raise RelatorioCancelado()
+            lote = cursor.fetchmany(LINHAS_POR_LEITURA)
+            for id_p, nome, qc, qs, restante, pv, lucro in lote:
+                linhas.append((id_p, (nome or "")[:48], qc, qs, restante, _moeda(pv), _moeda(lucro)))
+                if len(linhas) > LINHAS_POR_TABELA:
+                    yield _tabela(linhas)
+                    linhas = [CABECALHO]
+            emitidas += len(lote)
+            if progresso and qtd_produtos:
+                progresso(min(99, emitidas * 100 // qtd_produtos))
+            if not lote:
+                break
+        if len(linhas) > 1:
+            yield _tabela(linhas)
+
+    def _tabela(linhas):
+        tabela = Table(linhas, colWidths=larguras, repeatRows=1)
+        tabela.setStyle(estilo_tabela)
+        return tabela
+
+    def rodape(canvas, doc):
+        canvas.saveState()
+        canvas.setFont("Helvetica", 8)
+        canvas.drawRightString(A4[0] - 1.5 * cm, 1 * cm, f"Página {doc.page}")
+        canvas.restoreState()
+
+    temporario = caminho + ".tmp"
+    doc = SimpleDocTemplate(temporario, pagesize=A4, title="Relatório de Estoque", pageCompression=1,
+                            leftMargin=1.5 * cm, rightMargin=1.5 * cm,
+                            topMargin=1.5 * cm, bottomMargin=1.5 * cm)
+    try:
+        doc.build(_FluxoSobDemanda(conteudo()), onFirstPage=rodape, onLaterPages=rodape)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    os.replace(temporario, caminho)
+    if progresso:
+        progresso(100)
+    return caminho
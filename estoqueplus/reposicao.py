@@ -0,0 +1,45 @@
+import csv
+import os
+from collections import namedtuple
+
+from estoqueplus.dinheiro import centavos
+
+# === REPOSIÇÃO DE ESTOQUE ===
+# As mercadorias abaixo do estoque mínimo vêm prontas de alertas_estoque (mantida pelos gatilhos do
+# banco); aqui elas viram itens com a quantidade sugerida de compra e a lista de compras em CSV.
+
+# Repor até FATOR_REPOSICAO vezes o mínimo: com 1, a próxima venda já dispararia o alerta de novo
+FATOR_REPOSICAO = 2
+
+ItemReposicao = namedtuple("ItemReposicao", "id nome restante estoque_minimo preco_compra desde comprar custo")
+
+# id e quantidade primeiro: quando a mercadoria chega, o mesmo arquivo serve para
+# "python -m estoqueplus entradas compras.csv" (as demais colunas são ignoradas)
+COLUNAS_LISTA = ("id", "quantidade", "nome", "restante", "estoque_minimo", "custo_unitario", "custo_total")
+
+
+def quantidade_sugerida(restante, estoque_minimo):
+    return max(1, estoque_minimo * FATOR_REPOSICAO - restante)
+
+
+def itens_reposicao(db_manager):
+    # Funciona com o DatabaseManager e com o cliente do servidor (mesmo alertas_estoque())
+    itens = []
+    for id_p, nome, restante, minimo, preco_compra, desde in db_manager.alertas_estoque():
+        comprar = quantidade_sugerida(restante, minimo)
+        custo = centavos(preco_compra or 0) * comprar / 100
+        itens.append(ItemReposicao(id_p, nome, restante, minimo, preco_compra, desde, comprar, custo))
+    return itens
+
+
+def exportar_lista_compras(itens, caminho):
+    # Grava num temporário e troca no fim: uma falha no meio não deixa meia lista no lugar da anterior
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", newline="", encoding="utf-8-sig") as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(COLUNAS_LISTA)
+        for item in itens:
+            escritor.writerow((item.id, item.comprar, item.nome, item.restante, item.estoque_minimo,
+                               f"{item.preco_compra or 0:.2f}", f"{item.custo:.2f}"))
+    os.replace(temporario, caminho)
+    return caminho
@@ -0,0 +1,547 @@
+import asyncio
+import base64
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from estoqueplus import analise, escrita
+from estoqueplus.database import DatabaseManager, EstoqueInsuficienteError, ProdutoNaoEncontradoError
+from estoqueplus.mercadorias import CAMPOS, CAMPOS_COMPLETOS, RepositorioMercadorias
+
+# === SERVIDOR HTTP/JSON LOCAL (asyncio, só biblioteca padrão) ===
+# Vários terminais trabalham no mesmo estoque pela rede sem abrir o stock_control.db diretamente:
+# este processo é o único dono do arquivo. As leituras rodam num pequeno pool de threads (cada uma
+# com sua conexão; em WAL elas não esperam o escritor). Todas as gravações passam por uma única
+# thread e uma única conexão, em lotes (um COMMIT para tudo o que chegou junto), pelo mesmo
+# escrita.aplicar_lote da interface. Cada mudança gravada vira um evento em GET /eventos (SSE).
+# python -m estoqueplus servir --porta 8765
+
+PORTA_PADRAO = 8765
+LIMITE_CORPO = 32 * 1024 * 1024  # Cadastros levam a imagem em base64
+LIMITE_PAGINA = 5000
+LOTE_MAXIMO = 500  # Operações por COMMIT
+INTERVALO_LIMPEZA = 3600  # Segundos entre as retiradas dos ids vencidos de operacoes_aplicadas
+EVENTOS_GUARDADOS = 1000  # Para quem reconecta com Last-Event-ID não perder nada
+FILA_POR_ASSINANTE = 1000
+INTERVALO_PING = 15  # Comentário SSE que mantém a conexão viva (e revela clientes que sumiram)
+
+STATUS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+          405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error",
+          503: "Service Unavailable"}
+
+# Exceções de operação -> status HTTP das rotas de uma operação só
+STATUS_ERRO = {EstoqueInsuficienteError: 409, ProdutoNaoEncontradoError: 404, sqlite3.IntegrityError: 409}
+
+RECARREGAR = {"evento": "recarregar"}  # O assinante perdeu eventos: relê tudo
+
+
+class ErroHTTP(Exception):
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+
+def mercadoria_como_dict(mercadoria, campos):
+    return {campo: getattr(mercadoria, campo) for campo in campos}
+
+
+def erro_como_dict(erro):
+    return {"erro": str(erro), "tipo": type(erro).__name__}
+
+
+def _campos(parametros, padrao=CAMPOS_COMPLETOS):
+    if "campos" not in parametros:
+        return padrao
+    campos = tuple(c for c in parametros["campos"].split(",") if c)
+    desconhecidos = [c for c in campos if c not in CAMPOS]
+    if desconhecidos or not campos:
+        raise ErroHTTP(400, f"campos desconhecidos: {', '.join(desconhecidos) or '(nenhum)'}")
+    return campos
+
+
+def _inteiro(parametros, nome, padrao, minimo, maximo):
+    try:
+        return max(minimo, min(maximo, int(parametros.get(nome, padrao))))
+    except ValueError:
+        raise ErroHTTP(400, f"{nome} deve ser um número inteiro") from None
+
+
+# Dados obrigatórios de cada tipo de operação recebida em POST /operacoes
+CHAVES_OPERACAO = {
+    escrita.VENDA: ("id", "quantidade"),
+    escrita.ENTRADA: ("id", "quantidade"),
+    escrita.CADASTRO: ("id", "nome", "preco_compra", "preco_venda", "quantidade", "descricao"),
+    escrita.EXCLUSAO: ("id",),
+    escrita.CAIXA: ("itens",),
+}
+
+
+def _validar_operacao(operacao):
+    # O que escrita.aplicar não saberia gravar é recusado (ValueError) antes de entrar na fila: um
+    # registro malformado não pode derrubar o lote dos outros terminais, nem uma quantidade negativa
+    # virar uma "venda" que aumenta o estoque
+    d = operacao.dados
+    if operacao.tipo not in CHAVES_OPERACAO:
+        raise ValueError(f"operação desconhecida: {operacao.tipo}")
+    if not isinstance(d, dict):
+        raise ValueError("os dados da operação devem ser um objeto")
+    faltando = [chave for chave in CHAVES_OPERACAO[operacao.tipo] if chave not in d]
+    if faltando:
+        raise ValueError(f"faltam dados da operação: {', '.join(faltando)}")
+    if operacao.tipo == escrita.CAIXA:
+        if not isinstance(d["itens"], list) or not d["itens"]:
+            raise ValueError("a venda do caixa precisa de itens")
+        for item in d["itens"]:
+            if not isinstance(item, list) or len(item) != 2:
+                raise ValueError("cada item do caixa deve ser [id, quantidade]")
+        itens = d["itens"]
+    elif operacao.tipo in (escrita.VENDA, escrita.ENTRADA):
+        itens = [(d["id"], d["quantidade"])]
+    else:
+        itens = []
+        if operacao.tipo == escrita.CADASTRO:
+            for chave in ("preco_compra", "preco_venda"):
+                if not _numero(d[chave]) or d[chave] <= 0:
+                    raise ValueError(f"{chave} deve ser um número maior que zero")
+            if not _inteiro_valido(d["quantidade"]) or d["quantidade"] < 0:
+                raise ValueError("a quantidade deve ser um inteiro maior ou igual a zero")
+            minimo = d.get("estoque_minimo")
+            if minimo is not None and (not _inteiro_valido(minimo) or minimo < 0):
+                raise ValueError("o estoque mínimo deve ser um inteiro maior ou igual a zero")
+            if not isinstance(d["nome"], str) or not isinstance(d["descricao"], str):
+                raise ValueError("nome e descrição devem ser texto")
+        if not isinstance(d["id"], str):
+            raise ValueError("o id da mercadoria deve ser texto")
+    for id_p, quantidade in itens:
+        if not isinstance(id_p, str):
+            raise ValueError("o id da mercadoria deve ser texto")
+        _validar_quantidade(quantidade)
+
+
+def _inteiro_valido(valor):
+    return isinstance(valor, int) and not isinstance(valor, bool)  # True também é int
+
+
+def _numero(valor):
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
+
+def _validar_quantidade(quantidade):
+    if not _inteiro_valido(quantidade) or quantidade <= 0:
+        raise ValueError("a quantidade deve ser um inteiro maior que zero")
+
+
+def _eventos_do_resultado(operacao, resultado):
+    # Mudanças de mercadorias causadas por uma operação gravada: (id, tipo de mudança)
+    d = operacao.dados
+    if operacao.tipo in (escrita.VENDA, escrita.ENTRADA):
+        return [(d["id"], "atualizada")]
+    if operacao.tipo == escrita.CADASTRO:
+        return [(d["id"], "atualizada" if resultado else "inserida")]
+    if operacao.tipo == escrita.EXCLUSAO:
+        return [(d["id"], "removida")]
+    if operacao.tipo == escrita.CAIXA:
+        return [(id_p, "atualizada") for id_p, _quantidade in d["itens"]]
+    return []
+
+
+class ServidorEstoque:
+    def __init__(self, db_manager, host="127.0.0.1", porta=PORTA_PADRAO, token=None, leitores=4):
+        self.db_manager = db_manager
+        self.repositorio = RepositorioMercadorias(db_manager)
+        self.host = host
+        self.porta = porta
+        self.token = token
+        self.leitores = ThreadPoolExecutor(max_workers=leitores, thread_name_prefix="leitura")
+        self.gravador = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gravacao")  # Uma conexão
+        self.fila = None
+        self.assinantes = set()
+        self.eventos = deque(maxlen=EVENTOS_GUARDADOS)
+        self.sequencia = 0
+        self.instancia = uuid.uuid4().hex[:8]  # Ids de evento de outra execução do servidor não valem aqui
+        self.servidor = None
+        self.rotas = [
+            ("GET", r"/mercadorias", self.listar),
+            ("POST", r"/mercadorias/lote", self.obter_varios),
+            ("GET", r"/mercadorias/([^/]+)", self.obter),
+            ("GET", r"/mercadorias/([^/]+)/chave", self.chave),
+            ("GET", r"/mercadorias/([^/]+)/corresponde", self.corresponde),
+            ("PUT", r"/mercadorias/([^/]+)", self.cadastrar),
+            ("DELETE", r"/mercadorias/([^/]+)", self.excluir),
+            ("POST", r"/vendas", self.vender),
+            ("POST", r"/entradas", self.adicionar_estoque),
+            ("POST", r"/operacoes", self.operacoes),
+            ("GET", r"/contagem", self.contagem),
+            ("GET", r"/alertas", self.alertas),
+            ("GET", r"/alertas/contagem", self.contar_alertas),
+            ("GET", r"/analise", self.analisar),
+            ("GET", r"/usuarios", self.usuarios),
+            ("POST", r"/usuarios", self.criar_usuario),
+            ("POST", r"/login", self.login),
+        ]
+        self.rotas = [(metodo, re.compile(padrao + "$"), funcao) for metodo, padrao, funcao in self.rotas]
+
+    # === CICLO DE VIDA ===
+    async def iniciar(self):
+        self.fila = asyncio.Queue()
+        self.servidor = await asyncio.start_server(self._atender, self.host, self.porta)
+        # Porta 0: o sistema escolhe uma livre
+        self.porta = self.servidor.sockets[0].getsockname()[1]
+        self._tarefa_gravacao = asyncio.create_task(self._gravar_lotes())
+
+    async def servir(self):
+        await self.iniciar()
+        print(f"EstoquePlus servindo {self.db_manager.db_name} em http://{self.host}:{self.porta}", flush=True)
+        try:
+            async with self.servidor:
+                await self.servidor.serve_forever()
+        finally:
+            await self.encerrar()
+
+    async def encerrar(self):
+        self.servidor.close()
+        self._tarefa_gravacao.cancel()
+        loop = asyncio.get_running_loop()
+        # Cada thread fecha a própria conexão antes de o pool acabar
+        await loop.run_in_executor(self.gravador, self.db_manager.fechar_conexao_da_thread)
+        self.gravador.shutdown()
+        self.leitores.shutdown()
+        self.db_manager.fechar()
+
+    # === HTTP ===
+    async def _atender(self, reader, writer):
+        # HTTP/1.1 com keep-alive: o cliente reaproveita a conexão para muitas requisições
+        try:
+            while True:
+                linha = await reader.readline()
+                if not linha:
+                    break
+                metodo, alvo, _versao = linha.decode("latin-1").split()
+                cabecalhos = {}
+                while True:
+                    linha = await reader.readline()
+                    if linha in (b"\r\n", b"\n", b""):
+                        break
+                    nome, _sep, valor = linha.decode("latin-1").partition(":")
+                    cabecalhos[nome.strip().lower()] = valor.strip()
+                tamanho = int(cabecalhos.get("content-length") or 0)
+                if tamanho > LIMITE_CORPO:
+                    await self._responder(writer, 413, {"erro": "corpo grande demais"}, manter=False)
+                    break
+                corpo = await reader.readexactly(tamanho) if tamanho else b""
+                url = urlsplit(alvo)
+                parametros = {nome: valores[-1] for nome, valores in parse_qs(url.query).items()}
+                if not self._autorizado(cabecalhos):
+                    status, resposta = 401, {"erro": "token ausente ou inválido"}
+                elif metodo == "GET" and url.path == "/eventos":
+                    await self._transmitir_eventos(writer, cabecalhos)
+                    break
+                else:
+                    status, resposta = await self._rotear(metodo, url.path, parametros, corpo)
+                manter = cabecalhos.get("connection", "").lower() != "close"
+                await self._responder(writer, status, resposta, manter)
+                if not manter:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass  # Cliente caiu ou mandou lixo: só a conexão dele acaba
+        finally:
+            writer.close()
+
+    def _autorizado(self, cabecalhos):
+        return self.token is None or cabecalhos.get("authorization") == f"Bearer {self.token}"
+
+    async def _rotear(self, metodo, caminho, parametros, corpo):
+        metodo_permitido = False
+        for metodo_rota, padrao, funcao in self.rotas:
+            encontrado = padrao.match(caminho)
+            if not encontrado:
+                continue
+            if metodo_rota != metodo:
+                metodo_permitido = True
+                continue
+            try:
+                dados = json.loads(corpo) if corpo else {}
+                return await funcao(parametros, dados, *(unquote(g) for g in encontrado.groups()))
+            except ErroHTTP as e:
+                return e.status, {"erro": str(e)}
+            except (ValueError, KeyError, TypeError) as e:
+                return 400, erro_como_dict(e)
+            except sqlite3.OperationalError as e:
+                return 503, erro_como_dict(e)  # Banco travado por outro processo: tente de novo
+        if metodo_permitido:
+            return 405, {"erro": f"método {metodo} não aceito em {caminho}"}
+        return 404, {"erro": f"rota desconhecida: {caminho}"}
+
+    @staticmethod
+    async def _responder(writer, status, resposta, manter=True):
+        corpo = json.dumps(resposta, ensure_ascii=False).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {STATUS.get(status, '')}\r\n"
+                     f"Content-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(corpo)}\r\n"
+                     f"Connection: {'keep-alive' if manter else 'close'}\r\n\r\n".encode("latin-1") + corpo)
+        await writer.drain()
+
+    async def _ler(self, funcao, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.leitores, funcao, *args)
+
+    # === LEITURAS ===
+    async def listar(self, parametros, _dados):
+        # Busca (busca=..., paginada por deslocamento) ou listagem por chave (ordem=..., apos=[valor, id])
+        campos = _campos(parametros)
+        limite = _inteiro(parametros, "limite", 100, 1, LIMITE_PAGINA)
+        if parametros.get("busca", "").strip():
+            deslocamento = _inteiro(parametros, "deslocamento", 0, 0, 10 ** 9)
+            mercadorias = await self._ler(self.repositorio.buscar, parametros["busca"], limite, deslocamento,
+                                          campos)
+            chaves = [None] * len(mercadorias)
+        else:
+            ordem = parametros.get("ordem", "nome")
+            if ordem not in DatabaseManager.ORDENACOES:
+                raise ErroHTTP(400, f"ordem desconhecida: {ordem}")
+            apos = json.loads(parametros["apos"]) if parametros.get("apos") else None
+            mercadorias, chaves = await self._ler(self.repositorio.listar, ordem, limite, apos, campos)
+        return 200, {"mercadorias": [mercadoria_como_dict(m, campos) for m in mercadorias], "chaves": chaves}
+
+    async def contagem(self, _parametros, _dados):
+        return 200, {"mercadorias": await self._ler(self.repositorio.contar)}
+
+    async def alertas(self, _parametros, _dados):
+        # Lista de observação do estoque mínimo (estoqueplus.reposicao monta a lista de compras)
+        return 200, {"alertas": await self._ler(self.db_manager.alertas_estoque)}
+
+    async def contar_alertas(self, _parametros, _dados):
+        return 200, {"alertas": await self._ler(self.db_manager.contar_alertas_estoque)}
+
+    async def analisar(self, _parametros, _dados):
+        # Calculada aqui e guardada até a próxima mudança: os terminais não leem o catálogo inteiro
+        return 200, (await self._ler(analise.analisar_estoque, self.db_manager))._asdict()
+
+    async def obter_varios(self, parametros, dados):
+        campos = tuple(dados.get("campos") or CAMPOS_COMPLETOS)
+        _campos({"campos": ",".join(campos)})  # Valida
+        encontradas = await self._ler(self.repositorio.obter_varios, dados["ids"], campos)
+        return 200, {"mercadorias": [mercadoria_como_dict(m, campos) for m in encontradas.values()]}
+
+    async def obter(self, parametros, _dados, id_p):
+        campos = _campos(parametros)
+        mercadoria = await self._ler(self.repositorio.obter, id_p, campos)
+        if mercadoria is None:
+            raise ErroHTTP(404, f"produto não encontrado: {id_p}")
+        return 200, mercadoria_como_dict(mercadoria, campos)
+
+    async def chave(self, parametros, _dados, id_p):
+        ordem = parametros.get("ordem", "nome")
+        if ordem not in DatabaseManager.ORDENACOES:
+            raise ErroHTTP(400, f"ordem desconhecida: {ordem}")
+        return 200, {"chave": await self._ler(self.repositorio.chave_ordenacao, ordem, id_p)}
+
+    async def corresponde(self, parametros, _dados, id_p):
+        termo = parametros.get("busca", "")
+        return 200, {"corresponde": await self._ler(self.db_manager.mercadoria_corresponde, id_p, termo)}
+
+    # === USUÁRIOS ===
+    async def usuarios(self, _parametros, _dados):
+        return 200, {"existe": await self._ler(self.db_manager.has_user)}
+
+    async def criar_usuario(self, _parametros, dados):
+        # Só o primeiro usuário pode ser criado pela rede (a tela de primeiro acesso do cliente)
+        if await self._ler(self.db_manager.has_user):
+            raise ErroHTTP(403, "já existe usuário; crie outros no servidor")
+        try:
+            await self._ler(self.db_manager.create_user, dados["usuario"], dados["senha"])
+        except sqlite3.IntegrityError as e:
+            return 409, erro_como_dict(e)
+        return 200, {"ok": True}
+
+    async def login(self, _parametros, dados):
+        return 200, {"ok": await self._ler(self.db_manager.check_user, dados["usuario"], dados["senha"])}
+
+    # === GRAVAÇÕES ===
+    async def operacoes(self, _parametros, dados):
+        # Lote de operações no formato da fila de escrita ({"id", "tipo", "dados"}); cada uma é
+        # gravada ou recusada sozinha, e repetir o lote (depois de uma queda de rede) não duplica nada.
+        # As inválidas são recusadas aqui, sem entrar na fila.
+        operacoes = [escrita.Operacao.de_dict(registro) for registro in dados["operacoes"]]
+        recusas = []
+        for operacao in operacoes:
+            try:
+                _validar_operacao(operacao)
+            except ValueError as e:
+                recusas.append(e)
+            else:
+                recusas.append(None)
+        validas = [op for op, recusa in zip(operacoes, recusas) if recusa is None]
+        gravadas = iter(await self._gravar(validas) if validas else ())
+        resultados = [(op, None, recusa) if recusa is not None else next(gravadas)
+                      for op, recusa in zip(operacoes, recusas)]
+        return 200, {"resultados": [
+            {"id": op.id, "resultado": resultado, **(erro_como_dict(erro) if erro else {"erro": None})}
+            for op, resultado, erro in resultados
+        ]}
+
+    async def _uma_operacao(self, tipo, dados, resposta):
+        operacao = escrita.Operacao(tipo, dados)
+        _validar_operacao(operacao)  # ValueError: 400
+        [(_op, resultado, erro)] = await self._gravar([operacao])
+        if erro is not None:
+            return STATUS_ERRO.get(type(erro), 400), erro_como_dict(erro)
+        return 200, resposta(resultado)
+
+    @staticmethod
+    def _quantidade(dados):
+        quantidade = dados["quantidade"]
+        try:
+            _validar_quantidade(quantidade)
+        except ValueError as e:
+            raise ErroHTTP(400, str(e)) from None
+        return quantidade
+
+    async def vender(self, _parametros, dados):
+        quantidade = self._quantidade(dados)
+        return await self._uma_operacao(escrita.VENDA, {"id": dados["id"], "quantidade": quantidade},
+                                        lambda _r: {"ok": True})
+
+    async def adicionar_estoque(self, _parametros, dados):
+        quantidade = self._quantidade(dados)
+        return await self._uma_operacao(escrita.ENTRADA, {"id": dados["id"], "quantidade": quantidade},
+                                        lambda _r: {"ok": True})
+
+    async def cadastrar(self, _parametros, dados, id_p):
+        minimo = dados.get("estoque_minimo")  # Ausente: mantém o da mercadoria
+        cadastro = {"id": id_p, "nome": dados["nome"], "preco_compra": float(dados["preco_compra"]),
+                    "preco_venda": float(dados["preco_venda"]), "quantidade": int(dados.get("quantidade", 0)),
+                    "descricao": dados.get("descricao", ""), "imagem_base64": dados.get("imagem_base64"),
+                    "imagem_extensao": dados.get("imagem_extensao"),
+                    "estoque_minimo": None if minimo is None else int(minimo)}
+        return await self._uma_operacao(escrita.CADASTRO, cadastro, lambda existia: {"existia": existia})
+
+    async def excluir(self, _parametros, _dados, id_p):
+        return await self._uma_operacao(escrita.EXCLUSAO, {"id": id_p}, lambda _r: {"ok": True})
+
+    async def _gravar(self, operacoes):
+        # Entra na fila da thread de gravação e espera o lote em que caiu ser gravado
+        temporarios = []
+        try:
+            for operacao in operacoes:
+                temporarios.extend(self._receber_imagem(operacao))
+            futuro = asyncio.get_running_loop().create_future()
+            await self.fila.put((operacoes, futuro))
+            return await futuro
+        finally:
+            for temporario in temporarios:
+                os.remove(temporario)
+
+    @staticmethod
+    def _receber_imagem(operacao):
+        # O cliente manda o conteúdo da imagem (o caminho dele não existe aqui); vira um arquivo
+        # temporário que guardar_imagem copia para o armazém. Devolve os temporários criados.
+        d = operacao.dados
+        if operacao.tipo != escrita.CADASTRO:
+            return []
+        conteudo = d.pop("imagem_base64", None)
+        extensao = d.pop("imagem_extensao", None) or ".png"
+        d["imagem"] = None
+        if not conteudo:
+            return []
+        if not re.fullmatch(r"\.[A-Za-z0-9]{1,5}", extensao):
+            raise ErroHTTP(400, f"extensão de imagem inválida: {extensao}")
+        descritor, caminho = tempfile.mkstemp(suffix=extensao)
+        with os.fdopen(descritor, "wb") as arquivo:
+            arquivo.write(base64.b64decode(conteudo))
+        d["imagem"] = caminho
+        return [caminho]
+
+    async def _gravar_lotes(self):
+        loop = asyncio.get_running_loop()
+        proxima_limpeza = loop.time()
+        while True:
+            pedidos = [await self.fila.get()]
+            # Tudo o que chegou enquanto o lote anterior era gravado vai num COMMIT só
+            while not self.fila.empty() and sum(len(ops) for ops, _f in pedidos) < LOTE_MAXIMO:
+                pedidos.append(self.fila.get_nowait())
+            operacoes = [op for ops, _futuro in pedidos for op in ops]
+            # Os ids gravados protegem a reaplicação do diário de cada terminal e não há como saber quando
+            # ele esvaziou: de tempos em tempos, o lote retira só os vencidos (ver limpar_operacoes_aplicadas)
+            limpar = None
+            if loop.time() >= proxima_limpeza:
+                limpar, proxima_limpeza = (), loop.time() + INTERVALO_LIMPEZA
+            try:
+                resultados = await loop.run_in_executor(self.gravador, escrita.aplicar_lote, self.db_manager,
+                                                        operacoes, limpar)
+            except Exception as e:
+                # O lote inteiro foi desfeito: todas as operações dele falham, e a gravação continua
+                # atendendo os próximos (uma exceção escapando daqui pararia todas as gravações)
+                resultados = [(op, None, e) for op in operacoes]
+            inicio = 0
+            for ops, futuro in pedidos:
+                if not futuro.done():  # O cliente pode ter desistido (conexão fechada)
+                    futuro.set_result(resultados[inicio:inicio + len(ops)])
+                inicio += len(ops)
+            for operacao, resultado, erro in resultados:
+                if erro is None:
+                    for id_p, tipo in _eventos_do_resultado(operacao, resultado):
+                        self._publicar({"evento": "mercadoria", "id": id_p, "tipo": tipo, "operacao": operacao.id})
+
+    # === EVENTOS (SERVER-SENT EVENTS) ===
+    def _publicar(self, evento):
+        self.sequencia += 1
+        evento = dict(evento, seq=self.sequencia, instancia=self.instancia)
+        self.eventos.append(evento)
+        for fila in list(self.assinantes):
+            try:
+                fila.put_nowait(evento)
+            except asyncio.QueueFull:
+                # Assinante lento demais: descarta o atraso e manda reler tudo
+                while not fila.empty():
+                    fila.get_nowait()
+                fila.put_nowait(RECARREGAR)
+
+    @staticmethod
+    def _formatar(evento):
+        linhas = f"event: {evento['evento']}\n"
+        if "seq" in evento:
+            linhas = f"id: {evento['instancia']}-{evento['seq']}\n" + linhas
+        dados = {k: v for k, v in evento.items() if k not in ("evento", "seq", "instancia")}
+        return (linhas + f"data: {json.dumps(dados, ensure_ascii=False)}\n\n").encode("utf-8")
+
+    async def _transmitir_eventos(self, writer, cabecalhos):
+        fila = asyncio.Queue(maxsize=FILA_POR_ASSINANTE)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+                     b"Cache-Control: no-cache\r\nConnection: keep-alive\r\n\r\n")
+        instancia, _sep, ultimo = cabecalhos.get("last-event-id", "").partition("-")
+        if instancia:
+            # Reconexão: reenvia o que foi perdido, se ainda estiver guardado
+            if instancia != self.instancia or not ultimo.isdigit() or \
+                    (self.eventos and int(ultimo) < self.eventos[0]["seq"] - 1):
+                fila.put_nowait(RECARREGAR)
+            else:
+                ultimo = int(ultimo)
+                for evento in self.eventos:
+                    if evento["seq"] > ultimo:
+                        fila.put_nowait(evento)
+        self.assinantes.add(fila)
+        try:
+            while True:
+                try:
+                    evento = await asyncio.wait_for(fila.get(), INTERVALO_PING)
+                except asyncio.TimeoutError:
+                    writer.write(b": ping\n\n")
+                else:
+                    writer.write(self._formatar(evento))
+                await writer.drain()
+        finally:
+            self.assinantes.discard(fila)
+
+
+def servir(db_manager, host="127.0.0.1", porta=PORTA_PADRAO, token=None):
+    servidor = ServidorEstoque(db_manager, host, porta, token)
+    try:
+        asyncio.run(servidor.servir())
+    except KeyboardInterrupt:
+        pass
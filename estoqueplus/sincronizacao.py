@@ -0,0 +1,223 @@
+import gzip
+import json
+import os
+from collections import namedtuple
+
+from estoqueplus.dinheiro import centavos
+
+# Sincronização entre os bancos das filiais por arquivos de delta (JSON Lines comprimido com gzip).
+# Os gatilhos de database._criar_alteracoes anotam cada mudança em "alteracoes"; o delta leva as
+# mudanças a partir de uma seq e pode ser levado em pendrive, e-mail etc.
+#
+# Regras de conflito:
+# - Estoque: as quantidades são somas do livro-razão, e cada venda/entrada de cada filial é um evento
+#   próprio. Mudanças simultâneas se somam, nenhuma sobrescreve a outra. Uma venda importada sempre
+#   entra (ela já aconteceu), mesmo deixando o estoque negativo; essas mercadorias são informadas.
+# - Cadastro (nome, preços, descrição, imagem) e exclusão: vale a mudança mais recente (relógio UTC de
+#   quem mudou; empate decidido pela origem). A mais antiga é descartada e contada como superada.
+
+FORMATO = "estoqueplus-delta"
+VERSAO_FORMATO = 2  # 2: dinheiro em centavos inteiros, como no banco
+CAMPOS_CADASTRO = ("nome", "preco_compra_centavos", "preco_venda_centavos", "descricao", "imagem_path",
+                   "imagem_hash")
+CAMPOS_LIVRO = {
+    "vendas": ("produto_id", "quantidade", "preco_unitario_centavos", "custo_unitario_centavos",
+               "valor_total_centavos", "data_hora"),
+    "entradas": ("produto_id", "quantidade", "custo_unitario_centavos", "valor_total_centavos", "data_hora"),
+}
+# Deltas da versão 1 (filiais ainda sem a migração para centavos) traziam reais nestes campos
+DINHEIRO_VERSAO_1 = {"preco_compra": "preco_compra_centavos", "preco_venda": "preco_venda_centavos",
+                     "preco_unitario": "preco_unitario_centavos", "custo_unitario": "custo_unitario_centavos",
+                     "valor_total": "valor_total_centavos"}
+
+ResultadoExportacao = namedtuple("ResultadoExportacao", "caminho alteracoes desde ate tamanho")
+ResultadoImportacao = namedtuple("ResultadoImportacao", "aplicadas repetidas superadas estoque_negativo")
+
+
+class DeltaInvalidoError(ValueError):
+    pass
+
+
+def origem_local(db_manager):
+    return db_manager.consultar_um("SELECT origem FROM replicas WHERE local = 1")[0]
+
+
+# === EXPORTAÇÃO ===
+def exportar_delta(db_manager, caminho, desde=None, destino=None):
+    # desde None: continua de onde parou a última exportação para o destino (ou desde o início)
+    if desde is None:
+        linha = db_manager.consultar_um("SELECT ultima_seq FROM destinos_sincronizacao WHERE destino = ?",
+                                        (destino,)) if destino else None
+        desde = linha[0] if linha else 0
+    origem = origem_local(db_manager)
+    conn = db_manager.conexao()
+    # Transação só de leitura: um retrato consistente sem segurar a trava de escrita dos terminais
+    conn.execute("BEGIN")
+    try:
+        ate = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM alteracoes").fetchone()[0]
+        total = 0
+        temporario = caminho + ".tmp"
+        with gzip.open(temporario, "wt", encoding="utf-8", compresslevel=9) as saida:
+            saida.write(_linha({"formato": FORMATO, "versao": VERSAO_FORMATO, "origem": origem,
+                                "desde": desde, "ate": ate}))
+            for seq, tabela, chave, operacao, de, seq_origem, data_hora in conn.execute('''
+                SELECT seq, tabela, chave, operacao, origem, seq_origem, data_hora
+                FROM alteracoes WHERE seq > ? AND seq <= ? ORDER BY seq
+            ''', (desde, ate)):
+                # Mudanças importadas seguem com a origem e a seq de quem as fez
+                evento = {"origem": de or origem, "seq": seq_origem or seq, "tabela": tabela, "chave": chave,
+                          "operacao": operacao, "data_hora": data_hora}
+                dados = _dados(conn, tabela, chave, operacao)
+                if dados is not None:
+                    evento["dados"] = dados
+                saida.write(_linha(evento))
+                total += 1
+    except BaseException:
+        conn.execute("ROLLBACK")
+        if os.path.exists(caminho + ".tmp"):
+            os.remove(caminho + ".tmp")
+        raise
+    conn.execute("COMMIT")
+    os.replace(temporario, caminho)
+    if destino:
+        db_manager.executar('''
+            INSERT INTO destinos_sincronizacao (destino, ultima_seq) VALUES (?, ?)
+            ON CONFLICT (destino) DO UPDATE SET ultima_seq = excluded.ultima_seq
+        ''', (destino, ate))
+    return ResultadoExportacao(caminho, total, desde, ate, os.path.getsize(caminho))
+
+
+def _dados(conn, tabela, chave, operacao):
+    # O registro guarda só a chave: a mercadoria viaja com o cadastro atual (None se foi excluída
+    # depois, e a exclusão vem mais adiante no mesmo delta); a ordem dos eventos é mantida para que
+    # cadastro, entradas e vendas sejam refeitos na mesma sequência da origem
+    if tabela == "mercadorias":
+        if operacao == "excluida":
+            return None
+        linha = conn.execute(f"SELECT {', '.join(CAMPOS_CADASTRO)} FROM mercadorias WHERE id = ?",
+                             (chave,)).fetchone()
+        return dict(zip(CAMPOS_CADASTRO, linha)) if linha else None
+    campos = CAMPOS_LIVRO[tabela]
+    linha = conn.execute(f"SELECT {', '.join(campos)} FROM {tabela} WHERE id = ?", (int(chave),)).fetchone()
+    return dict(zip(campos, linha))
+
+
+def _linha(registro):
+    return json.dumps(registro, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+# === IMPORTAÇÃO ===
+def importar_delta(db_manager, caminho):
+    # Tudo numa transação; reimportar o mesmo arquivo (ou um delta que se sobrepõe) não duplica nada
+    with gzip.open(caminho, "rt", encoding="utf-8") as arquivo:
+        try:
+            cabecalho = json.loads(arquivo.readline() or "{}")
+        except (ValueError, OSError):
+            raise DeltaInvalidoError(f"{caminho} não é um delta do EstoquePlus") from None
+        if cabecalho.get("formato") != FORMATO:
+            raise DeltaInvalidoError(f"{caminho} não é um delta do EstoquePlus")
+        if cabecalho.get("versao", 0) > VERSAO_FORMATO:
+            raise DeltaInvalidoError(f"delta na versão {cabecalho['versao']}; atualize o EstoquePlus")
+
+        with db_manager.transacao() as conn:
+            propria = origem_local(db_manager)
+            marcas = dict(conn.execute("SELECT origem, ultima_seq FROM replicas WHERE local = 0"))
+            aplicadas = repetidas = superadas = 0
+            produtos = set()
+            for linha in arquivo:
+                if not linha.strip():
+                    continue
+                evento = json.loads(linha)
+                if cabecalho.get("versao", 1) == 1 and evento.get("dados"):
+                    evento["dados"] = {DINHEIRO_VERSAO_1.get(campo, campo):
+                                       centavos(valor) if campo in DINHEIRO_VERSAO_1 else valor
+                                       for campo, valor in evento["dados"].items()}
+                origem, seq = evento["origem"], evento["seq"]
+                if origem == propria or seq <= marcas.get(origem, 0):
+                    repetidas += 1
+                    continue
+                marcas[origem] = seq
+                antes = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM alteracoes").fetchone()[0]
+                if evento["tabela"] == "mercadorias":
+                    if not _mais_recente(conn, evento, propria):
+                        superadas += 1
+                        continue
+                    _aplicar_cadastro(conn, evento)
+                    if conn.execute("SELECT MAX(seq) FROM alteracoes").fetchone()[0] == antes:
+                        # Nada mudou aqui (mesmos valores, ou exclusão do que já não existia), mas a
+                        # mudança precisa constar para as próximas comparações e para ser repassada
+                        conn.execute("INSERT INTO alteracoes (tabela, chave, operacao) VALUES (?, ?, ?)",
+                                     ("mercadorias", evento["chave"], evento["operacao"]))
+                else:
+                    campos = CAMPOS_LIVRO[evento["tabela"]]
+                    dados = evento["dados"]
+                    conn.execute(f'''
+                        INSERT INTO {evento["tabela"]} ({", ".join(campos)})
+                        VALUES ({", ".join("?" * len(campos))})
+                    ''', tuple(dados[campo] for campo in campos))
+                    produtos.add(dados["produto_id"])
+                # A mudança refeita aqui fica registrada em nome de quem a fez
+                conn.execute("UPDATE alteracoes SET origem = ?, seq_origem = ?, data_hora = ? WHERE seq > ?",
+                             (origem, seq, evento["data_hora"], antes))
+                aplicadas += 1
+            conn.executemany('''
+                INSERT INTO replicas (origem, ultima_seq) VALUES (?, ?)
+                ON CONFLICT (origem) DO UPDATE SET ultima_seq = excluded.ultima_seq
+            ''', marcas.items())
+            estoque_negativo = sorted(id_p for (id_p,) in conn.execute(
+                "SELECT id FROM mercadorias WHERE id IN (SELECT value FROM json_each(?)) AND restante < 0",
+                (json.dumps(list(produtos)),)))
+    return ResultadoImportacao(aplicadas, repetidas, superadas, estoque_negativo)
+
+
+def _mais_recente(conn, evento, propria):
+    # Última mudança conhecida aqui no cadastro desta mercadoria, comparada por (data_hora, origem, seq):
+    # duas mudanças da mesma origem no mesmo milissegundo ficam na ordem em que foram feitas
+    local = conn.execute('''
+        SELECT data_hora, COALESCE(origem, ?), COALESCE(seq_origem, seq) FROM alteracoes
+        WHERE tabela = 'mercadorias' AND chave = ? ORDER BY seq DESC LIMIT 1
+    ''', (propria, evento["chave"])).fetchone()
+    return local is None or (evento["data_hora"], evento["origem"], evento["seq"]) > tuple(local)
+
+
+def _aplicar_cadastro(conn, evento):
+    if evento["operacao"] == "excluida":
+        conn.execute("DELETE FROM mercadorias WHERE id = ?", (evento["chave"],))
+        return
+    dados = evento.get("dados")
+    if dados is None:
+        return
+    valores = tuple(dados[campo] for campo in CAMPOS_CADASTRO)
+    if conn.execute(f"UPDATE mercadorias SET {', '.join(c + ' = ?' for c in CAMPOS_CADASTRO)} WHERE id = ?",
+                    valores + (evento["chave"],)).rowcount == 0:
+        # Mercadoria nova: o estoque chega pelas entradas do livro-razão, nos eventos seguintes
+        conn.execute(f'''
+            INSERT INTO mercadorias (id, {", ".join(CAMPOS_CADASTRO)}, qtd_comprada, qtd_saida,
+                                     valor_total_compra_centavos, valor_total_venda_centavos)
+            VALUES (?, {", ".join("?" * len(CAMPOS_CADASTRO))}, 0, 0, 0, 0)
+        ''', (evento["chave"],) + valores)
+
+
+# === ESTADO E IDENTIDADE ===
+def estado(db_manager):
+    # (origem deste banco, última seq, {origem: última seq recebida}, {destino: última seq enviada})
+    ultima = db_manager.consultar_um("SELECT COALESCE(MAX(seq), 0) FROM alteracoes")[0]
+    recebidas = dict(db_manager.consultar(
+        "SELECT origem, ultima_seq FROM replicas WHERE local = 0 ORDER BY origem"))
+    enviadas = dict(db_manager.consultar(
+        "SELECT destino, ultima_seq FROM destinos_sincronizacao ORDER BY destino"))
+    return origem_local(db_manager), ultima, recebidas, enviadas
+
+
+def nova_origem(db_manager):
+    # Para um banco copiado de outro (filial nova aberta com um backup): sem isso os dois teriam a
+    # mesma origem e ignorariam as mudanças um do outro. O que já estava no registro passa a constar
+    # como vindo da origem antiga, que a cópia já tem até a última seq.
+    with db_manager.transacao() as conn:
+        antiga = origem_local(db_manager)
+        ultima = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM alteracoes WHERE origem IS NULL").fetchone()[0]
+        conn.execute("UPDATE alteracoes SET origem = ?, seq_origem = seq WHERE origem IS NULL", (antiga,))
+        conn.execute("UPDATE replicas SET local = 0, ultima_seq = ? WHERE origem = ?", (ultima, antiga))
+        conn.execute("INSERT INTO replicas (origem, local) VALUES (lower(hex(randomblob(8))), 1)")
+        conn.execute("DELETE FROM destinos_sincronizacao")
+    return origem_local(db_manager)
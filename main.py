@@ -1,55 +1,62 @@
+import time
+_INICIO = time.perf_counter()  # Antes de qualquer import, para o modo de medição de inicialização
 import sys
-import shutil
 import os
 import sqlite3
-import time
-from datetime import datetime
-import csv
-import matplotlib.pyplot as plt
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
+import hashlib
+import json
+import shutil
+import threading
+import queue
+from collections import OrderedDict
+# matplotlib, reportlab e o módulo de importação CSV são carregados só no primeiro uso
 from PySide6.QtWidgets import (
     QApplication, QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout,
-    QLineEdit, QFileDialog, QMessageBox, QListWidget, QListWidgetItem, QDialog,
-    QGroupBox, QFormLayout, QMenu, QMenuBar
+    QLineEdit, QFileDialog, QMessageBox, QListView, QDialog,
+    QGroupBox, QFormLayout, QMenu, QMenuBar, QStyledItemDelegate, QStyle,
+    QStyleOptionButton, QStyleOptionFrame, QAbstractItemView, QProgressDialog, QScrollArea,
+    QCheckBox, QTableWidget, QTableWidgetItem, QHeaderView, QComboBox, QTabWidget, QGridLayout,
+    QProgressBar
+)
+from PySide6.QtGui import QFont, QPixmap, QAction, QIcon, QImage, QImageReader, QColor, QKeySequence, QShortcut
+from PySide6.QtCore import (
+    Qt, QPoint, QSize, QSettings, QRect, QAbstractListModel, QModelIndex,
+    QPersistentModelIndex, Signal, QTimer, QObject, QRunnable, QThreadPool, QThread, QEvent
 )
-from PySide6.QtGui import QFont, QPixmap, QAction, QIcon
-from PySide6.QtCore import Qt, QPoint, QSize, QSettings
-
-
-# === CLASSE PARA GERENCIAR USUÁRIOS E MERCADORIAS NO BANCO DE DADOS ===
-class DatabaseManager:
-    def __init__(self):
-        self.db_name = "stock_control.db"
-        self.create_tables()
-
-    def create_tables(self):
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        # Tabela de usuários
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                username TEXT PRIMARY KEY,
-                password TEXT NOT NULL
-            )
-        ''')
-        # Tabela de mercadorias
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS mercadorias (
-                id TEXT PRIMARY KEY,
-                nome TEXT,
-                preco_compra REAL,
-                preco_venda REAL,
-                qtd_comprada INTEGER,
-                qtd_saida INTEGER,
-                descricao TEXT,
-                valor_total_compra REAL,
-                valor_total_venda REAL,
-                imagem_path TEXT
-            )
-        ''')
-        conn.commit()
-        conn.close()
+from estoqueplus.database import DatabaseManager, EstoqueInsuficienteError, ProdutoNaoEncontradoError
+from estoqueplus import backup, desempenho
+from estoqueplus.dinheiro import centavos
+from estoqueplus.imagens import coletar_orfas, migrar_imagens
+from estoqueplus import analise, cliente, escrita, reposicao
+from estoqueplus.mercadorias import CAMPOS_LISTA, IndiceCaixa
+
+_FIM_IMPORTS = time.perf_counter()
+
+
+# === MEDIÇÃO DO TEMPO DE INICIALIZAÇÃO (ESTOQUEPLUS_MEDIR_INICIO=1 ou --medir-inicio) ===
+class MedidorInicio(QObject):
+    def __init__(self, ativo):
+        super().__init__()
+        self.ativo = ativo
+        self.aguardando = {}  # widget -> nome da marca da primeira pintura
+
+    def marcar(self, nome, desde=_INICIO, agora=None):
+        if self.ativo:
+            agora = agora or time.perf_counter()
+            print(f"⏱️ {nome}: {(agora - desde) * 1000:.1f} ms", file=sys.stderr)
+
+    def marcar_primeira_pintura(self, widget, nome, desde=_INICIO):
+        if self.ativo:
+            self.aguardando[widget] = (nome, desde)
+            widget.installEventFilter(self)
+
+    def eventFilter(self, objeto, evento):
+        if evento.type() == QEvent.Paint and objeto in self.aguardando:
+            nome, desde = self.aguardando.pop(objeto)
+            objeto.removeEventFilter(self)
+            # A pintura ainda vai acontecer; a marca sai logo depois dela
+            QTimer.singleShot(0, lambda: self.marcar(nome, desde))
+        return False
 
 
 # === DIÁLOGO DE LOGIN COM LOGO DA EMPRESA ===
@@ -120,12 +127,7 @@ class LoginDialog(QDialog):
             QMessageBox.warning(self, "Erro", "Credenciais inválidas!")
 
     def check_user(self, username, password):
-        conn = sqlite3.connect(self.db_manager.db_name)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE username = ? AND password = ?', (username, password))
-        result = cursor.fetchone()
-        conn.close()
-        return result is not None
+        return self.db_manager.check_user(username, password)
 
 
 # === DIÁLOGO PARA CRIAR USUÁRIO ===
@@ -164,11 +166,7 @@ class CreateUserDialog(QDialog):
         password = self.password_input.text()
         if username and password:
             try:
-                conn = sqlite3.connect(self.db_manager.db_name)
-                cursor = conn.cursor()
-                cursor.execute('INSERT INTO users (username, password) VALUES (?, ?)', (username, password))
-                conn.commit()
-                conn.close()
+                self.db_manager.create_user(username, password)
                 QMessageBox.information(self, "Sucesso", "Usuário criado com sucesso!")
                 self.accept()
             except sqlite3.IntegrityError:
@@ -179,37 +177,36 @@ class CreateUserDialog(QDialog):
 
 # === JANELA DE DETALHES DO PRODUTO ===
 class DetalhesProdutoDialog(QDialog):
-    def __init__(self, id_produto, nome, preco_compra, preco_venda, qtd_comprada, qtd_saida,
-                 descricao, valor_total_compra, valor_total_venda, imagem_path, parent=None):
+    def __init__(self, mercadoria, parent=None):
         super().__init__(parent)
-        self.setWindowTitle(f"Detalhes - {nome}")
+        self.setWindowTitle(f"Detalhes - {mercadoria.nome}")
         self.resize(500, 500)
-        self.id_produto = id_produto
-        self.preco_compra = preco_compra
-        self.qtd_comprada_atual = qtd_comprada
+        self.id_produto = mercadoria.id
+        self.qtd_comprada_atual = mercadoria.qtd_comprada
         layout = QVBoxLayout()
 
         # Imagem
         imagem_label = QLabel()
-        pixmap = QPixmap(imagem_path).scaled(200, 200, Qt.AspectRatioMode.KeepAspectRatio)
+        pixmap = CacheMiniaturas.instancia().obter_sincrono(mercadoria.imagem_path, 200)
         imagem_label.setPixmap(pixmap)
         imagem_label.setAlignment(Qt.AlignCenter)
         layout.addWidget(imagem_label)
 
         # Informações do produto
-        lucro_por_unidade = round(preco_venda - preco_compra, 2)
-        lucro_total = round(lucro_por_unidade * qtd_saida, 2)
+        lucro_por_unidade = mercadoria.lucro_por_unidade
+        lucro_total = mercadoria.lucro_estimado
         info = f"""
-        <b>Nome:</b> {nome}<br>
-        <b>ID:</b> {id_produto}<br>
-        <b>Descrição:</b> {descricao}<br><br>
-        <b>Preço Compra:</b> R${preco_compra:.2f}<br>
-        <b>Preço Venda:</b> R${preco_venda:.2f}<br><br>
-        <b>Quantidade Comprada:</b> {qtd_comprada}<br>
-        <b>Quantidade Vendida:</b> {qtd_saida}<br>
-        <b>Quantidade Restante:</b> {qtd_comprada - qtd_saida}<br><br>
-        <b>Total Compra:</b> R${valor_total_compra:.2f}<br>
-        <b>Total Venda:</b> R${valor_total_venda:.2f}<br><br>
+        <b>Nome:</b> {mercadoria.nome}<br>
+        <b>ID:</b> {mercadoria.id}<br>
+        <b>Descrição:</b> {mercadoria.descricao}<br><br>
+        <b>Preço Compra:</b> R${mercadoria.preco_compra:.2f}<br>
+        <b>Preço Venda:</b> R${mercadoria.preco_venda:.2f}<br><br>
+        <b>Quantidade Comprada:</b> {mercadoria.qtd_comprada}<br>
+        <b>Quantidade Vendida:</b> {mercadoria.qtd_saida}<br>
+        <b>Quantidade Restante:</b> {mercadoria.restante}<br>
+        <b>Estoque Mínimo:</b> {mercadoria.estoque_minimo or "sem alerta"}<br><br>
+        <b>Total Compra:</b> R${mercadoria.valor_total_compra:.2f}<br>
+        <b>Total Venda:</b> R${mercadoria.valor_total_venda:.2f}<br><br>
         <b>Lucro por Unidade:</b> R${lucro_por_unidade:.2f}<br>
         <b>Lucro Estimado Total:</b> R${lucro_total:.2f}
         """
@@ -252,55 +249,1262 @@ class DetalhesProdutoDialog(QDialog):
             QMessageBox.warning(self, "Erro", "Digite uma quantidade válida maior que zero.")
             return
 
-        conn = sqlite3.connect("stock_control.db")
-        cursor = conn.cursor()
-        cursor.execute('SELECT qtd_comprada FROM mercadorias WHERE id = ?', (self.id_produto,))
-        resultado = cursor.fetchone()
-
-        if resultado:
-            qc_atual = resultado[0]
-            novo_qc = qc_atual + nova_qtd
-            novo_vtc = self.preco_compra * novo_qc
-
-            cursor.execute('''
-                UPDATE mercadorias 
-                SET qtd_comprada = ?, valor_total_compra = ?
-                WHERE id = ?
-            ''', (novo_qc, novo_vtc, self.id_produto))
-            conn.commit()
-            conn.close()
-            QMessageBox.information(self, "Sucesso", f"{nova_qtd} unidades adicionadas ao estoque.")
-
-            self.nova_qtd_input.clear()
-            self.accept()
-            parent.listar_mercadorias()
-        else:
-            QMessageBox.warning(self, "Erro", "Produto não encontrado.")
+        parent.escritor.enviar(escrita.ENTRADA, id=self.id_produto, quantidade=nova_qtd)
+        parent.mercadorias_model.ajustar(self.id_produto, qtd_comprada=nova_qtd)
+        self.nova_qtd_input.clear()
+        self.accept()
 
     def excluir_produto(self, parent):
         reply = QMessageBox.question(self, 'Exclusão',
                                      f"Tem certeza que deseja excluir '{self.id_produto}'?",
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.Yes:
-            conn = sqlite3.connect("stock_control.db")
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM mercadorias WHERE id = ?', (self.id_produto,))
-            conn.commit()
-            conn.close()
-            QMessageBox.information(self, "Exclusão", "Produto excluído com sucesso.")
+            # A linha sai da lista na hora; se a exclusão falhar, ela volta
+            parent.escritor.enviar(escrita.EXCLUSAO, id=self.id_produto)
             self.accept()
-            parent.listar_mercadorias()
+            parent.mercadoria_alterada.emit(self.id_produto, MUDANCA_REMOVIDA)
+
+
+# === JANELA DO GRÁFICO DE LUCRO ===
+class GraficoLucroDialog(QDialog):
+    def __init__(self, caminho_png, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("📊 Gráfico de Lucro")
+        self.resize(1040, 720)
+        self.caminho_png = caminho_png
+        layout = QVBoxLayout()
+
+        imagem_label = QLabel()
+        imagem_label.setPixmap(QPixmap(caminho_png))
+        imagem_label.setAlignment(Qt.AlignCenter)
+        area = QScrollArea()
+        area.setWidget(imagem_label)
+        area.setWidgetResizable(True)
+        layout.addWidget(area)
+
+        botoes = QHBoxLayout()
+        salvar_button = QPushButton("💾 Salvar Imagem...")
+        salvar_button.clicked.connect(self.salvar_imagem)
+        botoes.addWidget(salvar_button)
+        close_button = QPushButton("Fechar")
+        close_button.clicked.connect(self.accept)
+        botoes.addWidget(close_button)
+        layout.addLayout(botoes)
+
+        self.setLayout(layout)
+
+    def salvar_imagem(self):
+        from estoqueplus.relatorios import PASTA_RELATORIOS
+
+        os.makedirs(PASTA_RELATORIOS, exist_ok=True)
+        destino, _ = QFileDialog.getSaveFileName(self, "Salvar Gráfico",
+                                                 os.path.join(PASTA_RELATORIOS, "grafico_lucro.png"),
+                                                 "Imagens PNG (*.png)")
+        if destino:
+            shutil.copyfile(self.caminho_png, destino)
+            QMessageBox.information(self, "Gráfico", f"Gráfico salvo em {destino}")
+
+
+# === JANELA DE DIAGNÓSTICO DE DESEMPENHO ===
+class DesempenhoDialog(QDialog):
+    medicao_alternada = Signal(bool)
+    COLUNAS = ("Categoria", "Operação", "Chamadas", "Total (ms)", "Média (ms)", "Máx (ms)", "Linhas")
+
+    def __init__(self, db_manager, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("⏱️ Desempenho")
+        self.resize(900, 500)
+        self.db_manager = db_manager
+        layout = QVBoxLayout()
+
+        self.ativo_check = QCheckBox("Medir desempenho (consultas SQL, telas, diálogos, tarefas e miniaturas)")
+        self.ativo_check.setChecked(desempenho.ativo)
+        self.ativo_check.toggled.connect(self.alternar)
+        layout.addWidget(self.ativo_check)
+
+        self.tabela = QTableWidget(0, len(self.COLUNAS))
+        self.tabela.setHorizontalHeaderLabels(self.COLUNAS)
+        self.tabela.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tabela.verticalHeader().setVisible(False)
+        self.tabela.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        layout.addWidget(self.tabela)
+
+        self.total_label = QLabel()
+        layout.addWidget(self.total_label)
+
+        botoes = QHBoxLayout()
+        limpar_button = QPushButton("Limpar")
+        limpar_button.clicked.connect(self.limpar)
+        botoes.addWidget(limpar_button)
+        salvar_button = QPushButton("💾 Salvar Medições...")
+        salvar_button.clicked.connect(self.salvar)
+        botoes.addWidget(salvar_button)
+        close_button = QPushButton("Fechar")
+        close_button.clicked.connect(self.close)
+        botoes.addWidget(close_button)
+        layout.addLayout(botoes)
+        self.setLayout(layout)
+
+        # Atualiza só enquanto a janela está aberta
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.atualizar)
+
+    def showEvent(self, event):
+        self.atualizar()
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def alternar(self, ativo):
+        if ativo:
+            desempenho.ativar()
+        else:
+            desempenho.desativar()
+        # A conexão desta thread é reaberta já com (ou sem) a instrumentação. As tarefas em segundo
+        # plano fecham a sua ao terminar, mas a thread de escrita vive o programa inteiro: quem ouve
+        # medicao_alternada pede a ela que reabra a conexão (EscritorBanco.reabrir_conexao)
+        self.db_manager.fechar_conexao_da_thread()
+        self.medicao_alternada.emit(ativo)
+
+    def atualizar(self):
+        linhas = desempenho.resumo()
+        self.tabela.setUpdatesEnabled(False)
+        self.tabela.setRowCount(len(linhas))
+        for i, (categoria, nome, chamadas, total, media, maximo, qtd_linhas) in enumerate(linhas):
+            valores = (categoria, nome, str(chamadas), f"{total:.1f}", f"{media:.2f}", f"{maximo:.2f}",
+                       str(qtd_linhas))
+            for coluna, valor in enumerate(valores):
+                item = QTableWidgetItem(valor)
+                if coluna >= 2:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.tabela.setItem(i, coluna, item)
+        self.tabela.setUpdatesEnabled(True)
+        self.total_label.setText(f"{len(desempenho.medicoes)} medições guardadas "
+                                 f"(máximo {desempenho.CAPACIDADE}, as mais antigas são descartadas)")
+
+    def limpar(self):
+        desempenho.limpar()
+        self.atualizar()
+
+    def salvar(self):
+        caminho, _ = QFileDialog.getSaveFileName(self, "Salvar Medições", "desempenho.jsonl",
+                                                 "JSON Lines (*.jsonl)")
+        if caminho:
+            with open(caminho, "w", encoding="utf-8") as arquivo:
+                for medicao in list(desempenho.medicoes):
+                    arquivo.write(json.dumps(medicao.como_dict(), ensure_ascii=False) + "\n")
+
+
+# === CACHE DE MINIATURAS (DISCO + MEMÓRIA LRU, DECODIFICAÇÃO EM SEGUNDO PLANO) ===
+class _SinaisMiniatura(QObject):
+    pronta = Signal(str, int, QImage)  # (imagem de origem, tamanho, miniatura)
+
+
+class _TarefaMiniatura(QRunnable):
+    def __init__(self, origem, tamanho, sinais):
+        super().__init__()
+        self.origem = origem
+        self.tamanho = tamanho
+        self.sinais = sinais
+
+    def run(self):
+        imagem = CacheMiniaturas.gerar(self.origem, self.tamanho)
+        self.sinais.pronta.emit(self.origem, self.tamanho, imagem)
+
+
+class CacheMiniaturas(QObject):
+    miniatura_pronta = Signal(str)  # imagem de origem cuja miniatura acabou de ficar pronta
+
+    PASTA = os.path.join("cache", "miniaturas")
+    CAPACIDADE = 512  # Miniaturas mantidas em memória
+    _instancia = None
+
+    @classmethod
+    def instancia(cls):
+        if cls._instancia is None:
+            cls._instancia = cls()
+        return cls._instancia
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.memoria = OrderedDict()  # (origem, tamanho) -> QPixmap, do menos ao mais recente
+        self.pendentes = set()
+        self.placeholders = {}
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(2, QThread.idealThreadCount() - 1))
+        self.sinais = _SinaisMiniatura(self)
+        self.sinais.pronta.connect(self._ao_ficar_pronta)
+
+    @classmethod
+    def caminho_em_disco(cls, origem, tamanho):
+        # Chave = caminho + mtime + tamanho do arquivo: editar a imagem invalida a miniatura
+        info = os.stat(origem)
+        chave = f"{os.path.abspath(origem)}|{info.st_mtime_ns}|{info.st_size}|{tamanho}"
+        return os.path.join(cls.PASTA, hashlib.sha1(chave.encode("utf-8")).hexdigest() + ".png")
+
+    @classmethod
+    def gerar(cls, origem, tamanho):
+        # Roda fora da thread da interface: só usa QImage, nunca QPixmap
+        # Mercadoria sem imagem (imagem_path NULL: importação CSV, servidor, cadastro sem foto) fica
+        # com o placeholder, como uma imagem ausente
+        if not origem:
+            return QImage()
+        inicio = time.perf_counter()
+        try:
+            destino = cls.caminho_em_disco(origem, tamanho)
+        except (OSError, TypeError):
+            return QImage()
+        if os.path.exists(destino):
+            imagem = QImage(destino)
+            if not imagem.isNull():
+                desempenho.registrar(desempenho.IMAGEM, "miniatura lida do cache em disco",
+                                     time.perf_counter() - inicio)
+                return imagem
+
+        leitor = QImageReader(origem)
+        leitor.setAutoTransform(True)
+        if leitor.size().isValid():
+            # Decodifica já reduzida (JPEG decodifica direto na escala menor)
+            leitor.setScaledSize(leitor.size().scaled(tamanho, tamanho, Qt.AspectRatioMode.KeepAspectRatio))
+        imagem = leitor.read()
+        if imagem.isNull():
+            return imagem
+        if imagem.width() > tamanho or imagem.height() > tamanho:
+            imagem = imagem.scaled(tamanho, tamanho, Qt.AspectRatioMode.KeepAspectRatio,
+                                   Qt.TransformationMode.SmoothTransformation)
+
+        os.makedirs(cls.PASTA, exist_ok=True)
+        temporario = f"{destino}.{threading.get_ident()}.tmp"
+        if imagem.save(temporario, "PNG"):
+            os.replace(temporario, destino)
+        desempenho.registrar(desempenho.IMAGEM, "miniatura decodificada da imagem original",
+                             time.perf_counter() - inicio)
+        return imagem
+
+    def placeholder(self, tamanho):
+        if tamanho not in self.placeholders:
+            pixmap = QPixmap(tamanho, tamanho)
+            pixmap.fill(QColor("#dddddd"))
+            self.placeholders[tamanho] = pixmap
+        return self.placeholders[tamanho]
+
+    def _lembrar(self, chave, pixmap):
+        self.memoria[chave] = pixmap
+        self.memoria.move_to_end(chave)
+        while len(self.memoria) > self.CAPACIDADE:
+            self.memoria.popitem(last=False)
+
+    def obter(self, origem, tamanho):
+        # Devolve na hora: a miniatura em memória ou um placeholder enquanto ela é gerada
+        if not origem:
+            return self.placeholder(tamanho)  # Sem imagem: nada a gerar em segundo plano
+        chave = (origem, tamanho)
+        pixmap = self.memoria.get(chave)
+        if pixmap is not None:
+            self.memoria.move_to_end(chave)
+            return pixmap
+        if chave not in self.pendentes:
+            self.pendentes.add(chave)
+            self.pool.start(_TarefaMiniatura(origem, tamanho, self.sinais))
+        return self.placeholder(tamanho)
+
+    def obter_sincrono(self, origem, tamanho):
+        # Para diálogos que precisam da imagem já na abertura
+        chave = (origem, tamanho)
+        pixmap = self.memoria.get(chave)
+        if pixmap is None:
+            imagem = self.gerar(origem, tamanho)
+            pixmap = QPixmap.fromImage(imagem) if not imagem.isNull() else self.placeholder(tamanho)
+            self._lembrar(chave, pixmap)
+        else:
+            self.memoria.move_to_end(chave)
+        return pixmap
+
+    def _ao_ficar_pronta(self, origem, tamanho, imagem):
+        chave = (origem, tamanho)
+        self.pendentes.discard(chave)
+        # Imagem ausente ou inválida fica com o placeholder para não ser tentada a cada pintura
+        pixmap = QPixmap.fromImage(imagem) if not imagem.isNull() else self.placeholder(tamanho)
+        self._lembrar(chave, pixmap)
+        self.miniatura_pronta.emit(origem)
+
+
+# === TIPOS DE MUDANÇA AVISADOS PELO SINAL mercadoria_alterada ===
+MUDANCA_INSERIDA = "inserida"
+MUDANCA_ATUALIZADA = "atualizada"
+MUDANCA_REMOVIDA = "removida"
+
+
+# === MODELO DA LISTA DE MERCADORIAS (CARREGAMENTO SOB DEMANDA) ===
+class MercadoriasModel(QAbstractListModel):
+    TAMANHO_LOTE = 100  # Linhas buscadas no banco a cada fetchMore
+    LIMITE_BUSCA = 500  # Máximo de resultados de uma busca
+    TAMANHO_IMAGEM = 100
+    # Ordenações da listagem (a busca ordena por relevância): chave do DatabaseManager -> rótulo
+    ORDENACOES = (
+        ("nome", "Nome (A-Z)"),
+        ("restante", "Menor estoque"),
+        ("lucro", "Maior lucro"),
+        ("ultima_movimentacao", "Movimentação mais recente"),
+    )
+
+    def __init__(self, db_manager, parent=None):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.repositorio = cliente.repositorio_de(db_manager)
+        self.termo_busca = ""
+        self.ordem = "nome"
+        self.linhas = []
+        self.chaves = []  # Chave de ordenação de cada linha carregada (None na busca)
+        self.posicoes = {}  # id -> linha carregada
+        self.ultima_chave = None  # De onde a próxima página da listagem continua
+        self.tem_mais = True
+        self.miniaturas = CacheMiniaturas.instancia()
+        self.miniaturas.miniatura_pronta.connect(self.atualizar_miniaturas)
+
+    def carregar(self, termo_busca="", ordem=None):
+        self.beginResetModel()
+        self.termo_busca = termo_busca.strip()
+        self.ordem = ordem or self.ordem
+        self.linhas = []
+        self.chaves = []
+        self.posicoes = {}
+        self.ultima_chave = None
+        self.tem_mais = True
+        self.endResetModel()
+        # Apenas o primeiro lote; o restante vem conforme a rolagem
+        self.fetchMore(QModelIndex())
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.linhas)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.tem_mais
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self.tem_mais:
+            return
+        with desempenho.medir(desempenho.TELA, "carregar lote da lista"):
+            self._buscar_lote()
+
+    def _buscar_lote(self):
+        if self.termo_busca:
+            # Busca: no máximo LIMITE_BUSCA resultados, então o OFFSET fica sempre pequeno
+            limite = min(self.TAMANHO_LOTE, self.LIMITE_BUSCA - len(self.linhas))
+            novas = self.repositorio.buscar(self.termo_busca, limite, len(self.linhas), CAMPOS_LISTA)
+            chaves = [None] * len(novas)
+            self.tem_mais = len(novas) == limite and len(self.linhas) + len(novas) < self.LIMITE_BUSCA
+        else:
+            # Listagem: página seguinte pela chave da última linha, sem OFFSET
+            novas, chaves = self.repositorio.listar(self.ordem, self.TAMANHO_LOTE, self.ultima_chave, CAMPOS_LISTA)
+            self.tem_mais = len(novas) == self.TAMANHO_LOTE
+            if chaves:
+                self.ultima_chave = chaves[-1]
+            # Uma linha alterada depois de carregada pode ter mudado de chave e voltar numa página adiante
+            pares = [(m, chave) for m, chave in zip(novas, chaves) if m.id not in self.posicoes]
+            novas, chaves = [m for m, _ in pares], [chave for _, chave in pares]
+        if novas:
+            inicio = len(self.linhas)
+            self.beginInsertRows(QModelIndex(), inicio, inicio + len(novas) - 1)
+            self.linhas.extend(novas)
+            self.chaves.extend(chaves)
+            for posicao, mercadoria in enumerate(novas, inicio):
+                self.posicoes[mercadoria.id] = posicao
+            self.endInsertRows()
+
+    def mercadoria(self, id_p):
+        posicao = self.posicoes.get(id_p)
+        return self.linhas[posicao] if posicao is not None else None
+
+    def ajustar(self, id_p, qtd_comprada=0, qtd_saida=0):
+        # Atualização otimista: a linha mostra a venda/entrada antes de a gravação terminar;
+        # quando ela termina (ou falha), a linha é relida do banco
+        posicao = self.posicoes.get(id_p)
+        if posicao is None:
+            return
+        mercadoria = self.linhas[posicao]
+        mercadoria.qtd_comprada += qtd_comprada
+        mercadoria.qtd_saida += qtd_saida
+        index = self.index(posicao)
+        self.dataChanged.emit(index, index)
+
+    def _antes(self, chave, outra):
+        # Se `chave` vem antes de `outra` na ordenação atual
+        _coluna, direcao = self.db_manager.ORDENACOES[self.ordem]
+        return chave < outra if direcao == "ASC" else chave > outra
+
+    def _renumerar(self, inicio):
+        for i in range(inicio, len(self.linhas)):
+            self.posicoes[self.linhas[i].id] = i
+
+    def aplicar_mudanca(self, id_p, tipo):
+        with desempenho.medir(desempenho.TELA, f"aplicar mudança ({tipo})"):
+            self._aplicar_mudanca(id_p, tipo)
+
+    def _aplicar_mudanca(self, id_p, tipo):
+        # Atualiza só a linha afetada, sem reconsultar o catálogo
+        posicao = self.posicoes.get(id_p)
+        if tipo == MUDANCA_REMOVIDA:
+            if posicao is not None:
+                self.beginRemoveRows(QModelIndex(), posicao, posicao)
+                del self.linhas[posicao]
+                del self.chaves[posicao]
+                del self.posicoes[id_p]
+                self._renumerar(posicao)
+                self.endRemoveRows()
+            return
+
+        if posicao is None and tipo == MUDANCA_ATUALIZADA:
+            return  # Linha não carregada: nada a reler
+        mercadoria = self.repositorio.obter(id_p, CAMPOS_LISTA)
+        if mercadoria is None:
+            return
+        if posicao is not None:
+            # A linha fica onde está, mesmo que a venda mude sua chave: nada pula sob o mouse
+            self.linhas[posicao] = mercadoria
+            index = self.index(posicao)
+            self.dataChanged.emit(index, index)
+        elif tipo == MUDANCA_INSERIDA and self.termo_busca:
+            # Com lotes ainda por buscar, a nova linha chega no fetchMore
+            if self.tem_mais or not self.db_manager.mercadoria_corresponde(id_p, self.termo_busca):
+                return
+            self._inserir(len(self.linhas), mercadoria, None)
+        elif tipo == MUDANCA_INSERIDA:
+            chave = self.repositorio.chave_ordenacao(self.ordem, id_p)
+            if self.tem_mais and (self.ultima_chave is None or not self._antes(chave, self.ultima_chave)):
+                return  # Fica depois da última página carregada: chega no fetchMore
+            posicao = next((i for i, outra in enumerate(self.chaves) if self._antes(chave, outra)),
+                           len(self.linhas))
+            self._inserir(posicao, mercadoria, chave)
+
+    def _inserir(self, posicao, mercadoria, chave):
+        self.beginInsertRows(QModelIndex(), posicao, posicao)
+        self.linhas.insert(posicao, mercadoria)
+        self.chaves.insert(posicao, chave)
+        self._renumerar(posicao)
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.linhas):
+            return None
+        mercadoria = self.linhas[index.row()]
+        if role == Qt.UserRole:
+            return mercadoria
+        if role == Qt.DisplayRole:
+            return mercadoria.nome
+        if role == Qt.DecorationRole:
+            return self.miniaturas.obter(mercadoria.imagem_path, self.TAMANHO_IMAGEM)
+        return None
+
+    def atualizar_miniaturas(self, origem):
+        # A view só repinta o que está visível, então avisar a faixa inteira é barato
+        if self.linhas:
+            self.dataChanged.emit(self.index(0), self.index(len(self.linhas) - 1), [Qt.DecorationRole])
+
+
+# === DELEGATE QUE PINTA CADA MERCADORIA E CRIA O EDITOR DE VENDA SOB DEMANDA ===
+class MercadoriaDelegate(QStyledItemDelegate):
+    venda_solicitada = Signal(object, object)  # (Mercadoria, campo de quantidade)
+
+    MARGEM = 6
+    ALTURA_LINHA = 112
+    LARGURA_VENDA = 130
+
+    def area_venda(self, rect):
+        return QRect(rect.right() - self.LARGURA_VENDA - self.MARGEM, rect.top() + self.MARGEM,
+                     self.LARGURA_VENDA, rect.height() - 2 * self.MARGEM)
+
+    def sizeHint(self, option, index):
+        # Largura acompanha a área visível; só a altura fixa importa para a virtualização
+        return QSize(0, self.ALTURA_LINHA)
+
+    def paint(self, painter, option, index):
+        m = index.data(Qt.UserRole)
+        if not m:
+            return
+        style = option.widget.style() if option.widget else QApplication.style()
+
+        painter.save()
+        style.drawPrimitive(QStyle.PE_PanelItemViewItem, option, painter, option.widget)
+
+        rect = option.rect
+        pixmap = index.data(Qt.DecorationRole)
+        tamanho = MercadoriasModel.TAMANHO_IMAGEM
+        img_rect = QRect(rect.left() + self.MARGEM, rect.top() + (rect.height() - tamanho) // 2,
+                         tamanho, tamanho)
+        if pixmap is not None and not pixmap.isNull():
+            # Miniaturas mantêm a proporção; centraliza no quadro
+            alvo = QRect(QPoint(0, 0), pixmap.size().scaled(img_rect.size(), Qt.AspectRatioMode.KeepAspectRatio))
+            alvo.moveCenter(img_rect.center())
+            painter.drawPixmap(alvo, pixmap)
+
+        if option.state & QStyle.State_Selected:
+            painter.setPen(option.palette.highlightedText().color())
+        else:
+            painter.setPen(option.palette.text().color())
+
+        area_venda = self.area_venda(rect)
+        texto_x = img_rect.right() + 2 * self.MARGEM
+        largura_texto = area_venda.left() - self.MARGEM - texto_x
+        fonte = QFont(option.font)
+        fonte_negrito = QFont(option.font)
+        fonte_negrito.setBold(True)
+        altura = option.fontMetrics.height()
+        linhas = [
+            (fonte_negrito, f"ID: {m.id}"),
+            (fonte_negrito, m.nome),
+            (fonte, f"{m.descricao_curta}..."),
+            (fonte, f"Comprada: {m.qtd_comprada} | Vendida: {m.qtd_saida}"),
+            (fonte, f"Restante: {m.restante}"),
+            (fonte, f"Lucro Estimado: R${m.lucro_estimado:.2f}"),
+        ]
+        y = rect.top() + (rect.height() - altura * len(linhas)) // 2
+        for f, texto in linhas:
+            painter.setFont(f)
+            texto = painter.fontMetrics().elidedText(texto, Qt.ElideRight, largura_texto)
+            painter.drawText(QRect(texto_x, y, largura_texto, altura), Qt.AlignLeft | Qt.AlignVCenter, texto)
+            y += altura
+
+        # Controles de venda apenas pintados; o editor real só existe na linha sob o mouse
+        campo_rect, botao_rect = self.retangulos_venda(area_venda)
+        opt_campo = QStyleOptionFrame()
+        opt_campo.rect = campo_rect
+        opt_campo.palette = option.palette
+        opt_campo.lineWidth = 1
+        opt_campo.state = QStyle.State_Enabled | QStyle.State_Sunken
+        style.drawPrimitive(QStyle.PE_PanelLineEdit, opt_campo, painter, option.widget)
+        painter.setPen(option.palette.placeholderText().color())
+        painter.setFont(fonte)
+        painter.drawText(campo_rect.adjusted(4, 0, -4, 0), Qt.AlignLeft | Qt.AlignVCenter, "Qtd Vendida")
+
+        opt_botao = QStyleOptionButton()
+        opt_botao.rect = botao_rect
+        opt_botao.palette = option.palette
+        opt_botao.text = "Registrar Venda"
+        opt_botao.state = QStyle.State_Enabled | QStyle.State_Raised
+        style.drawControl(QStyle.CE_PushButton, opt_botao, painter, option.widget)
+        painter.restore()
+
+    def retangulos_venda(self, area):
+        altura = 28
+        topo = area.top() + (area.height() - 2 * altura - self.MARGEM) // 2
+        campo = QRect(area.left(), topo, area.width(), altura)
+        botao = QRect(area.left(), topo + altura + self.MARGEM, area.width(), altura)
+        return campo, botao
+
+    def createEditor(self, parent, option, index):
+        mercadoria = index.data(Qt.UserRole)
+        editor = QWidget(parent)
+        editor.setAutoFillBackground(False)
+        layout = QVBoxLayout(editor)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(self.MARGEM)
+
+        qtd_saida_input = QLineEdit()
+        qtd_saida_input.setPlaceholderText("Qtd Vendida")
+        qtd_saida_input.setFixedHeight(28)
+        btn_vender = QPushButton("Registrar Venda")
+        btn_vender.setFixedHeight(28)
+        btn_vender.clicked.connect(lambda _=False: self.venda_solicitada.emit(mercadoria, qtd_saida_input))
+        qtd_saida_input.returnPressed.connect(btn_vender.click)
+
+        layout.addStretch()
+        layout.addWidget(qtd_saida_input)
+        layout.addWidget(btn_vender)
+        layout.addStretch()
+        return editor
+
+    def updateEditorGeometry(self, editor, option, index):
+        editor.setGeometry(self.area_venda(option.rect))
+
+    def setEditorData(self, editor, index):
+        pass
+
+    def setModelData(self, editor, model, index):
+        pass
+
+
+# === TAREFA LONGA FORA DA THREAD DA INTERFACE ===
+class TarefaEmSegundoPlano(QThread):
+    progresso = Signal(int)
+    concluida = Signal(object)
+    falhou = Signal(str)
+
+    def __init__(self, db_manager, funcao, parent=None, nome="tarefa"):
+        # funcao(progresso=callable(int), cancelar=callable() -> bool) roda nesta thread
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.funcao = funcao
+        self.nome = nome
+        self.cancelada = False
+
+    def cancelar(self):
+        self.cancelada = True
+
+    def run(self):
+        try:
+            with desempenho.medir(desempenho.TAREFA, self.nome):
+                resultado = self.funcao(progresso=self.progresso.emit, cancelar=lambda: self.cancelada)
+        except Exception as e:
+            if self.cancelada:
+                # Cancelamento pedido pelo usuário não é falha: conclui sem resultado
+                self.concluida.emit(None)
+            else:
+                self.falhou.emit(str(e))
+        else:
+            self.concluida.emit(resultado)
+        finally:
+            self.db_manager.fechar_conexao_da_thread()
+
+
+# === ESCRITOR DO BANCO: FILA DE OPERAÇÕES GRAVADAS FORA DA THREAD DA INTERFACE ===
+class EscritorBanco(QThread):
+    concluida = Signal(object, object)  # (Operacao, resultado)
+    falhou = Signal(object, object)     # (Operacao, exceção)
+    recuperadas = Signal(int, int)      # (gravadas, recusadas) do diário da sessão anterior
+
+    LOTE_MAXIMO = 500  # Operações por COMMIT
+    REABRIR = "reabrir conexão"  # Comando na fila: fecha a conexão desta thread depois do lote atual
+
+    def __init__(self, db_manager, diario, parent=None):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.diario = diario
+        # Terminal ligado a um servidor: o lote vai num POST em vez de uma transação local
+        remoto = isinstance(db_manager, cliente.ClienteEstoque)
+        self.aplicar_lote = cliente.aplicar_lote if remoto else escrita.aplicar_lote
+        self.fila = queue.Queue()
+        self.do_diario = []           # Ids das operações gravadas desde que o diário foi esvaziado
+        self.limpar_aplicadas = None  # Ids a retirar de operacoes_aplicadas no próximo lote
+
+    def enviar(self, tipo, **dados):
+        # Volta na hora: a operação fica no diário e na fila, e o resultado chega pelos sinais
+        operacao = escrita.Operacao(tipo, dados)
+        self.diario.registrar(operacao)
+        self.fila.put(operacao)
+        return operacao
+
+    def aguardar(self):
+        # Bloqueia até a fila esvaziar (fechamento da janela, benchmarks)
+        self.fila.join()
+
+    def reabrir_conexao(self):
+        # A conexão é da thread de escrita, então é ela quem a fecha; a próxima gravação abre outra,
+        # já com (ou sem) a instrumentação de desempenho
+        self.fila.put(self.REABRIR)
+
+    def encerrar(self):
+        if self.isRunning():
+            self.fila.put(None)
+            self.wait()
+        self.diario.fechar()
+
+    def run(self):
+        try:
+            if self.diario.recuperadas:
+                # Operações que ficaram no diário quando o programa fechou da última vez
+                resultados = self._gravar(self.diario.recuperadas, avisar=False)
+                recusadas = sum(1 for _op, _r, erro in resultados if erro is not None)
+                self.recuperadas.emit(len(resultados) - recusadas, recusadas)
+            encerrar = False
+            while not encerrar:
+                lote = [self.fila.get()]
+                # Agrupa o que chegou enquanto o lote anterior era gravado: um COMMIT para todos
+                while len(lote) < self.LOTE_MAXIMO:
+                    try:
+                        lote.append(self.fila.get_nowait())
+                    except queue.Empty:
+                        break
+                if None in lote:
+                    encerrar = True
+                operacoes = []
+                for item in lote:
+                    if item is self.REABRIR:
+                        # O que chegou antes do comando ainda grava pela conexão atual
+                        if operacoes:
+                            self._gravar(operacoes)
+                            operacoes = []
+                        self.db_manager.fechar_conexao_da_thread()
+                    elif item is not None:
+                        operacoes.append(item)
+                if operacoes:
+                    self._gravar(operacoes)
+                for _ in lote:
+                    self.fila.task_done()
+        finally:
+            self.db_manager.fechar_conexao_da_thread()
+
+    def _gravar(self, operacoes, avisar=True):
+        with desempenho.medir(desempenho.TAREFA, "gravar lote da fila de escrita"):
+            try:
+                resultados = self.aplicar_lote(self.db_manager, operacoes, self.limpar_aplicadas)
+            except (sqlite3.Error, OSError) as e:
+                # O lote inteiro foi desfeito (disco cheio, banco travado, servidor fora do ar...): todas falham
+                resultados = [(op, None, e) for op in operacoes]
+            else:
+                self.limpar_aplicadas = None
+        # Gravadas ou recusadas, saem do diário; vazio, os ids deste terminal já não servem para nada
+        # (os de outros terminais no mesmo banco ficam até o diário deles esvaziar)
+        self.do_diario.extend(op.id for op in operacoes)
+        if self.diario.concluir(len(operacoes)):
+            self.limpar_aplicadas = (self.limpar_aplicadas or []) + self.do_diario
+            self.do_diario = []
+        for operacao, resultado, erro in resultados if avisar else ():
+            if erro is None:
+                self.concluida.emit(operacao, resultado)
+            else:
+                self.falhou.emit(operacao, erro)
+        return resultados
+
+
+# === EVENTOS DO SERVIDOR: MUDANÇAS FEITAS POR OUTROS TERMINAIS ===
+class OuvinteEventos(QThread):
+    mudanca = Signal(str, str)  # (id da mercadoria, tipo de mudança)
+    recarregar = Signal()       # Eventos perdidos (reconexão tardia): a lista precisa ser relida
+
+    ESPERA_RECONEXAO = 2000  # ms
+
+    def __init__(self, cliente_estoque, parent=None):
+        super().__init__(parent)
+        self.cliente = cliente_estoque
+        self.assinatura = None
+        self.parar = False
+
+    def run(self):
+        ultimo_id = None
+        while not self.parar:
+            try:
+                self.assinatura = self.cliente.eventos(ultimo_id)
+                for evento in self.assinatura:
+                    if evento["evento"] == "recarregar":
+                        self.recarregar.emit()
+                    elif evento["evento"] == "mercadoria":
+                        self.mudanca.emit(evento["id"], evento["tipo"])
+                ultimo_id = self.assinatura.ultimo_id
+            except OSError:
+                if self.assinatura is not None:
+                    ultimo_id = self.assinatura.ultimo_id
+            # Caiu (ou o servidor reiniciou): tenta de novo, continuando do último evento recebido
+            for _ in range(self.ESPERA_RECONEXAO // 100):
+                if self.parar:
+                    break
+                self.msleep(100)
+
+    def encerrar(self):
+        self.parar = True
+        if self.assinatura is not None:
+            self.assinatura.fechar()
+        self.wait()
+
+
+# === MODO CAIXA: LEITURA DE CÓDIGOS, CARRINHO E VENDA NUMA ÚNICA TRANSAÇÃO ===
+class CaixaWidget(QWidget):
+    itens_vendidos = Signal(object)  # [[id, quantidade], ...] de uma venda enviada à fila de escrita
+
+    COLUNAS = ("Código", "Produto", "Qtd", "Preço (R$)", "Subtotal (R$)")
+    ESTILO_ERRO = "font-size: 14px; color: #c62828;"
+    ESTILO_OK = "font-size: 14px; color: #2e7d32;"
+
+    def __init__(self, indice, escritor, parent=None):
+        super().__init__(parent)
+        self.indice = indice
+        self.escritor = escritor
+        self.itens = {}  # id -> [Mercadoria, quantidade], na ordem das linhas da tabela
+        self.linhas = {}  # id -> linha da tabela
+        self.enviadas = {}  # id da operação -> (itens, total) das vendas ainda não confirmadas
+        self.tarefa_pre_carga = None
+        layout = QVBoxLayout()
+
+        # Leitor de código de barras = teclado que digita o código e tecla Enter
+        self.codigo_input = QLineEdit()
+        self.codigo_input.setPlaceholderText("Código de barras ou ID do produto + Enter (3*ID para 3 unidades)")
+        self.codigo_input.setFont(QFont("Arial", 16))
+        self.codigo_input.returnPressed.connect(self.ler_codigo)
+        layout.addWidget(self.codigo_input)
+
+        self.tabela = QTableWidget(0, len(self.COLUNAS))
+        self.tabela.setHorizontalHeaderLabels(self.COLUNAS)
+        self.tabela.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tabela.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.tabela.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.tabela.setFocusPolicy(Qt.NoFocus)  # O foco fica sempre no campo do leitor
+        self.tabela.verticalHeader().setVisible(False)
+        self.tabela.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        layout.addWidget(self.tabela)
+
+        self.total_label = QLabel()
+        self.total_label.setFont(QFont("Arial", 20, QFont.Bold))
+        self.total_label.setAlignment(Qt.AlignRight)
+        layout.addWidget(self.total_label)
+
+        # Avisos aqui, sem diálogos: nada interrompe a sequência de leituras
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+
+        botoes = QHBoxLayout()
+        for texto, tecla, acao in (("✅ Finalizar Venda (F12)", "F12", self.finalizar),
+                                   ("➖ Remover Item (Ctrl+Del)", "Ctrl+Del", self.remover_item),
+                                   ("❌ Cancelar Venda (Esc)", "Esc", self.cancelar)):
+            botao = QPushButton(texto)
+            botao.setFocusPolicy(Qt.NoFocus)
+            botao.clicked.connect(acao)
+            botoes.addWidget(botao)
+            atalho = QShortcut(QKeySequence(tecla), self)
+            atalho.setContext(Qt.WidgetWithChildrenShortcut)
+            atalho.activated.connect(acao)
+        layout.addLayout(botoes)
+        self.setLayout(layout)
+        self.atualizar_total()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.codigo_input.setFocus()
+        if self.tarefa_pre_carga is None:
+            # Na primeira abertura, o catálogo inteiro vai para o índice em segundo plano;
+            # enquanto isso, cada código lido ainda não indexado custa uma consulta pela chave
+            self.indice.iniciar_pre_carga()
+            self.tarefa_pre_carga = TarefaEmSegundoPlano(
+                self.indice.repositorio.db_manager, lambda progresso, cancelar: self.indice.carregar_tudo(),
+                self, nome="pré-carga do índice do caixa")
+            self.tarefa_pre_carga.concluida.connect(self.indice.completar)
+            self.tarefa_pre_carga.falhou.connect(lambda _erro: self.indice.completar(None))
+            self.tarefa_pre_carga.start()
+
+    def encerrar(self):
+        if self.tarefa_pre_carga is not None:
+            self.tarefa_pre_carga.wait()
+
+    def avisar(self, texto, erro=False):
+        self.status_label.setStyleSheet(self.ESTILO_ERRO if erro else self.ESTILO_OK)
+        self.status_label.setText(texto)
+
+    def total(self):
+        # Em centavos inteiros, como o banco soma a venda
+        return sum(centavos(mercadoria.preco_venda) * quantidade
+                   for mercadoria, quantidade in self.itens.values()) / 100
+
+    def atualizar_total(self):
+        quantidade = sum(q for _m, q in self.itens.values())
+        self.total_label.setText(f"{quantidade} item(ns) — Total: R$ {self.total():.2f}")
+
+    def ler_codigo(self):
+        texto = self.codigo_input.text().strip()
+        self.codigo_input.clear()
+        if not texto:
+            return
+        quantidade = 1
+        if "*" in texto:
+            qtd_texto, _sep, texto = texto.partition("*")
+            try:
+                quantidade = int(qtd_texto)
+                if quantidade <= 0:
+                    raise ValueError
+            except ValueError:
+                self.avisar(f"Quantidade inválida: {qtd_texto}", erro=True)
+                return
+            texto = texto.strip()
+        self.lancar(texto, quantidade)
+
+    def lancar(self, id_p, quantidade=1):
+        # Um acesso ao índice em memória; ler o mesmo código de novo soma na linha existente
+        mercadoria = self.indice.obter(id_p)
+        if mercadoria is None:
+            self.avisar(f"Produto '{id_p}' não encontrado.", erro=True)
+            return False
+        item = self.itens.get(id_p)
+        no_carrinho = item[1] if item else 0
+        if no_carrinho + quantidade > mercadoria.restante:
+            self.avisar(f"Estoque insuficiente de {mercadoria.nome}: "
+                        f"{mercadoria.restante - no_carrinho} disponível(is).", erro=True)
+            return False
+        if item is None:
+            item = self.itens[id_p] = [mercadoria, 0]
+            linha = self.linhas[id_p] = self.tabela.rowCount()
+            self.tabela.insertRow(linha)
+            for coluna, valor in enumerate((id_p, mercadoria.nome, "", f"{mercadoria.preco_venda:.2f}", "")):
+                celula = QTableWidgetItem(valor)
+                if coluna >= 2:
+                    celula.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.tabela.setItem(linha, coluna, celula)
+        item[1] += quantidade
+        linha = self.linhas[id_p]
+        self.tabela.item(linha, 2).setText(str(item[1]))
+        self.tabela.item(linha, 4).setText(f"{centavos(mercadoria.preco_venda) * item[1] / 100:.2f}")
+        self.tabela.selectRow(linha)
+        self.tabela.scrollToItem(self.tabela.item(linha, 0))
+        self.atualizar_total()
+        self.avisar(f"{quantidade} × {mercadoria.nome}")
+        return True
+
+    def remover_item(self):
+        # Remove a linha selecionada (ou a última lida)
+        if not self.itens:
+            return
+        selecionadas = self.tabela.selectionModel().selectedRows()
+        linha = selecionadas[0].row() if selecionadas else self.tabela.rowCount() - 1
+        id_p = self.tabela.item(linha, 0).text()
+        mercadoria, _quantidade = self.itens.pop(id_p)
+        self.tabela.removeRow(linha)
+        self.linhas = {id_item: i for i, id_item in enumerate(self.itens)}
+        self.atualizar_total()
+        self.avisar(f"Removido: {mercadoria.nome}")
+
+    def limpar(self):
+        self.itens = {}
+        self.linhas = {}
+        self.tabela.setRowCount(0)
+        self.atualizar_total()
+
+    def cancelar(self):
+        if self.itens:
+            self.limpar()
+            self.avisar("Venda cancelada.")
+
+    def finalizar(self):
+        if not self.itens:
+            self.avisar("Nenhum item no carrinho.", erro=True)
+            return
+        # Todos os itens numa operação só: a thread de escrita grava tudo ou nada
+        itens = [[id_p, quantidade] for id_p, (_m, quantidade) in self.itens.items()]
+        total = self.total()
+        operacao = self.escritor.enviar(escrita.CAIXA, itens=itens)
+        self.enviadas[operacao.id] = (itens, total)
+        self.indice.baixar(itens)
+        self.itens_vendidos.emit(itens)
+        self.limpar()
+        self.avisar(f"Venda de R$ {total:.2f} enviada.")
+        self.codigo_input.setFocus()
+
+    def venda_gravada(self, operacao):
+        _itens, total = self.enviadas.pop(operacao.id, (None, 0.0))
+        self.avisar(f"Venda de R$ {total:.2f} gravada.")
+
+    def venda_recusada(self, operacao, mensagem):
+        itens, _total = self.enviadas.pop(operacao.id, (operacao.dados["itens"], 0.0))
+        if not self.itens:
+            # Nada lido depois dela: os itens voltam ao carrinho para corrigir e finalizar de novo
+            for id_p, quantidade in itens:
+                self.lancar(id_p, quantidade)
+        self.avisar(f"Venda não gravada, nada foi registrado: {mensagem}", erro=True)
+
+
+# === PAINEL DE REPOSIÇÃO: MERCADORIAS ABAIXO DO ESTOQUE MÍNIMO ===
+class ReposicaoWidget(QWidget):
+    alertas_mudaram = Signal(int)  # Quantidade de mercadorias abaixo do mínimo
+    mercadoria_escolhida = Signal(str)  # Duplo clique numa linha
+
+    COLUNAS = ("Código", "Produto", "Restante", "Mínimo", "Comprar", "Custo (R$)", "Abaixo desde")
+    LIMITE_TABELA = 1000  # As mais urgentes; a lista exportada traz todas
+
+    def __init__(self, db_manager, parent=None):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.itens = []
+        self.tarefa = None
+        self.pendente = False
+        self.desatualizada = True  # A tabela só é refeita com a aba à vista
+        layout = QVBoxLayout()
+
+        self.resumo_label = QLabel()
+        self.resumo_label.setFont(QFont("Arial", 14, QFont.Bold))
+        layout.addWidget(self.resumo_label)
+
+        self.tabela = QTableWidget(0, len(self.COLUNAS))
+        self.tabela.setHorizontalHeaderLabels(self.COLUNAS)
+        self.tabela.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tabela.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.tabela.verticalHeader().setVisible(False)
+        self.tabela.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.tabela.cellDoubleClicked.connect(
+            lambda linha, _coluna: self.mercadoria_escolhida.emit(self.itens[linha].id))
+        layout.addWidget(self.tabela)
+
+        botoes = QHBoxLayout()
+        atualizar_button = QPushButton("🔄 Atualizar")
+        atualizar_button.clicked.connect(self.atualizar)
+        botoes.addWidget(atualizar_button)
+        self.exportar_button = QPushButton("📄 Exportar Lista de Compras (CSV)")
+        self.exportar_button.clicked.connect(self.exportar)
+        botoes.addWidget(self.exportar_button)
+        layout.addLayout(botoes)
+        self.setLayout(layout)
+
+        # Várias vendas seguidas (o caixa, um lote do servidor) viram uma releitura só
+        self.atualizar_timer = QTimer(self)
+        self.atualizar_timer.setSingleShot(True)
+        self.atualizar_timer.setInterval(500)
+        self.atualizar_timer.timeout.connect(self.atualizar)
+
+    def agendar(self):
+        self.atualizar_timer.start()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.desatualizada:
+            self.atualizar()
+
+    def atualizar(self):
+        # A leitura percorre só alertas_estoque, mas roda fora da interface como as demais tarefas.
+        # Com a aba escondida basta a contagem para o título; a tabela espera a aba ser aberta.
+        if self.tarefa is not None:
+            self.pendente = True
+            return
+        completa = self.isVisible()
+        self.desatualizada = not completa
+        if completa:
+            funcao, ao_concluir = (lambda progresso, cancelar: reposicao.itens_reposicao(self.db_manager),
+                                   self.mostrar)
+        else:
+            funcao, ao_concluir = (lambda progresso, cancelar: self.db_manager.contar_alertas_estoque(),
+                                   self.alertas_mudaram.emit)
+        self.tarefa = TarefaEmSegundoPlano(self.db_manager, funcao, self, nome="alertas de reposição")
+        self.tarefa.concluida.connect(ao_concluir)
+        self.tarefa.falhou.connect(
+            lambda erro: self.resumo_label.setText(f"Não foi possível ler os alertas: {erro}"))
+        self.tarefa.finished.connect(self.tarefa_terminada)
+        self.tarefa.start()
+
+    def tarefa_terminada(self):
+        self.tarefa.deleteLater()
+        self.tarefa = None
+        if self.pendente:
+            self.pendente = False
+            self.atualizar()
+
+    def mostrar(self, itens):
+        self.itens = itens
+        self.tabela.setRowCount(min(len(itens), self.LIMITE_TABELA))
+        for linha, item in enumerate(itens[:self.LIMITE_TABELA]):
+            valores = (item.id, item.nome, str(item.restante), str(item.estoque_minimo), str(item.comprar),
+                       f"{item.custo:.2f}", item.desde)
+            for coluna, valor in enumerate(valores):
+                celula = QTableWidgetItem(valor)
+                if coluna >= 2:
+                    celula.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                if coluna == 2 and item.restante <= 0:
+                    celula.setForeground(QColor("#c62828"))  # Esgotada
+                self.tabela.setItem(linha, coluna, celula)
+        if itens:
+            total = sum(centavos(item.custo) for item in itens) / 100
+            self.resumo_label.setText(f"⚠️ {len(itens)} mercadoria(s) abaixo do estoque mínimo — "
+                                      f"compra sugerida: R$ {total:.2f}" +
+                                      (f" (mostrando as {self.LIMITE_TABELA} mais urgentes)"
+                                       if len(itens) > self.LIMITE_TABELA else ""))
+        else:
+            self.resumo_label.setText("✅ Nenhuma mercadoria abaixo do estoque mínimo.")
+        self.exportar_button.setEnabled(bool(itens))
+        self.alertas_mudaram.emit(len(itens))
+
+    def exportar(self):
+        caminho, _ = QFileDialog.getSaveFileName(self, "Exportar Lista de Compras", "lista_de_compras.csv",
+                                                 "Planilhas CSV (*.csv)")
+        if not caminho:
+            return
+        try:
+            reposicao.exportar_lista_compras(self.itens, caminho)
+        except OSError as e:
+            QMessageBox.warning(self, "Erro", f"Não foi possível salvar a lista: {e}")
+            return
+        QMessageBox.information(self, "Lista de Compras",
+                                f"Lista salva em {caminho}.\nQuando a mercadoria chegar, o mesmo arquivo "
+                                f"registra as entradas: python -m estoqueplus entradas "
+                                f"{os.path.basename(caminho)}")
+
+    def encerrar(self):
+        self.atualizar_timer.stop()
+        if self.tarefa is not None:
+            self.tarefa.wait()
+
+
+# === PAINEL DE ANÁLISE: VALOR DO ESTOQUE, MARGENS, CURVA ABC, ESCOAMENTO E GIRO ===
+class AnaliseWidget(QWidget):
+    # Rótulos e barras criados uma vez; cada atualização só troca textos (nenhuma tabela é refeita)
+    INDICADORES = (
+        ("valor_custo", "Estoque a preço de custo:"),
+        ("valor_venda", "Estoque a preço de venda:"),
+        ("lucro_potencial", "Lucro potencial do estoque:"),
+        ("unidades", "Unidades em estoque:"),
+        ("receita", "Receita das vendas:"),
+        ("margem_media", "Margem média realizada:"),
+        ("escoamento", "Escoamento (vendidas/compradas):"),
+        ("giro", "Giro do estoque:"),
+        ("cobertura", "Cobertura do estoque:"),
+        ("encalhados", "Com estoque e nenhuma venda:"),
+    )
+
+    def __init__(self, db_manager, parent=None):
+        super().__init__(parent)
+        # Terminal de um servidor: a análise é calculada (e guardada) no servidor
+        if isinstance(db_manager, cliente.ClienteEstoque):
+            self.calcular = lambda progresso, cancelar: db_manager.analise_estoque()
+        else:
+            self.calcular = lambda progresso, cancelar: analise.analisar_estoque(db_manager, progresso, cancelar)
+        self.db_manager = db_manager
+        self.tarefa = None
+        self.pendente = False
+        self.desatualizada = True  # Calculada só com a aba à vista
+        layout = QVBoxLayout()
+
+        self.resumo_label = QLabel("Abra a aba para calcular a análise.")
+        self.resumo_label.setFont(QFont("Arial", 14, QFont.Bold))
+        layout.addWidget(self.resumo_label)
+
+        grupo = QGroupBox("Indicadores")
+        grade = QGridLayout()
+        self.valores = {}
+        for posicao, (chave, titulo) in enumerate(self.INDICADORES):
+            valor = QLabel("—")
+            valor.setFont(QFont("Arial", 11, QFont.Bold))
+            grade.addWidget(QLabel(titulo), posicao // 2, (posicao % 2) * 2)
+            grade.addWidget(valor, posicao // 2, (posicao % 2) * 2 + 1)
+            self.valores[chave] = valor
+        grupo.setLayout(grade)
+        layout.addWidget(grupo)
+
+        grupo = QGroupBox("Margem sobre o preço de venda (produtos por faixa)")
+        grade = QGridLayout()
+        self.barras_margem = []
+        for linha, rotulo in enumerate(analise.rotulos_faixas()):
+            barra = QProgressBar()
+            grade.addWidget(QLabel(rotulo), linha, 0)
+            grade.addWidget(barra, linha, 1)
+            self.barras_margem.append(barra)
+        grupo.setLayout(grade)
+        layout.addWidget(grupo)
+
+        grupo = QGroupBox("Curva ABC (participação na receita)")
+        grade = QGridLayout()
+        self.linhas_abc = []
+        for linha, classe in enumerate(analise.CLASSES_ABC):
+            produtos = QLabel()
+            barra = QProgressBar()
+            grade.addWidget(QLabel(f"Classe {classe}"), linha, 0)
+            grade.addWidget(produtos, linha, 1)
+            grade.addWidget(barra, linha, 2)
+            self.linhas_abc.append((produtos, barra))
+        grade.setColumnStretch(2, 1)
+        grupo.setLayout(grade)
+        layout.addWidget(grupo)
+        layout.addStretch()
+
+        atualizar_button = QPushButton("🔄 Atualizar")
+        atualizar_button.clicked.connect(self.atualizar)
+        layout.addWidget(atualizar_button)
+        self.setLayout(layout)
+
+        # Uma rajada de vendas vira um recálculo só (e, sem mudança nos dados, a análise vem do cache)
+        self.atualizar_timer = QTimer(self)
+        self.atualizar_timer.setSingleShot(True)
+        self.atualizar_timer.setInterval(2000)
+        self.atualizar_timer.timeout.connect(self.atualizar)
+
+    def agendar(self):
+        # Com a aba escondida só marca: o cálculo espera a aba ser aberta
+        if self.isVisible():
+            self.atualizar_timer.start()
+        else:
+            self.desatualizada = True
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.desatualizada:
+            self.atualizar()
+
+    def atualizar(self):
+        if self.tarefa is not None:
+            self.pendente = True
+            return
+        self.desatualizada = False
+        self.tarefa = TarefaEmSegundoPlano(self.db_manager, self.calcular, self, nome="análise do estoque")
+        self.tarefa.concluida.connect(self.mostrar)
+        self.tarefa.falhou.connect(
+            lambda erro: self.resumo_label.setText(f"Não foi possível calcular a análise: {erro}"))
+        self.tarefa.finished.connect(self.tarefa_terminada)
+        self.tarefa.start()
+
+    def tarefa_terminada(self):
+        self.tarefa.deleteLater()
+        self.tarefa = None
+        if self.pendente:
+            self.pendente = False
+            self.atualizar()
+
+    def mostrar(self, a):
+        if a is None:
+            return
+
+        def talvez(valor, formato, sufixo):
+            return "—" if valor is None else f"{valor:{formato}}{sufixo}"
+
+        textos = {
+            "valor_custo": f"R$ {a.valor_custo:.2f}",
+            "valor_venda": f"R$ {a.valor_venda:.2f}",
+            "lucro_potencial": f"R$ {(centavos(a.valor_venda) - centavos(a.valor_custo)) / 100:.2f}",
+            "unidades": str(a.unidades),
+            "receita": f"R$ {a.receita:.2f}",
+            "margem_media": talvez(a.margem_media, ".1f", "%"),
+            "escoamento": talvez(a.escoamento, ".1f", "%"),
+            "giro": talvez(a.giro, ".2f", " vez(es) por ano"),
+            "cobertura": talvez(a.cobertura_dias, ".0f", " dias de venda"),
+            "encalhados": f"{a.encalhados} (R$ {a.valor_encalhado:.2f})",
+        }
+        for chave, texto in textos.items():
+            self.valores[chave].setText(texto)
+
+        com_preco = sum(produtos for _rotulo, produtos in a.faixas_margem) or 1
+        for barra, (_rotulo, produtos) in zip(self.barras_margem, a.faixas_margem):
+            barra.setValue(round(produtos * 100 / com_preco))
+            barra.setFormat(f"{produtos} ({produtos * 100 / com_preco:.1f}%)")
+        for (rotulo, barra), (_classe, produtos, receita, participacao) in zip(self.linhas_abc, a.curva_abc):
+            rotulo.setText(f"{produtos} produto(s) — R$ {receita:.2f}")
+            barra.setValue(round(participacao))
+            barra.setFormat(f"{participacao:.1f}%")
+        self.resumo_label.setText(f"📊 {a.produtos} mercadoria(s)" +
+                                  (f" — {a.dias} dia(s) de histórico de vendas" if a.dias else
+                                   " — nenhuma venda registrada"))
+
+    def encerrar(self):
+        self.atualizar_timer.stop()
+        if self.tarefa is not None:
+            self.tarefa.wait()
 
 
 # === APLICAÇÃO PRINCIPAL ===
 class CadastroMercadoriasApp(QWidget):
-    def __init__(self):
+    mercadoria_alterada = Signal(str, str)  # (id da mercadoria, tipo de mudança)
+
+    def __init__(self, db_manager):
         super().__init__()
-        self.setWindowTitle("📦💡EstoquePlus")
+        self.db_manager = db_manager
+        # Terminal de um servidor (python main.py --servidor URL): sem acesso ao arquivo do banco
+        self.remoto = isinstance(db_manager, cliente.ClienteEstoque)
+        self.setWindowTitle("📦💡EstoquePlus" + (f" — {db_manager.url}" if self.remoto else ""))
         self.load_window_geometry()
         self.dark_mode = False
+        # Toda gravação de venda, entrada, cadastro e exclusão passa pela fila do escritor
+        self.escritor = EscritorBanco(db_manager, escrita.DiarioOperacoes.do_banco(db_manager.db_name), self)
         self.initUI()
+        self.escritor.concluida.connect(self.operacao_concluida)
+        self.escritor.falhou.connect(self.operacao_falhou)
+        self.escritor.recuperadas.connect(self.operacoes_recuperadas)
+        self.escritor.start()
+        self.ouvinte = None
+        if self.remoto:
+            self.ouvinte = OuvinteEventos(db_manager, self)
+            self.ouvinte.mudanca.connect(self.mercadoria_alterada.emit)
+            self.ouvinte.recarregar.connect(self.listar_mercadorias)
+            self.ouvinte.recarregar.connect(self.reposicao.agendar)
+            self.ouvinte.recarregar.connect(self.painel_analise.agendar)
+            self.ouvinte.start()
         self.listar_mercadorias()
+        self.reposicao.atualizar()
+        self.iniciar_backup_automatico()
         print("✅ Sistema iniciado")
 
     def initUI(self):
@@ -311,21 +1515,47 @@ class CadastroMercadoriasApp(QWidget):
         self.menu_bar = QMenuBar(self)
         file_menu = self.menu_bar.addMenu("Arquivo")
 
+        importar_action = QAction("Importar CSV...", self)
+        importar_action.triggered.connect(self.importar_csv)
+        file_menu.addAction(importar_action)
+
         backup_action = QAction("Salvar Backup", self)
-        backup_action.triggered.connect(self.realizar_backup)
+        backup_action.triggered.connect(lambda: self.realizar_backup(automatico=False))
         file_menu.addAction(backup_action)
 
+        self.backup_automatico_action = QAction("Backup Automático", self)
+        self.backup_automatico_action.setCheckable(True)
+        self.backup_automatico_action.toggled.connect(self.alternar_backup_automatico)
+        file_menu.addAction(self.backup_automatico_action)
+
         exit_action = QAction("Sair", self)
         exit_action.triggered.connect(self.close)
         file_menu.addAction(exit_action)
 
+        relatorios_menu = self.menu_bar.addMenu("Relatórios")
+        pdf_action = QAction("Exportar Relatório PDF", self)
+        pdf_action.triggered.connect(self.exportar_relatorio_pdf)
+        relatorios_menu.addAction(pdf_action)
+        grafico_action = QAction("Gráfico de Lucro", self)
+        grafico_action.triggered.connect(self.gerar_grafico_lucro)
+        relatorios_menu.addAction(grafico_action)
+        relatorios_menu.addSeparator()
+        desempenho_action = QAction("Desempenho...", self)
+        desempenho_action.triggered.connect(self.abrir_desempenho)
+        relatorios_menu.addAction(desempenho_action)
+        self.desempenho_dialog = None
+        if self.remoto:
+            # Precisam do arquivo do banco: rodam no servidor (python -m estoqueplus ...)
+            for action in (importar_action, backup_action, self.backup_automatico_action, pdf_action,
+                           grafico_action):
+                action.setEnabled(False)
+
         theme_menu = self.menu_bar.addMenu("Tema")
         self.toggle_theme_action = QAction("🌙 Modo Escuro", self)
         self.toggle_theme_action.triggered.connect(self.toggle_theme)
         theme_menu.addAction(self.toggle_theme_action)
 
         main_layout = QVBoxLayout()
-        main_layout.setContentsMargins(10, 30, 10, 10)
 
         titulo = QLabel("🛒📈 Cadastro de Mercadorias 🛍️🔖🏷️💰")
         titulo.setFont(QFont("Arial", 18, QFont.Bold))
@@ -353,6 +1583,9 @@ class CadastroMercadoriasApp(QWidget):
         self.descricao_input = QLineEdit()
         self.descricao_input.setPlaceholderText("Descrição do Produto")
 
+        self.estoque_minimo_input = QLineEdit()
+        self.estoque_minimo_input.setPlaceholderText("Alerta de reposição (vazio mantém o atual, 0 desliga)")
+
         self.imagem_label = QLabel("Nenhuma imagem selecionada")
         self.imagem_label.setAlignment(Qt.AlignCenter)
         self.imagem_button = QPushButton("Selecionar Imagem")
@@ -364,6 +1597,7 @@ class CadastroMercadoriasApp(QWidget):
         form.addRow("Preço Venda (R$):", self.preco_venda_input)
         form.addRow("Qtd Comprada:", self.qtd_comprada_input)
         form.addRow("Descrição:", self.descricao_input)
+        form.addRow("Estoque Mínimo:", self.estoque_minimo_input)
         form.addRow("Imagem:", self.imagem_button)
 
         cadastro_group.setLayout(form)
@@ -376,18 +1610,78 @@ class CadastroMercadoriasApp(QWidget):
         # Campo de busca
         self.busca_input = QLineEdit()
         self.busca_input.setPlaceholderText("Buscar por Nome, ID ou Descrição...")
-        self.busca_input.textChanged.connect(self.listar_mercadorias)
-        main_layout.addWidget(self.busca_input)
+        # Debounce: a busca só roda quando o usuário para de digitar
+        self.busca_timer = QTimer(self)
+        self.busca_timer.setSingleShot(True)
+        self.busca_timer.setInterval(250)
+        self.busca_timer.timeout.connect(self.listar_mercadorias)
+        self.busca_input.textChanged.connect(lambda _texto: self.busca_timer.start())
+
+        # Ordenação da listagem; a busca mostra os resultados por relevância
+        self.ordem_combo = QComboBox()
+        for chave, rotulo in MercadoriasModel.ORDENACOES:
+            self.ordem_combo.addItem(rotulo, chave)
+        ordem = QSettings("MinhaEmpresa", "ControleStock").value("ordem_lista", "nome")
+        self.ordem_combo.setCurrentIndex(max(0, self.ordem_combo.findData(ordem)))
+        self.ordem_combo.currentIndexChanged.connect(self.mudar_ordem)
+
+        busca_layout = QHBoxLayout()
+        busca_layout.addWidget(self.busca_input, 1)
+        busca_layout.addWidget(QLabel("Ordenar por:"))
+        busca_layout.addWidget(self.ordem_combo)
+        main_layout.addLayout(busca_layout)
 
         listar_button = QPushButton("Listar Mercadorias")
         listar_button.clicked.connect(self.listar_mercadorias)
         main_layout.addWidget(listar_button)
 
-        self.lista_widget = QListWidget()
-        self.lista_widget.itemClicked.connect(self.exibir_detalhes_produto)
-        main_layout.addWidget(self.lista_widget)
-
-        self.setLayout(main_layout)
+        # Lista virtualizada: só as linhas visíveis são pintadas e o banco é lido em lotes
+        self.mercadorias_model = MercadoriasModel(self.db_manager, self)
+        self.mercadoria_alterada.connect(self.mercadorias_model.aplicar_mudanca)
+        self.mercadorias_delegate = MercadoriaDelegate(self)
+        self.mercadorias_delegate.venda_solicitada.connect(
+            lambda mercadoria, campo: self.registrar_venda(mercadoria.id, campo))
+
+        self.lista_view = QListView()
+        self.lista_view.setModel(self.mercadorias_model)
+        self.lista_view.setItemDelegate(self.mercadorias_delegate)
+        self.lista_view.setUniformItemSizes(True)
+        self.lista_view.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.lista_view.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.lista_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.lista_view.setMouseTracking(True)
+        self.lista_view.entered.connect(self.abrir_editor_venda)
+        self.lista_view.clicked.connect(self.exibir_detalhes_produto)
+        self.mercadorias_model.modelAboutToBeReset.connect(self.fechar_editor_venda)
+        self.editor_venda_index = QPersistentModelIndex()
+        main_layout.addWidget(self.lista_view)
+
+        estoque_tab = QWidget()
+        estoque_tab.setLayout(main_layout)
+
+        # Modo caixa: itens lidos pelo índice em memória, venda gravada numa única operação
+        self.indice_caixa = IndiceCaixa(self.mercadorias_model.repositorio)
+        self.mercadoria_alterada.connect(lambda id_p, _tipo: self.indice_caixa.invalidar(id_p))
+        self.caixa = CaixaWidget(self.indice_caixa, self.escritor)
+        self.caixa.itens_vendidos.connect(self.vendas_do_caixa_enviadas)
+
+        # Reposição: relida (em segundo plano) depois de cada mudança gravada
+        self.reposicao = ReposicaoWidget(self.db_manager)
+        self.reposicao.alertas_mudaram.connect(self.mostrar_quantidade_alertas)
+        self.reposicao.mercadoria_escolhida.connect(self.abrir_detalhes)
+        self.mercadoria_alterada.connect(lambda _id, _tipo: self.reposicao.agendar())
+        self.painel_analise = AnaliseWidget(self.db_manager)
+        self.mercadoria_alterada.connect(lambda _id, _tipo: self.painel_analise.agendar())
+
+        self.abas = QTabWidget()
+        self.abas.addTab(estoque_tab, "📦 Estoque")
+        self.abas.addTab(self.caixa, "🛒 Caixa")
+        self.abas.addTab(self.reposicao, "⚠️ Repor Estoque")
+        self.abas.addTab(self.painel_analise, "📊 Análise")
+        janela_layout = QVBoxLayout()
+        janela_layout.setContentsMargins(10, 30, 10, 10)
+        janela_layout.addWidget(self.abas)
+        self.setLayout(janela_layout)
 
     def load_window_geometry(self):
         settings = QSettings("MinhaEmpresa", "ControleStock")
@@ -403,6 +1697,13 @@ class CadastroMercadoriasApp(QWidget):
 
     def closeEvent(self, event):
         self.save_window_geometry()
+        # Grava o que ainda está na fila antes de fechar
+        self.escritor.encerrar()
+        self.caixa.encerrar()
+        self.reposicao.encerrar()
+        self.painel_analise.encerrar()
+        if self.ouvinte is not None:
+            self.ouvinte.encerrar()
         super().closeEvent(event)
 
     def center_window(self):
@@ -430,7 +1731,7 @@ class CadastroMercadoriasApp(QWidget):
                                                   "", "Imagens (*.png *.jpg *.jpeg)")
         if file_path:
             self.imagem_path = file_path
-            pixmap = QPixmap(file_path).scaled(125, 125, Qt.AspectRatioMode.IgnoreAspectRatio)
+            pixmap = CacheMiniaturas.instancia().obter_sincrono(file_path, 125)
             self.imagem_label.setPixmap(pixmap)
 
     def cadastrar_mercadoria(self):
@@ -442,53 +1743,24 @@ class CadastroMercadoriasApp(QWidget):
             pc = float(self.preco_compra_input.text())
             pv = float(self.preco_venda_input.text())
             qc = int(self.qtd_comprada_input.text())
+            texto_minimo = self.estoque_minimo_input.text().strip()
+            estoque_minimo = int(texto_minimo) if texto_minimo else None
         except ValueError:
             QMessageBox.warning(self, "Erro", "Valores numéricos inválidos.")
             return
 
-        if not all([id_p, nome, desc, hasattr(self, 'imagem_path'), pc > 0, pv > 0, qc >= 0]):
+        # A imagem só é obrigatória no primeiro cadastro; atualizar sem escolher outra mantém a atual
+        tem_imagem = hasattr(self, 'imagem_path')
+        if not all([id_p, nome, desc, pc > 0, pv > 0, qc >= 0, (estoque_minimo or 0) >= 0]) or \
+                (not tem_imagem and not self.mercadorias_model.repositorio.existe(id_p)):
             QMessageBox.warning(self, "Erro", "Preencha todos os campos corretamente!")
             return
 
-        destino_dir = "imagens"
-        if not os.path.exists(destino_dir):
-            os.makedirs(destino_dir)
-
-        ext = os.path.splitext(self.imagem_path)[1]
-        novo_nome = f"{id_p}_{nome}{ext}"
-        destino = os.path.join(destino_dir, novo_nome)
-        shutil.copy(self.imagem_path, destino)
-
-        vtc = pc * qc
-        vtv = pv * qc  # Por enquanto, sem venda registrada
-
-        conn = sqlite3.connect("stock_control.db")
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT qtd_comprada FROM mercadorias WHERE id = ?', (id_p,))
-        resultado = cursor.fetchone()
-
-        if resultado:
-            qc_atual = resultado[0]
-            novo_qc = qc_atual + qc
-            novo_vtc = pc * novo_qc
-            cursor.execute('''
-                UPDATE mercadorias 
-                SET nome = ?, preco_compra = ?, preco_venda = ?, qtd_comprada = ?, descricao = ?, 
-                    valor_total_compra = ?, imagem_path = ?
-                WHERE id = ?
-            ''', (nome, pc, pv, novo_qc, desc, novo_vtc, destino, id_p))
-            QMessageBox.information(self, "Atualizado", f"Estoque de '{nome}' atualizado com {qc} unidades adicionais.")
-        else:
-            cursor.execute('''
-                INSERT INTO mercadorias VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?, ?)
-            ''', (id_p, nome, pc, pv, qc, desc, vtc, vtv, destino))
-            QMessageBox.information(self, "Cadastrado", f"Mercadoria '{nome}' cadastrada com sucesso.")
-
-        conn.commit()
-        conn.close()
+        # A imagem é guardada no armazém pela thread de escrita, junto com o cadastro
+        self.escritor.enviar(escrita.CADASTRO, id=id_p, nome=nome, preco_compra=pc, preco_venda=pv,
+                             quantidade=qc, descricao=desc, estoque_minimo=estoque_minimo,
+                             imagem=os.path.abspath(self.imagem_path) if tem_imagem else None)
         self.limpar_campos()
-        self.listar_mercadorias()
 
     def limpar_campos(self):
         self.id_input.clear()
@@ -497,60 +1769,34 @@ class CadastroMercadoriasApp(QWidget):
         self.preco_venda_input.clear()
         self.qtd_comprada_input.clear()
         self.descricao_input.clear()
+        self.estoque_minimo_input.clear()
         self.imagem_label.setText("Nenhuma imagem selecionada")
         if hasattr(self, 'imagem_path'):
             del self.imagem_path
 
     def listar_mercadorias(self):
-        self.lista_widget.clear()
-        conn = sqlite3.connect("stock_control.db")
-        cursor = conn.cursor()
-        termo_busca = self.busca_input.text().lower()
-
-        cursor.execute('SELECT * FROM mercadorias')
-        for row in cursor.fetchall():
-            id_p, nome, pc, pv, qc, qs, desc, vtc, vtv, img = row
-
-            if termo_busca and termo_busca not in id_p.lower() and termo_busca not in nome.lower() and termo_busca not in desc.lower():
-                continue
+        self.busca_timer.stop()
+        with desempenho.medir(desempenho.TELA, "listar mercadorias"):
+            self.mercadorias_model.carregar(self.busca_input.text(), self.ordem_combo.currentData())
 
-            item = QListWidgetItem()
-            widget = QWidget()
-            layout = QHBoxLayout()
-
-            label_img = QLabel()
-            pixmap = QPixmap(img).scaled(100, 100, Qt.AspectRatioMode.IgnoreAspectRatio)
-            label_img.setPixmap(pixmap)
-
-            right_layout = QVBoxLayout()
-            info = QLabel(f"<b>ID:</b> {id_p}<br><b>{nome}</b><br>{desc[:30]}...<br>"
-                           f"Comprada: {qc} | Vendida: {qs}<br>"
-                           f"Restante: {qc - qs}<br>"
-                           f"Lucro Estimado: R${(pv - pc) * qs:.2f}")
-
-            right_layout.addWidget(info)
-
-            qtd_saida_input = QLineEdit()
-            qtd_saida_input.setPlaceholderText("Qtd Vendida")
-            qtd_saida_input.setMaximumWidth(100)
-
-            btn_vender = QPushButton("Registrar Venda")
-            btn_vender.clicked.connect(lambda _, i=id_p, q=qtd_saida_input, c=pc, p=pv: self.registrar_venda(i, q, c, p))
-
-            right_layout.addWidget(qtd_saida_input)
-            right_layout.addWidget(btn_vender)
+    def mudar_ordem(self, _indice):
+        QSettings("MinhaEmpresa", "ControleStock").setValue("ordem_lista", self.ordem_combo.currentData())
+        self.listar_mercadorias()
 
-            layout.addWidget(label_img)
-            layout.addLayout(right_layout)
-            widget.setLayout(layout)
-            item.setSizeHint(widget.sizeHint())
+    def abrir_editor_venda(self, index):
+        # Um único editor de venda vivo por vez, na linha sob o mouse
+        if index == self.editor_venda_index:
+            return
+        self.fechar_editor_venda()
+        self.editor_venda_index = QPersistentModelIndex(index)
+        self.lista_view.openPersistentEditor(index)
 
-            item.setData(Qt.UserRole, row)
-            self.lista_widget.addItem(item)
-            self.lista_widget.setItemWidget(item, widget)
-        conn.close()
+    def fechar_editor_venda(self):
+        if self.editor_venda_index.isValid():
+            self.lista_view.closePersistentEditor(QModelIndex(self.editor_venda_index))
+        self.editor_venda_index = QPersistentModelIndex()
 
-    def registrar_venda(self, id_p, qtd_saida_input, preco_compra, preco_venda):
+    def registrar_venda(self, id_p, qtd_saida_input):
         try:
             nova_saida = int(qtd_saida_input.text())
             if nova_saida <= 0:
@@ -559,113 +1805,298 @@ class CadastroMercadoriasApp(QWidget):
             QMessageBox.warning(self, "Erro", "Digite uma quantidade válida maior que zero.")
             return
 
-        conn = sqlite3.connect("stock_control.db")
-        cursor = conn.cursor()
-        cursor.execute('SELECT qtd_comprada, qtd_saida FROM mercadorias WHERE id = ?', (id_p,))
-        qc_atual, qs_atual = cursor.fetchone()
-        conn.close()
-
-        if qc_atual < qs_atual + nova_saida:
+        # Conferência otimista pela linha carregada; a thread de escrita confere de novo no banco
+        mercadoria = self.mercadorias_model.mercadoria(id_p)
+        if mercadoria is not None and nova_saida > mercadoria.restante:
             QMessageBox.warning(self, "Erro", "Quantidade vendida excede estoque disponível.")
             return
+        self.escritor.enviar(escrita.VENDA, id=id_p, quantidade=nova_saida)
+        self.mercadorias_model.ajustar(id_p, qtd_saida=nova_saida)
+        qtd_saida_input.clear()
+
+    def vendas_do_caixa_enviadas(self, itens):
+        for id_p, quantidade in itens:
+            self.mercadorias_model.ajustar(id_p, qtd_saida=quantidade)
+
+    # === RESULTADOS DA FILA DE ESCRITA ===
+    def operacao_concluida(self, operacao, resultado):
+        d = operacao.dados
+        if operacao.tipo == escrita.CAIXA:
+            # Sem diálogo: o caixa mostra a confirmação na linha de status
+            for id_p, _quantidade in d["itens"]:
+                self.mercadoria_alterada.emit(id_p, MUDANCA_ATUALIZADA)
+            self.caixa.venda_gravada(operacao)
+        elif operacao.tipo == escrita.VENDA:
+            QMessageBox.information(self, "Sucesso", "Venda registrada com sucesso!")
+            self.mercadoria_alterada.emit(d["id"], MUDANCA_ATUALIZADA)
+        elif operacao.tipo == escrita.ENTRADA:
+            QMessageBox.information(self, "Sucesso", f"{d['quantidade']} unidades adicionadas ao estoque.")
+            self.mercadoria_alterada.emit(d["id"], MUDANCA_ATUALIZADA)
+        elif operacao.tipo == escrita.CADASTRO:
+            if resultado:
+                QMessageBox.information(self, "Atualizado",
+                                        f"Estoque de '{d['nome']}' atualizado com {d['quantidade']} unidades adicionais.")
+                self.mercadoria_alterada.emit(d["id"], MUDANCA_ATUALIZADA)
+            else:
+                QMessageBox.information(self, "Cadastrado", f"Mercadoria '{d['nome']}' cadastrada com sucesso.")
+                self.mercadoria_alterada.emit(d["id"], MUDANCA_INSERIDA)
+        elif operacao.tipo == escrita.EXCLUSAO:
+            QMessageBox.information(self, "Exclusão", "Produto excluído com sucesso.")
 
-        nova_qs = qs_atual + nova_saida
-        valor_total_venda = preco_venda * nova_saida
-
-        conn = sqlite3.connect("stock_control.db")
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE mercadorias
-            SET qtd_saida = ?, valor_total_venda = ?
-            WHERE id = ?
-        ''', (nova_qs, valor_total_venda, id_p))
-        conn.commit()
-        conn.close()
-        QMessageBox.information(self, "Sucesso", "Venda registrada com sucesso!")
+    def operacoes_recuperadas(self, gravadas, recusadas):
+        texto = f"{gravadas} operação(ões) pendente(s) da última sessão foram gravadas."
+        if recusadas:
+            texto += f"\n{recusadas} foram recusadas (estoque insuficiente ou produto inexistente)."
+        QMessageBox.information(self, "Operações pendentes", texto)
         self.listar_mercadorias()
+        self.reposicao.agendar()
+        self.painel_analise.agendar()
+
+    def operacao_falhou(self, operacao, erro):
+        d = operacao.dados
+        if operacao.tipo == escrita.CAIXA:
+            for id_p, _quantidade in d["itens"]:
+                self.mercadoria_alterada.emit(id_p, MUDANCA_ATUALIZADA)
+            if isinstance(erro, EstoqueInsuficienteError):
+                mensagem = f"estoque insuficiente do produto '{erro}'."
+            elif isinstance(erro, ProdutoNaoEncontradoError):
+                mensagem = f"produto '{erro}' não encontrado."
+            else:
+                mensagem = str(erro)
+            self.caixa.venda_recusada(operacao, mensagem)
+            return
+        if isinstance(erro, EstoqueInsuficienteError):
+            mensagem = "Quantidade vendida excede estoque disponível."
+        elif isinstance(erro, ProdutoNaoEncontradoError):
+            mensagem = "Produto não encontrado."
+        elif operacao.tipo == escrita.CADASTRO and isinstance(erro, OSError):
+            mensagem = f"Não foi possível guardar a imagem: {erro}"
+        else:
+            mensagem = f"Não foi possível gravar ({operacao.tipo}): {erro}"
+        # Desfaz a atualização otimista relendo a linha do banco
+        if operacao.tipo == escrita.EXCLUSAO:
+            self.mercadoria_alterada.emit(d["id"], MUDANCA_INSERIDA)
+        else:
+            self.mercadoria_alterada.emit(d["id"], MUDANCA_ATUALIZADA)
+        QMessageBox.warning(self, "Erro", mensagem)
+
+    def exibir_detalhes_produto(self, index):
+        selecionada = index.data(Qt.UserRole)
+        if selecionada:
+            self.abrir_detalhes(selecionada.id)
+
+    def abrir_detalhes(self, id_p):
+        with desempenho.medir(desempenho.DIALOGO, "abrir detalhes do produto"):
+            # A lista só carrega o que pinta; o diálogo precisa do registro completo
+            mercadoria = self.mercadorias_model.repositorio.obter(id_p)
+            if mercadoria is None:
+                QMessageBox.warning(self, "Erro", "Produto não encontrado.")
+                return
+            dialog = DetalhesProdutoDialog(mercadoria, self)
+        dialog.exec_()
+
+    def mostrar_quantidade_alertas(self, quantidade):
+        indice = self.abas.indexOf(self.reposicao)
+        self.abas.setTabText(indice, "⚠️ Repor Estoque" + (f" ({quantidade})" if quantidade else ""))
+
+    def executar_com_progresso(self, titulo, texto, funcao, ao_concluir):
+        # Roda funcao(progresso, cancelar) numa TarefaEmSegundoPlano com diálogo de progresso cancelável
+        dialogo = QProgressDialog(texto, "Cancelar", 0, 100, self)
+        dialogo.setWindowTitle(titulo)
+        dialogo.setWindowModality(Qt.WindowModal)
+        dialogo.setMinimumDuration(0)
+
+        tarefa = TarefaEmSegundoPlano(self.db_manager, funcao, self, nome=titulo)
+        tarefa.progresso.connect(dialogo.setValue)
+        dialogo.canceled.connect(tarefa.cancelar)
+
+        def concluida(resultado):
+            dialogo.reset()
+            ao_concluir(resultado)
+
+        def falhou(erro):
+            dialogo.reset()
+            QMessageBox.warning(self, "Erro", f"{titulo}: {erro}")
+
+        tarefa.concluida.connect(concluida)
+        tarefa.falhou.connect(falhou)
+        tarefa.finished.connect(tarefa.deleteLater)
+        tarefa.start()
+        return tarefa
+
+    def importar_csv(self):
+        from estoqueplus.importacao import importar_csv
+
+        caminho, _ = QFileDialog.getOpenFileName(self, "Importar CSV", "", "Planilhas CSV (*.csv)")
+        if not caminho:
+            return
 
-    def exibir_detalhes_produto(self, item):
-        dados = item.data(Qt.UserRole)
-        if dados:
-            id_p, nome, pc, pv, qc, qs, desc, vtc, vtv, img = dados
-            dialog = DetalhesProdutoDialog(id_p, nome, pc, pv, qc, qs, desc, vtc, vtv, img, self)
-            dialog.exec_()
+        def concluida(resultado):
+            if resultado is None or resultado.cancelada:
+                QMessageBox.information(self, "Importar CSV", "Importação cancelada. Nenhuma alteração foi gravada.")
+                return
             self.listar_mercadorias()
+            self.reposicao.agendar()
+            self.painel_analise.agendar()
+            mensagem = (f"{resultado.mercadorias} mercadorias cadastradas/atualizadas, "
+                        f"{resultado.entradas} entradas de estoque, {resultado.rejeitadas} linhas rejeitadas.")
+            if resultado.erros:
+                mensagem += "\n\n" + "\n".join(resultado.erros[:10])
+            QMessageBox.information(self, "Importar CSV", mensagem)
+
+        self.executar_com_progresso(
+            "Importar CSV", "Importando mercadorias...",
+            lambda progresso, cancelar: importar_csv(self.db_manager, caminho,
+                                                     progresso=progresso, cancelar=cancelar),
+            concluida)
+
+    def iniciar_backup_automatico(self):
+        # Confere periodicamente se o último backup já venceu; o backup em si roda em segundo plano
+        settings = QSettings("MinhaEmpresa", "ControleStock")
+        self.backup_intervalo_horas = float(settings.value("backup_intervalo_horas", 24))
+        self.backup_em_andamento = False
+        self.backup_timer = QTimer(self)
+        self.backup_timer.setInterval(30 * 60 * 1000)
+        self.backup_timer.timeout.connect(self.verificar_backup_automatico)
+        ativo = settings.value("backup_automatico", True, type=bool)
+        self.backup_automatico_action.setChecked(ativo)
+        if ativo:
+            QTimer.singleShot(60 * 1000, self.verificar_backup_automatico)
+
+    def alternar_backup_automatico(self, ativo):
+        QSettings("MinhaEmpresa", "ControleStock").setValue("backup_automatico", ativo)
+        if ativo:
+            self.backup_timer.start()
+        else:
+            self.backup_timer.stop()
 
-    def realizar_backup(self):
-        if not os.path.exists('backups'):
-            os.makedirs('backups')
-        timestamp = time.strftime("%Y%m%d_%H%M")
-        shutil.copy('stock_control.db', f'backups/backup_{timestamp}.db')
-        print(f"💾 Backup realizado: backup_{timestamp}.db")
+    def verificar_backup_automatico(self):
+        if self.remoto:
+            return
+        if self.backup_automatico_action.isChecked() and backup.backup_vencido(self.backup_intervalo_horas):
+            self.realizar_backup(automatico=True)
+
+    def realizar_backup(self, automatico=False):
+        if self.backup_em_andamento:
+            return
+        self.backup_em_andamento = True
+        tarefa = TarefaEmSegundoPlano(
+            self.db_manager,
+            lambda progresso, cancelar: backup.realizar_backup(self.db_manager.db_name,
+                                                               progresso=progresso, cancelar=cancelar),
+            self, nome="Backup")
+
+        def concluida(resultado):
+            self.backup_em_andamento = False
+            print(f"💾 Backup realizado: {os.path.basename(resultado.caminho)}")
+            if not automatico:
+                QMessageBox.information(self, "Backup", f"Backup salvo em {resultado.caminho}")
+
+        def falhou(erro):
+            self.backup_em_andamento = False
+            print(f"⚠️ Falha no backup: {erro}")
+            if not automatico:
+                QMessageBox.warning(self, "Erro", f"Falha no backup: {erro}")
+
+        tarefa.concluida.connect(concluida)
+        tarefa.falhou.connect(falhou)
+        tarefa.finished.connect(tarefa.deleteLater)
+        tarefa.start()
 
     def exportar_relatorio_pdf(self):
-        from reportlab.pdfgen import canvas
-        pdf_path = "reports/relatorio_estoque.pdf"
-        c = canvas.Canvas(pdf_path)
-        c.drawString(50, 800, "Relatório de Estoque - Controle Stock")
-        c.drawString(50, 780, "Data: " + datetime.now().strftime("%d/%m/%Y %H:%M"))
-        c.line(50, 770, 550, 770)
-        y = 750
-        conn = sqlite3.connect("stock_control.db")
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM mercadorias')
-        for row in cursor.fetchall():
-            id_p, nome, pc, pv, qc, qs, desc, vtc, vtv, img = row
-            texto = f"{nome} - ID: {id_p} - Comprada: {qc}, Vendida: {qs}, Lucro: R${(pv - pc) * qs:.2f}"
-            c.drawString(50, y, texto)
-            y -= 20
-        conn.close()
-        c.save()
-        QMessageBox.information(self, "PDF Exportado", "Relatório salvo como PDF")
-        print("📄 Relatório exportado como PDF")
+        from estoqueplus.relatorios import gerar_relatorio_pdf
+
+        def concluido(caminho):
+            if caminho is None:
+                return
+            QMessageBox.information(self, "PDF Exportado", f"Relatório salvo em {caminho}")
+            print("📄 Relatório exportado como PDF")
+
+        self.executar_com_progresso(
+            "Relatório PDF", "Gerando relatório de estoque...",
+            lambda progresso, cancelar: gerar_relatorio_pdf(self.db_manager,
+                                                            progresso=progresso, cancelar=cancelar),
+            concluido)
 
     def gerar_grafico_lucro(self):
-        conn = sqlite3.connect("stock_control.db")
-        cursor = conn.cursor()
-        cursor.execute('SELECT nome, (preco_venda - preco_compra) * qtd_saida AS lucro FROM mercadorias')
-        dados = cursor.fetchall()
-        conn.close()
-
-        nomes = [row[0] for row in dados]
-        lucros = [row[1] for row in dados]
-
-        plt.figure(figsize=(10, 5))
-        plt.bar(nomes, lucros, color='skyblue')
-        plt.title("Lucro por Produto")
-        plt.xlabel("Produtos")
-        plt.ylabel("Lucro (R$)")
-        plt.xticks(rotation=45, ha='right')
-        plt.tight_layout()
-        plt.savefig("reports/grafico_lucro.png")
-        plt.close()
-        QMessageBox.information(self, "Gráfico", "Gráfico de lucro salvo.")
+        from estoqueplus.graficos import grafico_em_cache, gerar_grafico_lucro
+
+        # Banco sem mudanças desde a última vez: o PNG já pronto abre na hora
+        caminho = grafico_em_cache(self.db_manager)
+        if caminho:
+            self.mostrar_grafico(caminho)
+            return
+
+        def concluido(caminho):
+            if caminho is not None:
+                self.mostrar_grafico(caminho)
+
+        self.executar_com_progresso(
+            "Gráfico de Lucro", "Gerando gráfico de lucro...",
+            lambda progresso, cancelar: gerar_grafico_lucro(self.db_manager,
+                                                            progresso=progresso, cancelar=cancelar),
+            concluido)
+
+    def mostrar_grafico(self, caminho):
+        with desempenho.medir(desempenho.DIALOGO, "abrir gráfico de lucro"):
+            dialogo = GraficoLucroDialog(caminho, self)
+        dialogo.exec_()
+
+    def abrir_desempenho(self):
+        if self.desempenho_dialog is None:
+            self.desempenho_dialog = DesempenhoDialog(self.db_manager, self)
+            self.desempenho_dialog.medicao_alternada.connect(lambda _ativo: self.escritor.reabrir_conexao())
+        self.desempenho_dialog.show()
+        self.desempenho_dialog.raise_()
 
 
 # === EXECUÇÃO PRINCIPAL ===
 if __name__ == '__main__':
+    medidor = MedidorInicio("--medir-inicio" in sys.argv or os.environ.get("ESTOQUEPLUS_MEDIR_INICIO") == "1")
+    medidor.marcar("imports", agora=_FIM_IMPORTS)
     app = QApplication(sys.argv)
+    medidor.marcar("QApplication criada")
 
     # Definindo o ícone da janela para "janela.ico"
     app.setWindowIcon(QIcon("imagens/janela.ico"))
 
-    db_manager = DatabaseManager()
-
-    conn = sqlite3.connect(db_manager.db_name)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users LIMIT 1")
-    has_user = cursor.fetchone()
-    conn.close()
-
-    if not has_user:
+    # ESTOQUEPLUS_DESEMPENHO=1 ou --desempenho: instrumentação ligada desde a primeira conexão
+    desempenho.ativar_pelo_ambiente(forcar="--desempenho" in sys.argv)
+    # --servidor URL (ou ESTOQUEPLUS_SERVIDOR): terminal de um "python -m estoqueplus servir"
+    servidor = os.environ.get("ESTOQUEPLUS_SERVIDOR")
+    if "--servidor" in sys.argv[:-1]:
+        servidor = sys.argv[sys.argv.index("--servidor") + 1]
+    if servidor:
+        db_manager = cliente.ClienteEstoque(servidor, os.environ.get("ESTOQUEPLUS_TOKEN"))
+        try:
+            db_manager.has_user()
+        except OSError as e:
+            QMessageBox.critical(None, "Servidor", f"Não foi possível conectar ao servidor:\n{e}")
+            sys.exit(1)
+    else:
+        db_manager = DatabaseManager()
+        # Imagens do formato antigo vão para o armazém por hash (uma vez); depois, órfãs pendentes
+        migrar_imagens(db_manager)
+        coletar_orfas(db_manager)
+    medidor.marcar("banco pronto")
+
+    if not db_manager.has_user():
         create_dialog = CreateUserDialog(db_manager)
+        medidor.marcar_primeira_pintura(create_dialog, "janela de criar usuário pintada")
         if create_dialog.exec() != QDialog.Accepted:
             sys.exit()
 
     login_dialog = LoginDialog(db_manager)
+    medidor.marcar_primeira_pintura(login_dialog, "janela de login pintada")
     if login_dialog.exec() != QDialog.Accepted:
         sys.exit()
 
-    window = CadastroMercadoriasApp()
+    # A partir daqui o tempo conta do login aceito, sem a digitação do usuário
+    depois_login = time.perf_counter()
+    window = CadastroMercadoriasApp(db_manager)
+    medidor.marcar("janela principal criada (após login)", desde=depois_login)
+    medidor.marcar_primeira_pintura(window, "janela principal pintada (após login)", desde=depois_login)
     window.show()
-    sys.exit(app.exec())
+    codigo = app.exec()
+    db_manager.fechar()
+    sys.exit(codigo)